@@ -35,7 +35,7 @@ from seisflows import logger
 from seisflows.optimize.gradient import Gradient
 from seisflows.tools import unix
 from seisflows.tools.msg import DEG
-from seisflows.tools.math import angle
+from seisflows.tools.math import angle, inner_products
 from seisflows.plugins import line_search as line_search_dir
 
 
@@ -55,6 +55,20 @@ class LBFGS(Gradient):
     :type lbfgs_thresh: L-BFGS angle restart threshold. If the angle between
         the current and previous search direction exceeds this value,
         optimization algorithm will be restarted.
+    :type lbfgs_compact: bool
+    :param lbfgs_compact: compute search directions with the compact
+        representation of the L-BFGS inverse Hessian (Byrd et al. 1994), which
+        reads the stored history in a few blocked matrix products rather than
+        one vector at a time. Gives the same search direction as the default
+        two-loop recursion, and is faster for large models. Requires a
+        diagonal (or no) preconditioner
+    :type lbfgs_curvature_check: bool
+    :param lbfgs_curvature_check: skip, rather than store, new model and
+        gradient difference pairs (s, y) that violate the curvature condition
+        y.s > 0, keeping the previously stored history. Required for
+        mini-batch inversions (workflow `batch_size`), where consecutive
+        gradients are computed from different sources, and is set
+        automatically by the workflow in that case
 
     Paths
     -----
@@ -63,7 +77,7 @@ class LBFGS(Gradient):
     __doc__ = Gradient.__doc__ + __doc__
 
     def __init__(self, lbfgs_mem=3, lbfgs_max=np.inf, lbfgs_thresh=0.,
-                 **kwargs):
+                 lbfgs_compact=False, lbfgs_curvature_check=False, **kwargs):
         """Instantiate L-BFGS specific parameters"""
         super().__init__(**kwargs)
 
@@ -81,15 +95,22 @@ class LBFGS(Gradient):
         self.LBFGS_mem = lbfgs_mem
         self.LBFGS_max = lbfgs_max
         self.LBFGS_thresh = lbfgs_thresh
+        self.LBFGS_compact = lbfgs_compact
+        self.LBFGS_curvature_check = lbfgs_curvature_check
 
         # Set new L-BFGS dependent paths for storing previous gradients
         self.path["_LBFGS"] = os.path.join(self.path.scratch, "LBFGS")
         self.path["_y_file"] = os.path.join(self.path["_LBFGS"], "Y.dat")
         self.path["_s_file"] = os.path.join(self.path["_LBFGS"], "S.dat")
+        # Per-pair inner products [y.s, y.y], fixed once a pair is stored
+        self.path["_dot_file"] = os.path.join(self.path["_LBFGS"], "DOTS.npy")
 
         # Internally used memory parameters for the L-BFGS optimization algo.
+        # `_memory_head` is the row of the history memmaps holding the most
+        # recent (s, y) pair, which are stored as a ring buffer
         self._LBFGS_iter = 0
         self._memory_used = 0
+        self._memory_head = 0
 
     def setup(self):
         """
@@ -106,6 +127,7 @@ class LBFGS(Gradient):
         checkpoint_dict = dict(np.load(self.path._checkpoint))
         checkpoint_dict["LBFGS_iter"] = self._LBFGS_iter
         checkpoint_dict["memory_used"] = self._memory_used
+        checkpoint_dict["memory_head"] = self._memory_head
 
         np.savez(file=self.path._checkpoint, **checkpoint_dict)  # NOQA
 
@@ -127,6 +149,18 @@ class LBFGS(Gradient):
             dict_in = np.load(file=fid)
             self._LBFGS_iter = int(dict_in["LBFGS_iter"])
             self._memory_used = int(dict_in["memory_used"])
+            self._memory_head = int(dict_in.get("memory_head", 0))
+
+            # Checkpoints written before the ring buffer layout of the
+            # history have no head, and their history files (one column per
+            # iterate) cannot be read as rows, so the history is discarded
+            if self._memory_used and ("memory_head" not in dict_in or
+                                      not os.path.exists(self.path._dot_file)):
+                logger.warning("L-BFGS history was stored in a previous "
+                               "layout and cannot be re-used, resetting "
+                               "L-BFGS memory")
+                self._memory_used = 0
+                self._memory_head = 0
 
     def compute_direction(self):
         """
@@ -154,11 +188,10 @@ class LBFGS(Gradient):
         # Load the current gradient direction, which is the L-BFGS search
         # direction if this is the first iteration
         g = self.load_vector("g_new")
-        p_new = g.copy()
 
         if self._LBFGS_iter == 1:
             logger.info("first L-BFGS iteration, default to 'Gradient' descent")
-            p_new.update(vector=-1 * g.vector)
+            p_new = g.scale_(-1)
             restarted = False
         # Restart condition or first iteration lead to setting search direction
         # as the inverse gradient (i.e., default to steepest descent)
@@ -166,7 +199,7 @@ class LBFGS(Gradient):
             logger.info("restarting L-BFGS due to periodic restart condition. "
                         "setting search direction as inverse gradient")
             self.restart()
-            p_new.update(vector=-1 * g.vector)
+            p_new = g.scale_(-1)
             restarted = True
         # Normal LBFGS direction computation
         else:
@@ -174,21 +207,33 @@ class LBFGS(Gradient):
             # 'q' becomes the new search direction 'g'
             logger.info("applying inverse Hessian to gradient")
             s, y = self._update_search_history()
-            q = g.copy()
-            q.update(vector=self._apply_inverse_hessian(g.vector, s, y))
-
-            # Determine if the new search direction is appropriate by checking
-            # its angle to the previous search direction
-            if self._check_status(g.vector, q.vector):
-                logger.info("new L-BFGS search direction found")
-                p_new.update(vector=-1 * q.vector)
+            # No history stored yet, i.e., first pair failed curvature check
+            if s is None:
+                logger.info("no L-BFGS history available, setting search "
+                            "direction as inverse gradient")
+                p_new = g.scale_(-1)
                 restarted = False
             else:
-                logger.info("new search direction not appropriate, defaulting "
-                            "to gradient desceitn")
-                self.restart()
-                p_new.update(vector=-1 * g.vector)
-                restarted = True
+                if self.LBFGS_compact:
+                    q = self._apply_inverse_hessian_compact(g.vector, s, y)
+                else:
+                    q = self._apply_inverse_hessian(g.vector, s, y)
+
+                # Determine if the new search direction is appropriate by
+                # checking its angle to the previous search direction
+                if self._check_status(g.vector, q):
+                    logger.info("new L-BFGS search direction found")
+                    # Shallow copy: gradient data are replaced, never copied
+                    p_new = g.copy(deep=False)
+                    p_new.update(vector=q)
+                    p_new.scale_(-1)
+                    restarted = False
+                else:
+                    logger.info("new search direction not appropriate, "
+                                "defaulting to gradient desceitn")
+                    self.restart()
+                    p_new = g.scale_(-1)
+                    restarted = True
 
         # Assign restart condition to internal memory
         self._restarted = restarted
@@ -203,22 +248,18 @@ class LBFGS(Gradient):
         logger.info("restarting L-BFGS optimization algorithm")
 
         # Fall back to gradient descent for search direction
-        g = self.load_vector("g_new")
-        p_new = g.copy()
-        p_new.update(vector=-1 * g.vector)
+        p_new = self.load_vector("g_new")
+        p_new.scale_(-1)
         self.save_vector("p_new", p_new)
 
         # Clear internal memory
         self._line_search.clear_search_history()
         self._restarted = True
         self._LBFGS_iter = 1
+        # Previous gradient information is discarded by marking the memory as
+        # empty, the next history update recreates the memmaps from scratch
         self._memory_used = 0
-
-        # Clear out previous gradient information
-        s = np.memmap(filename=self.path._s_file, mode="r+")
-        y = np.memmap(filename=self.path._y_file, mode="r+")
-        s[:] = 0.
-        y[:] = 0.
+        self._memory_head = 0
 
     def _update_search_history(self):
         """
@@ -230,100 +271,238 @@ class LBFGS(Gradient):
             which allow for access of small segments of large files on disk,
             without reading the entire file. Memmaps are array like objects.
 
+        .. note::
+            Each (s, y) pair is stored as a contiguous row of a (mem, n)
+            memmap, used as a ring buffer with the most recent pair at row
+            `_memory_head`. Adding a new pair overwrites the oldest row only,
+            the remainder of the history is not touched. The inner products
+            y.s and y.y of each pair are stored in the same rows of a small
+            array in `_dot_file`.
+
         .. note::
             Notation for s and y taken from Liu & Nocedal 1989
             iterate notation: sk = x_k+1 - x_k and yk = g_k+1 - gk
 
+        .. note::
+            If `lbfgs_curvature_check`, a new pair with y.s <= 0 is not
+            stored and the existing history is returned unchanged
+
         :rtype s: np.memmap
-        :return s: memory of the model differences `m_new - m_old`
+        :return s: memory of the model differences `m_new - m_old`, None if
+            no history has been stored
         :rtype y: np.memmap
-        :return y: memory of the gradient differences `g_new - g_old`
+        :return y: memory of the gradient differences `g_new - g_old`, None if
+            no history has been stored
         """
         # Determine the iterates for model m and gradient g
         s_k = \
             self.load_vector("m_new").vector - self.load_vector("m_old").vector
         y_k = \
             self.load_vector("g_new").vector - self.load_vector("g_old").vector
-
-        # Determine the shape of the memory map (length of model, length of mem)
-        m = len(s_k)
-        n = self.LBFGS_mem
+        s_k = s_k.astype("float32")
+        y_k = y_k.astype("float32")
+        # Single precision sums lose accuracy over long model vectors, inner
+        # products are accumulated in double precision
+        yts, yty, _ = inner_products(y_k, s_k,
+                                     max_workers=self.reduction_workers)
+        dots_k = [yts, yty]
+
+        if self.LBFGS_curvature_check and dots_k[0] <= 0:
+            logger.info(f"new L-BFGS pair violates curvature condition "
+                        f"(y.s={dots_k[0]:.2E}), not stored in history")
+            if self._memory_used == 0:
+                return None, None
+            return self._open_search_history(n=len(s_k), mode="r")
 
         # Initial iteration, need to create the memory map
         if self._memory_used == 0:
-            s = np.memmap(filename=self.path._s_file, mode="w+",
-                          dtype="float32", shape=(m, n))
-            y = np.memmap(filename=self.path._y_file, mode="w+",
-                          dtype="float32", shape=(m, n))
-            # Store the model and gradient differences in memmaps
-            s[:, 0] = s_k
-            y[:, 0] = y_k
+            s, y = self._open_search_history(n=len(s_k), mode="w+")
+            self._memory_head = 0
             self._memory_used = 1
-        # Subsequent iterations will append to memory maps
+        # Subsequent iterations overwrite the oldest row of the memory maps
         else:
-            s = np.memmap(filename=self.path._s_file, mode="r+",
-                          dtype="float32", shape=(m, n))
-            y = np.memmap(filename=self.path._y_file, mode="r+",
-                          dtype="float32", shape=(m, n))
-            # Shift all stored memory by one index to make room for latest mem
-            s[:, 1:] = s[:, :-1]
-            y[:, 1:] = y[:, :-1]
-            # Store the latest model and gradient in first index
-            s[:, 0] = s_k
-            y[:, 0] = y_k
+            s, y = self._open_search_history(n=len(s_k), mode="r+")
+            self._memory_head = (self._memory_head + 1) % self.LBFGS_mem
 
             # Keep track of the memory used
             if self._memory_used < self.LBFGS_mem:
                 self._memory_used += 1
 
+        # Store the latest model and gradient differences at the head
+        s[self._memory_head] = s_k
+        y[self._memory_head] = y_k
+
+        # Inner products of the new pair are computed once, above, while the
+        # iterates are still in memory
+        if self._memory_used == 1:
+            dots = np.zeros((self.LBFGS_mem, 2), dtype="float64")
+        else:
+            dots = np.load(self.path._dot_file).astype("float64")
+        dots[self._memory_head] = dots_k
+        np.save(self.path._dot_file, dots)
+
+        return s, y
+
+    def _open_search_history(self, n, mode="r"):
+        """
+        Open the memmaps storing the L-BFGS history of model and gradient
+        differences, one row per stored iterate
+
+        :type n: int
+        :param n: length of the model vector
+        :type mode: str
+        :param mode: memmap file mode, 'w+' creates new (zeroed) files
+        :rtype: tuple of np.memmap
+        :return: (s, y) memmaps of shape (LBFGS_mem, n)
+        """
+        shape = (self.LBFGS_mem, n)
+        s = np.memmap(filename=self.path._s_file, mode=mode, dtype="float32",
+                      shape=shape)
+        y = np.memmap(filename=self.path._y_file, mode=mode, dtype="float32",
+                      shape=shape)
+
         return s, y
 
+    def _history_rows(self):
+        """
+        Rows of the history memmaps that hold stored iterates, ordered from
+        the most recent to the oldest
+
+        :rtype: list of int
+        :return: row indices into the (s, y) memmaps
+        """
+        return [(self._memory_head - i) % self.LBFGS_mem
+                for i in range(self._memory_used)]
+
     def _apply_inverse_hessian(self, q, s=None, y=None):
         """
-        Applies L-BFGS inverse Hessian to given vector
+        Applies L-BFGS inverse Hessian to given vector. Inner products of the
+        stored pairs are read from `_dot_file`, so each history vector is
+        only read once per loop of the two-loop recursion
 
         :type q: np.array
         :param q: gradient direction to apply L-BFGS to
         :type s: np.memmap
         :param s: memory of model differences
-        :param s: memory of model differences
         :type y: np.memmap
         :param y: memory of gradient direction differences
         :rtype r: np.array
         :return r: new search direction from application of L-BFGS
         """
-        # If no memmaps are given as arguments, instantiate them
+        # If no memmaps are given as arguments, open the stored history
         if s is None or y is None:
-            m = len(q)
-            n = self.LBFGS_mem
-            s = np.memmap(filename=self.path._s_file, mode="w+",
-                          dtype="float32", shape=(m, n))
-            y = np.memmap(filename=self.path._y_file, mode="w+",
-                          dtype="float32", shape=(m, n))
+            s, y = self._open_search_history(n=len(q), mode="r")
 
         # First matrix product
         # Recursion step 2 from appendix A of Modrak & Tromp 2016
-        kk = self._memory_used
-        rh = np.zeros(kk)
+        rows = self._history_rows()
+        kk = len(rows)
+        sty, yty = np.load(self.path._dot_file)[rows].T
+        rh = 1 / sty
         al = np.zeros(kk)
-        for ii in range(kk):
-            rh[ii] = 1 / np.dot(y[:, ii], s[:, ii])
-            al[ii] = rh[ii] * np.dot(s[:, ii], q)
-            q = q - al[ii] * y[:, ii]
+        for ii, row in enumerate(rows):
+            al[ii] = rh[ii] * np.dot(s[row], q)
+            q = q - al[ii] * y[row]
 
         # Apply an optional preconditioner. Otherwise r==q
         r = self._precondition(q)
 
         # Use scaling M3 proposed by Liu and Nocedal 1989
-        sty = np.dot(y[:, 0], s[:, 0])
-        yty = np.dot(y[:, 0], y[:, 0])
-        r *= sty/yty
+        r *= sty[0]/yty[0]
 
         # Second matrix product
         # Recursion step 4 from appendix A of Modrak & Tromp 2016
         for ii in range(kk - 1, -1, -1):
-            be = rh[ii] * np.dot(y[:, ii], r)
-            r = r + s[:, ii] * (al[ii] - be)
+            be = rh[ii] * np.dot(y[rows[ii]], r)
+            r = r + s[rows[ii]] * (al[ii] - be)
+
+        return r
+
+    def _apply_inverse_hessian_compact(self, q, s=None, y=None,
+                                       block_size=2 ** 18):
+        """
+        Applies L-BFGS inverse Hessian to given vector using the compact
+        representation of Byrd, Nocedal & Schnabel 1994 (Eq. 2.6), with the
+        same initial inverse Hessian as the two-loop recursion, i.e., the
+        scaled preconditioner H0 = (y.s / y.y) * P
+
+            H = H0 + [S  H0Y] | R^-T (D + Y^T H0 Y) R^-1   -R^-T | | S^T   |
+                              |        -R^-1                0    | | Y^T H0|
+
+        where S and Y hold the stored pairs (oldest first) as columns, R is
+        the upper triangle of S^T Y and D its diagonal.
+
+        .. note::
+            The history is read in two passes over blocks of `block_size`
+            model values. The first forms the small products S^T g, Y^T H0 g,
+            S^T Y and Y^T H0 Y, the second assembles the direction. Both are
+            matrix products at the precision of the history, which use
+            multi-threaded BLAS. Products are accumulated over blocks in
+            double precision.
+
+        :type q: np.array
+        :param q: gradient direction to apply L-BFGS to
+        :type s: np.memmap
+        :param s: memory of model differences
+        :type y: np.memmap
+        :param y: memory of gradient direction differences
+        :type block_size: int
+        :param block_size: number of model values read from the history at
+            once
+        :rtype r: np.array
+        :return r: new search direction from application of L-BFGS
+        """
+        # If no memmaps are given as arguments, open the stored history
+        if s is None or y is None:
+            s, y = self._open_search_history(n=len(q), mode="r")
+
+        rows = self._history_rows()[::-1]  # oldest to newest
+        kk = len(rows)
+        nn = len(q)
+
+        # Use scaling M3 proposed by Liu and Nocedal 1989
+        sty_new, yty_new = np.load(self.path._dot_file)[rows[-1]]
+        gamma = float(sty_new / yty_new)
+
+        # Diagonal of the optional preconditioner P
+        if self.preconditioner is not None:
+            diag = self._load_preconditioner(n=nn)
+        else:
+            diag = None
+
+        # First pass: small products of the history with itself and `q`
+        stq = np.zeros(kk)
+        ythq = np.zeros(kk)
+        sty = np.zeros((kk, kk))
+        ythy = np.zeros((kk, kk))
+        for i in range(0, nn, block_size):
+            blk = slice(i, i + block_size)
+            s_b = s[rows, blk]
+            y_b = y[rows, blk]
+            q_b = q[blk].astype(s_b.dtype)
+            hy_b = y_b if diag is None else y_b * diag[blk].astype(y_b.dtype)
+            stq += s_b @ q_b
+            ythq += hy_b @ q_b
+            sty += s_b @ y_b.T
+            ythy += hy_b @ y_b.T
+        ythq *= gamma
+        ythy *= gamma
+
+        # Solve the 2k x 2k middle matrix for the coefficients of S and H0Y
+        rr = np.triu(sty)
+        dd = np.diag(np.diag(sty))
+        coef_y = -np.linalg.solve(rr, stq)
+        coef_s = np.linalg.solve(rr.T, (dd + ythy) @ -coef_y - ythq)
+
+        # Second pass: r = H0 q + S coef_s + H0 Y coef_y, at the precision of
+        # the history so that the search direction matches the gradient
+        r = np.empty(nn, dtype=s.dtype)
+        for i in range(0, nn, block_size):
+            blk = slice(i, i + block_size)
+            s_b = s[rows, blk]
+            y_b = y[rows, blk]
+            h0_b = gamma if diag is None else gamma * diag[blk]
+            r[blk] = h0_b * (q[blk] + coef_y @ y_b) + coef_s @ s_b
 
         return r
 
@@ -339,7 +518,8 @@ class LBFGS(Gradient):
         :rtype: bool
         :return: okay status based on status check (False==bad, True==good)
         """
-        theta = 180. * np.pi ** -1 * angle(g, r)
+        theta = 180. * np.pi ** -1 * angle(g, r,
+                                           max_workers=self.reduction_workers)
         logger.info(f"new search direction: {theta:.2f}{DEG} from current")
 
         if not 0. < theta < 90.:
@@ -6,7 +6,7 @@ import numpy as np
 
 from seisflows import logger
 from seisflows.optimize.gradient import Gradient
-from seisflows.tools.math import dot
+from seisflows.tools.math import dot, inner_products
 from seisflows.plugins import line_search as line_search_dir
 
 
@@ -98,13 +98,12 @@ class NLCG(Gradient):
 
         # Load the current gradient direction
         g_new = self.load_vector("g_new")
-        p_new = g_new.copy()
 
         # CASE 1: If first iteration, search direction is the current gradient
         if self._NLCG_iter == 1:
             logger.info("first NLCG iteration, setting search direction "
                         "as inverse gradient")
-            p_new.update(vector=-1 * g_new.vector)
+            p_new = g_new.scale_(-1)
             restarted = False
         # CASE 2: Force restart if the iterations have surpassed the maximum
         # number of allowable iter
@@ -113,7 +112,7 @@ class NLCG(Gradient):
                         "condition. setting search direction as inverse "
                         "gradient")
             self.restart()
-            p_new.update(vector=-1 * g_new.vector)
+            p_new = g_new.scale_(-1)
             restarted = True
         # Normal NLCG direction compuitation
         else:
@@ -123,21 +122,25 @@ class NLCG(Gradient):
             beta = self._calc_beta(g_new.vector, g_old.vector)
 
             # Apply preconditioner and calc. scale factor for search dir. (beta)
-            _p_new_vec = (
-                    -1 * self._precondition(g_new.vector) + beta * p_old.vector
-            )
-            p_new.update(vector=_p_new_vec)
+            # Shallow copy, data are copied at most once by the in-place ops
+            p_new = g_new.copy(deep=False)
+            p_new.update(vector=self._precondition(p_new.vector))
+            p_new.scale_(-1)
+            p_new.axpy(beta, p_old)
 
             # Check restart conditions, return search direction and statusa
-            if check_conjugacy(g_new.vector, g_old.vector) > self.NLCG_thresh:
+            if check_conjugacy(g_new.vector, g_old.vector,
+                               max_workers=self.reduction_workers) > \
+                    self.NLCG_thresh:
                 logger.info("restarting NLCG due to loss of conjugacy")
                 self.restart()
-                p_new.update(vector=-1 * g_new.vector)
+                p_new = g_new.scale_(-1)
                 restarted = True
-            elif check_descent(p_new.vector, g_new.vector) > 0.:
+            elif check_descent(p_new.vector, g_new.vector,
+                               max_workers=self.reduction_workers) > 0.:
                 logger.info("restarting NLCG, not a descent direction")
                 self.restart()
-                p_new.update(vector=-1 * g_new.vector)
+                p_new = g_new.scale_(-1)
                 restarted = True
             else:
                 # p_new = p_new
@@ -154,9 +157,8 @@ class NLCG(Gradient):
         """
         logger.info("restarting NLCG optimization algorithm")
 
-        g_new = self.load_vector("g_new")
-        p_new = g_new.copy()
-        p_new.update(vector=-1 * g_new.vector)
+        p_new = self.load_vector("g_new")
+        p_new.scale_(-1)
         self.save_vector("p_new", p_new)
 
         self._line_search.clear_search_history()
@@ -200,7 +202,7 @@ class NLCG(Gradient):
         return beta
 
 
-def check_conjugacy(g_new, g_old):
+def check_conjugacy(g_new, g_old, max_workers=None):
     """
     Check for conjugacy between two vectors
 
@@ -208,13 +210,16 @@ def check_conjugacy(g_new, g_old):
     :param g_new: new search direction
     :type g_old: np.array
     :param g_old: old search direction
+    :type max_workers: int
+    :param max_workers: number of threads used to reduce the vectors
     :rtype: float
     :return: an element that proves conjugacy
     """
-    return abs(dot(g_new, g_old) / dot(g_new, g_new))
+    new_old, new_new, _ = inner_products(g_new, g_old, max_workers=max_workers)
+    return abs(new_old / new_new)
 
 
-def check_descent(p_new, g_new):
+def check_descent(p_new, g_new, max_workers=None):
     """
     Ensure that the search direction is descending
 
@@ -222,11 +227,14 @@ def check_descent(p_new, g_new):
     :param p_new: search direction
     :type g_new: np.array
     :param g_new: gradient direction
+    :type max_workers: int
+    :param max_workers: number of threads used to reduce the vectors
     :rtype: float
     :return: the angle between search direction and gradient direction, should
         be negative to ensure descent
     """
-    return dot(p_new, g_new) / dot(g_new, g_new)
+    pg, _, gg = inner_products(p_new, g_new, max_workers=max_workers)
+    return pg / gg
 
 
 
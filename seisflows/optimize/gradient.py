@@ -26,14 +26,17 @@ different optimization algorithms.
     stagnation of the nonlinear optimizationalgorithm.
 """
 import os
+import json
 import numpy as np
+from collections import OrderedDict
 from glob import glob
 
 from seisflows import logger
 from seisflows.tools import msg, unix
 from seisflows.tools.config import Dict
-from seisflows.tools.math import angle, dot
+from seisflows.tools.math import angle, inner_products
 from seisflows.tools.model import Model
+from seisflows.tools.specfem import read_fortran_binary
 from seisflows.plugins import line_search as line_search_dir
 
 
@@ -52,9 +55,12 @@ class Gradient:
         for all available options
     :type preconditioner: str
     :param preconditioner: algorithm for preconditioning gradients. Currently
-        available: 'diagonal'. Requires `path_preconditioner` to point to a
-        set of files that define the preconditioner, formatted the same as the
-        input model
+        available: 'diagonal', 'hessian'. Requires `path_preconditioner` to
+        point to a set of files that define the preconditioner. For
+        'diagonal', formatted the same as the input model. For 'hessian',
+        SPECFEM approximate Hessian kernels (e.g., proc000000_hess_kernel.bin)
+        from which the diagonal preconditioner is built as the inverse
+        absolute Hessian, stabilized by a water level
     :type step_count_max: int
     :param step_count_max: maximum number of trial steps to perform during
         the line search before a change in line search behavior is
@@ -65,6 +71,19 @@ class Gradient:
     :type step_len_max: float
     :param step_len_max: maximum allowable step length during the line
         search. Set as a fraction of the current model parameters
+    :type vector_cache_size: int
+    :param vector_cache_size: maximum number of model vectors (e.g., m_new,
+        g_new) kept in memory once loaded, so that repeat loads of the same
+        vector do not re-read it from disk. Set 0 to disable
+    :type speculative_steps: int
+    :param speculative_steps: number of trial step lengths proposed by the
+        line search and evaluated at once (speculatively) during each line
+        search step. Each evaluated step length counts towards
+        `step_count_max`. Set 1 to evaluate one step length at a time
+    :type reduction_workers: int
+    :param reduction_workers: number of threads used to compute dot products
+        and angles between model vectors, which are reduced block by block
+        in double precision. Set 1 to reduce serially
 
     Paths
     -----
@@ -76,8 +95,10 @@ class Gradient:
     """
     def __init__(self, line_search_method="bracket",
                  preconditioner=None, step_count_max=10, step_len_init=0.05,
-                 step_len_max=0.5, workdir=os.getcwd(), path_optimize=None,
-                 path_output=None, path_preconditioner=None, **kwargs):
+                 step_len_max=0.5, vector_cache_size=4, speculative_steps=1,
+                 reduction_workers=1, workdir=os.getcwd(),
+                 path_optimize=None, path_output=None, path_preconditioner=None,
+                 **kwargs):
         """
         Gradient-descent input parameters.
 
@@ -98,6 +119,9 @@ class Gradient:
         self.step_count_max = step_count_max
         self.step_len_init = step_len_init
         self.step_len_max = step_len_max
+        self.vector_cache_size = vector_cache_size
+        self.speculative_steps = speculative_steps
+        self.reduction_workers = reduction_workers
 
         # Set required path structure
         self.path = Dict(
@@ -112,6 +136,11 @@ class Gradient:
                                                 "checkpoint.npz")
         self.path["_stats_file"] = os.path.join(self.path.scratch,
                                                 "output_optim.txt")
+        self.path["_preconditioner"] = os.path.join(self.path.scratch,
+                                                    "preconditioner.npy")
+        self.path["_preconditioner_sources"] = os.path.join(
+            self.path.scratch, "preconditioner.json"
+        )
 
         # Internal check to see if the chosen line search algorithm exists
         if not hasattr(line_search_dir, line_search_method):
@@ -127,7 +156,14 @@ class Gradient:
                                     "g_new", "g_old", "g_try",
                                     "p_new", "p_old", "alpha",
                                     "f_new", "f_old", "f_try"]
-        self._acceptable_preconditioners = ["diagonal"]
+        self._acceptable_preconditioners = ["diagonal", "hessian"]
+        # Fraction of the maximum Hessian value added before inverting it
+        self._hessian_water_level = 1E-3
+        # Merged preconditioner vector, checked against the files it was
+        # built from once per gradient, see _load_preconditioner()
+        self._preconditioner_vector = None
+        # Least recently used cache of loaded Models, see load_vector()
+        self._vector_cache = OrderedDict()
 
         # .title() ensures we grab the class and not the module
         self._line_search = getattr(
@@ -158,6 +194,10 @@ class Gradient:
         assert 0. < self.step_len_max, f"optimize.step_len_max must be >= 0."
         assert self.step_len_init < self.step_len_max, \
             f"optimize.step_len_init must be < optimize.step_len_max"
+        assert self.speculative_steps >= 1, \
+            f"optimize.speculative_steps must be >= 1"
+        assert self.reduction_workers >= 1, \
+            f"optimize.reduction_workers must be >= 1"
 
     def setup(self):
         """
@@ -188,6 +228,18 @@ class Gradient:
             p_old: previous search direction
             alpha: trial search direction (aka p_try)
 
+        .. note::
+            Models are saved as flat vectors (see Model.save_flat) and are
+            memory-mapped read-only when loaded, so data are only read from
+            disk when accessed. Models saved by previous versions as .npz
+            files are read into memory
+
+        .. note::
+            Models are kept in an in-memory cache of `vector_cache_size`
+            entries, valid as long as the file on disk is unchanged. Cached
+            Models are returned as shallow (copy-on-write) copies, so callers
+            may still modify them in place without corrupting the cache
+
         :type name: str
         :param name: name of the vector, acceptable: m, g, p, f, alpha
         """
@@ -197,8 +249,11 @@ class Gradient:
         model_npy = model_npz.replace(".npz", ".npy")
         model_txt = model_npz.replace(".npz", ".txt")
 
-        if os.path.exists(model_npz):
-            model = Model(path=model_npz)
+        if os.path.exists(Model.flat_metadata(model_npy)) and \
+                os.path.exists(model_npy):
+            model = self._load_cached_model(name, model_npy)
+        elif os.path.exists(model_npz):
+            model = self._load_cached_model(name, model_npz)
         elif os.path.exists(model_npy):
             model = np.load(model_npy)
         elif os.path.exists(model_txt):
@@ -215,23 +270,63 @@ class Gradient:
         :type name: str
         :param name: name of the vector to overwrite
         :type m: seisflows.tools.specfem.Model or float
-        :param m: Model to save to disk as npz array
+        :param m: Model to save to disk as a flat (memory-mappable) vector
         """
         assert(name in self._acceptable_vectors)
+        self._vector_cache.pop(name, None)
+        # Preconditioner inputs (e.g., Hessian kernels) may have been updated
+        # along with a new gradient
+        if name == "g_new":
+            self._preconditioner_vector = None
 
         if isinstance(m, Model):
-            path = os.path.join(self.path.scratch, f"{name}.npz")
-            m.model = m.split()  # overwrite m representation
-            m.save(path=path)
+            path = os.path.join(self.path.scratch, f"{name}.npy")
+            m.save_flat(path=path)
+            # Remove any Model saved in the previous .npz format
+            unix.rm(path.replace(".npy", ".npz"))
         elif isinstance(m, np.ndarray):
             path = os.path.join(self.path.scratch, f"{name}.npy")
-            np.save(path=path)
+            np.save(path, m)
+            unix.rm(Model.flat_metadata(path))
+            unix.rm(path.replace(".npy", ".txt"))
         elif isinstance(m, (float, int)):
             path = os.path.join(self.path.scratch, f"{name}.txt")
             np.savetxt(path, [m])
+            # Remove any array (e.g., speculative step lengths) of this name
+            unix.rm(path.replace(".txt", ".npy"))
         else:
             raise TypeError(f"optimize.save unrecognized type error {type(m)}")
 
+    def _load_cached_model(self, name, path):
+        """
+        Load a Model saved by save_vector(), returning it from the vector
+        cache if it has been loaded before and the file is unchanged
+
+        :type name: str
+        :param name: name of the vector, used as the cache key
+        :type path: str
+        :param path: full path to the .npy (flat vector) or .npz file of the
+            Model
+        :rtype: seisflows.tools.model.Model
+        :return: Model read from `path`, or a shallow copy of the cached Model
+        """
+        stat = os.stat(path)
+        key = (path, stat.st_size, stat.st_mtime_ns)
+
+        if name in self._vector_cache and self._vector_cache[name][0] == key:
+            self._vector_cache.move_to_end(name)
+            return self._vector_cache[name][1].copy(deep=False)
+
+        model = Model(path=path, lazy=path.endswith(".npy"))
+        if self.vector_cache_size:
+            self._vector_cache[name] = (key, model)
+            self._vector_cache.move_to_end(name)
+            while len(self._vector_cache) > self.vector_cache_size:
+                self._vector_cache.popitem(last=False)
+            model = model.copy(deep=False)
+
+        return model
+
     def checkpoint(self):
         """
         The optimization module (and its underlying `line_search` attribute)
@@ -289,17 +384,123 @@ class Gradient:
         :return: preconditioned vector
         """
         if self.preconditioner is not None:
-            p = Model(path=self.path.preconditioner)
-            if self.preconditioner.upper() == "DIAGONAL":
-                logger.info("applying diagonal preconditioner")
-                return p.vector * q
-            else:
-                raise NotImplementedError(
-                    f"preconditioner {self.preconditioner} not supported"
-                )
+            logger.info(f"applying {self.preconditioner} preconditioner")
+            return self._load_preconditioner(n=len(q)) * q
         else:
             return q
 
+    def _load_preconditioner(self, n):
+        """
+        Load the merged diagonal preconditioner vector. It is built from
+        `path.preconditioner`, saved to the scratch directory and then kept
+        memory-mapped, so later calls (and later jobs) neither re-read nor
+        re-merge the input files. The preconditioner is rebuilt whenever the
+        input files change, e.g., Hessian kernels re-computed each iteration.
+        Input files are only checked the first time the preconditioner is
+        needed by a job, or after a new gradient was saved
+
+        :type n: int
+        :param n: expected length of the preconditioner, i.e., of the vector
+            that it will be applied to
+        :rtype: np.array
+        :return: read-only, memory-mapped diagonal preconditioner
+        """
+        if self._preconditioner_vector is not None and \
+                len(self._preconditioner_vector) == n:
+            return self._preconditioner_vector
+
+        sources = self._get_preconditioner_sources()
+        if os.path.exists(self.path._preconditioner) and \
+                os.path.exists(self.path._preconditioner_sources):
+            with open(self.path._preconditioner_sources, "r") as f:
+                saved_sources = json.load(f)
+            vector = np.load(self.path._preconditioner, mmap_mode="r")
+            if len(vector) == n and saved_sources == sources:
+                self._preconditioner_vector = vector
+                return vector
+
+        logger.info(f"building {self.preconditioner} preconditioner from "
+                    f"{self.path.preconditioner}")
+        if self.preconditioner.upper() == "DIAGONAL":
+            vector = Model(path=self.path.preconditioner).vector
+        elif self.preconditioner.upper() == "HESSIAN":
+            vector = self._build_hessian_preconditioner()
+        else:
+            raise NotImplementedError(
+                f"preconditioner {self.preconditioner} not supported"
+            )
+        assert(len(vector) == n), (
+            f"preconditioner of length {len(vector)} does not match vector "
+            f"of length {n}"
+        )
+
+        # Replace rather than overwrite, a previous preconditioner may still
+        # be memory-mapped
+        fid_tmp = self.path._preconditioner.replace(".npy", "_tmp.npy")
+        np.save(fid_tmp, vector)
+        os.replace(fid_tmp, self.path._preconditioner)
+        with open(self.path._preconditioner_sources, "w") as f:
+            json.dump(sources, f)
+        self._preconditioner_vector = np.load(self.path._preconditioner,
+                                              mmap_mode="r")
+
+        return self._preconditioner_vector
+
+    def _get_preconditioner_sources(self):
+        """
+        List the files that the preconditioner is built from, with their size
+        and modification time, so that a saved preconditioner can be checked
+        against its inputs. Hidden files, e.g., model index sidecars, are not
+        considered
+
+        :rtype: list of list
+        :return: [filename, size, modification time in ns] for each file in
+            `path.preconditioner`
+        """
+        if os.path.isdir(self.path.preconditioner):
+            fids = sorted(glob(os.path.join(self.path.preconditioner, "*")))
+        else:
+            fids = [self.path.preconditioner]
+
+        sources = []
+        for fid in fids:
+            stat = os.stat(fid)
+            sources.append([os.path.basename(fid), stat.st_size,
+                            stat.st_mtime_ns])
+        return sources
+
+    def _build_hessian_preconditioner(self):
+        """
+        Build a diagonal preconditioner from SPECFEM approximate Hessian
+        kernels in a single pass over the kernel files. Each Hessian slice is
+        read once, and its inverse applied to every model parameter of the
+        same processor (and region for SPECFEM3D_GLOBE), laid out as the
+        gradient vector `g_new`
+
+        :rtype: np.array
+        :return: inverse absolute Hessian for each value of the gradient
+        """
+        g = self.load_vector("g_new")
+
+        hessian = []
+        slices = {}
+        for parameter in g.parameters:
+            # e.g., 'reg1_vs_kernel' -> 'reg1_hess_kernel'
+            prefix = parameter.split("_")[0] + "_" \
+                if parameter.startswith("reg") else ""
+            for i in range(g.nproc):
+                fid = os.path.join(self.path.preconditioner,
+                                   g.fnfmt(i=i, val=f"{prefix}hess_kernel",
+                                           ext=".bin"))
+                if fid not in slices:
+                    slices[fid] = np.abs(read_fortran_binary(fid))
+                hessian.append(slices[fid])
+        hessian = np.concatenate(hessian)
+
+        # Water level prevents division by (near-)zero Hessian values
+        hessian += self._hessian_water_level * hessian.max()
+        return 1 / hessian
+
     def compute_direction(self):
         """
         Computes steepest descent search direction (inverse gradient)
@@ -311,9 +512,10 @@ class Gradient:
         :rtype: seisflows.tools.specfem.Model
         :return: search direction as a Model instance
         """
-        g_new = self.load_vector("g_new")
-        p_new = g_new.copy()
-        p_new.update(vector=-1 * self._precondition(g_new.vector))
+        # Search direction is built in place on the freshly loaded gradient
+        p_new = self.load_vector("g_new")
+        p_new.update(vector=self._precondition(p_new.vector))
+        p_new.scale_(-1)
 
         return p_new
 
@@ -331,10 +533,11 @@ class Gradient:
         p = self.load_vector("p_new")  # current search direction
         f = self.load_vector("f_new")  # current misfit value from preprocess
 
-        norm_m = max(abs(m.vector))
-        norm_p = max(abs(p.vector))
-        gtg = dot(g.vector, g.vector)
-        gtp = dot(g.vector, p.vector)
+        norm_m = m.norm(ord=np.inf)
+        norm_p = p.norm(ord=np.inf)
+        gtg = g.dot(g)
+        gtp = g.dot(p)
+        del g  # gradient no longer required, free memory for trial model
 
         # Restart plugin line search if the optimization library restarts
         if self._restarted:
@@ -359,9 +562,9 @@ class Gradient:
                          f"alpha_new={alpha:.2E}")
 
         # The new model is the old model, scaled by the step direction and
-        # gradient threshold to remove any outlier values
-        m_try = m.copy()
-        m_try.update(vector=m.vector + alpha * p.vector)
+        # gradient threshold to remove any outlier values. `m` was loaded
+        # from disk so it can be perturbed in place to create `m_try`
+        m_try = m.axpy(alpha, p)
         logger.info("trial model 'm_try' parameters: ")
         m_try.check()
 
@@ -406,13 +609,22 @@ class Gradient:
         :return: (Model, float, bool) or (m_try==trial model, alpha=step length,
             status==how to proceed with line search)
         """
-        # Collect information on a forward evaluation that just took place
-        alpha_try = self.load_vector("alpha")  # step length
-        f_try = self.load_vector("f_try")  # misfit for the trial model
+        # Collect information on a forward evaluation that just took place.
+        # Speculative line searches evaluate arrays of step lengths at once
+        alpha_try = np.atleast_1d(self.load_vector("alpha"))  # step length(s)
+        f_try = np.atleast_1d(self.load_vector("f_try"))  # misfit for trials
+        assert(len(alpha_try) == len(f_try)), (
+            f"number of trial misfits ({len(f_try)}) does not match number "
+            f"of trial step lengths ({len(alpha_try)})"
+        )
 
-        # Update the line search with a new step length and misfit value
-        self._line_search.update_search_history(step_len=alpha_try,
-                                                func_val=f_try)
+        # Update the line search with new step length(s) and misfit value(s).
+        # Each additional speculative evaluation counts as a line search step
+        for i, (alpha_, f_) in enumerate(zip(alpha_try, f_try)):
+            if i > 0:
+                self.increment_step_count()
+            self._line_search.update_search_history(step_len=float(alpha_),
+                                                    func_val=float(f_))
 
         # Calculate a new step length based on the current step length and its
         # corresponding misfit.
@@ -421,14 +633,7 @@ class Gradient:
         # Note: if status is 'PASS' then `alpha` represents the step length of
         # the lowest misfit in the line search and we reconstruct `m_try` w/ it
         if status.upper() in ["PASS", "TRY"]:
-            # Create a new trial model based on search direction, step length
-            # and the initial model vector
-            _m = self.load_vector("m_new")
-            _p = self.load_vector("p_new")
-
-            # Sets the latest trial model using the current `alpha` value
-            m_try = _m.copy()
-            m_try.update(vector=_m.vector + alpha * _p.vector)
+            m_try = self.compute_trial_model(alpha)
             logger.info("line search model 'm_try' parameters: ")
             m_try.check()
         elif status.upper() == "FAIL":
@@ -437,6 +642,42 @@ class Gradient:
 
         return m_try, alpha, status
 
+    def compute_trial_model(self, alpha):
+        """
+        Create a trial model by perturbing the current model (m_new) in the
+        search direction (p_new) with a given step length
+
+        :type alpha: float
+        :param alpha: step length to scale the search direction by
+        :rtype: seisflows.tools.model.Model
+        :return: trial model, m_try = m_new + alpha * p_new
+        """
+        m = self.load_vector("m_new")
+        p = self.load_vector("p_new")
+
+        # `m` was loaded from disk so it can be perturbed in place
+        return m.axpy(alpha, p)
+
+    def propose_step_lengths(self, alpha):
+        """
+        Expand a step length calculated by the line search into the set of
+        trial step lengths to be evaluated at once by a speculative line
+        search. The line search plugin decides which step lengths are worth
+        evaluating alongside `alpha`, based on its current search history
+
+        :type alpha: float
+        :param alpha: step length calculated by the line search
+        :rtype: np.array
+        :return: up to `speculative_steps` trial step lengths, first entry is
+            `alpha`
+        """
+        alphas = self._line_search.propose_step_lengths(
+            alpha, nsteps=self.speculative_steps)
+        logger.info(f"speculative line search proposes {len(alphas)} step "
+                    f"lengths: {', '.join([f'{_:.2E}' for _ in alphas])}")
+
+        return np.array(alphas)
+
     def finalize_search(self):
         """
         Prepares algorithm machinery and scratch directory for next model update
@@ -448,6 +689,9 @@ class Gradient:
 
         logger.info(msg.sub("FINALIZING LINE SEARCH"))
 
+        # Vectors are renamed below, so cached Models no longer match names
+        self._vector_cache.clear()
+
         # Remove the old model parameters
         if glob("?_old"):
             logger.info("removing previously accepted model files (?_old)")
@@ -468,8 +712,10 @@ class Gradient:
         x, f, *_ = self._line_search.get_search_history()
 
         logger.info("setting accepted trial model (try) as current model (new)")
-        unix.mv(src=os.path.join(self.path.scratch, "m_try.npz"),
-                dst=os.path.join(self.path.scratch, "m_new.npz"))
+        # e.g., m_try.npy -> m_new.npy, m_try.meta.npz -> m_new.meta.npz
+        for src in glob(os.path.join(self.path.scratch, "m_try.*")):
+            dst = src.replace("m_try.", "m_new.")
+            unix.mv(src, dst)
 
         # Choose minimum misfit value as final misfit/model. index 0 is initial
         f = self._line_search.get_search_history()[1]
@@ -499,7 +745,9 @@ class Gradient:
         g = self.load_vector("g_new")
         p = self.load_vector("p_new")
 
-        theta = angle(p.vector, -1 * g.vector)
+        # Angle between `p` and `-g`, without negating the gradient vector
+        theta = np.pi - angle(p.vector, g.vector,
+                              max_workers=self.reduction_workers)
         logger.debug(f"checking gradient/search direction angle, "
                      f"theta: {theta:6.3f}")
 
@@ -575,11 +823,16 @@ class Gradient:
         step_length = x[f.argmin()]
         misfit = f[f.argmin()]
 
-        grad_norm_L1 = np.linalg.norm(g.vector, 1)
-        grad_norm_L2 = np.linalg.norm(g.vector, 2)
+        # One pass over `p` and `g` provides both the L2 norm and the angle
+        pg, pp, gg = inner_products(p.vector, g.vector,
+                                    max_workers=self.reduction_workers)
+        grad_norm_L1 = g.norm(ord=1)
+        grad_norm_L2 = gg ** 0.5
 
         slope = (f[1] - f[0]) / (x[1] - x[0])
-        theta = 180. * np.pi ** -1 * angle(p.vector, -1 * g.vector)
+        # Angle between `p` and `-g`
+        theta = 180. * np.pi ** -1 * np.arccos(
+            np.clip(-1 * pg / (pp * gg) ** 0.5, -1., 1.))
 
         _str = (f"{step_count:0>2},{step_length:6.3E},{grad_norm_L1:6.3E},"
                 f"{grad_norm_L2:6.3E},{misfit:6.3E},{int(self._restarted)},"
@@ -4,8 +4,10 @@ Backtracking line search class plugin to be used with an L-BFGS optimization
 
 https://en.wikipedia.org/wiki/Backtracking_line_search
 """
+import numpy as np
+
 from seisflows import logger
-from seisflows.plugins.line_search.bracket import Bracket
+from seisflows.plugins.line_search.bracket import Bracket, _unique_step_lengths
 from seisflows.tools.math import parabolic_backtrack
 
 
@@ -99,3 +101,26 @@ class Backtrack(Bracket):
 
         return alpha, status
 
+    def propose_step_lengths(self, alpha, nsteps):
+        """
+        Propose a set of trial step lengths, starting with `alpha`, to be
+        evaluated at once by a speculative line search. Defaults to the
+        'Bracket'ing proposals during the first evaluation, otherwise
+        successively halves the step length, i.e., the upper limit of the
+        parabolic backtrack that would follow a failed step
+
+        :type alpha: float
+        :param alpha: step length calculated by `calculate_step_length`
+        :type nsteps: int
+        :param nsteps: maximum number of step lengths to propose
+        :rtype: list of float
+        :return: unique trial step lengths, first entry is `alpha`, all
+            bounded by the maximum step length
+        """
+        update_count = self.get_search_history()[-1]
+        if update_count == 0:
+            return super().propose_step_lengths(alpha, nsteps)
+
+        step_lens = alpha * 0.5 ** np.arange(nsteps)
+        return _unique_step_lengths(step_lens, self.step_len_max)
+
@@ -217,6 +217,61 @@ class Bracket:
 
         return alpha, status
 
+    def propose_step_lengths(self, alpha, nsteps):
+        """
+        Propose a set of trial step lengths, starting with `alpha`, to be
+        evaluated at once by a speculative line search. Proposals anticipate
+        the steps the bracketing line search would take next if `alpha` were
+        not accepted:
+
+        1. Misfit has not yet increased: successively increase step length by
+            the golden ratio
+        2. Minimum is bracketed: straddle `alpha` at intervals such that any
+            step length between the proposals is `_good_enough`
+        3. Misfit increases: successively halve the step length, i.e., the
+            upper limit of the parabolic backtrack
+
+        :type alpha: float
+        :param alpha: step length calculated by `calculate_step_length`
+        :type nsteps: int
+        :param nsteps: maximum number of step lengths to propose
+        :rtype: list of float
+        :return: unique trial step lengths, first entry is `alpha`, all
+            bounded by the maximum step length
+        """
+        x, f, *_ = self.get_search_history()
+
+        if len(f) == 1 or all(f <= f[0]):
+            factors = [1.618034 ** i for i in range(nsteps)]
+        elif _check_bracket(x, f):
+            ratio = 1.2 ** 2  # adjacent steps share `_good_enough` threshold
+            factors = [ratio ** (sign * ((i + 1) // 2))
+                       for i, sign in zip(range(nsteps), [1, -1] * nsteps)]
+        else:
+            factors = [0.5 ** i for i in range(nsteps)]
+
+        return _unique_step_lengths(alpha * np.array(factors),
+                                    self.step_len_max)
+
+
+def _unique_step_lengths(step_lens, step_len_max):
+    """
+    Bound step lengths by a maximum step length and remove duplicates while
+    retaining the order of the remaining step lengths
+
+    :type step_lens: np.array
+    :param step_lens: proposed step lengths
+    :type step_len_max: float
+    :param step_len_max: maximum allowable step length
+    :rtype: list of float
+    :return: unique, bounded step lengths
+    """
+    bounded = []
+    for step_len in np.minimum(step_lens, step_len_max):
+        if not np.isclose(bounded, step_len).any():
+            bounded.append(float(step_len))
+    return bounded
+
 
 def _check_bracket(step_lens, func_vals):
     """
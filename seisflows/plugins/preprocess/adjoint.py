@@ -12,12 +12,13 @@ All functions defined have four required positional arguments
     :param nt: number of time steps in the data array
     :type dt: float
     :param dt: time step in sec
-"""
-import numpy as np
-from scipy.signal import hilbert as analytic
 
-from seisflows.tools.math import hilbert
-from seisflows.plugins.preprocess import misfit
+Functions operate on a single trace and wrap the batched engine in
+`seisflows.plugins.preprocess.batched`, which generates adjoint sources for
+many traces at once.
+"""
+from seisflows.plugins.preprocess.batched import (BatchedTraces as
+                                                 _BatchedTraces)
 
 
 def waveform(syn, obs, *args, **kwargs):
@@ -29,9 +30,7 @@ def waveform(syn, obs, *args, **kwargs):
     :type obs: np.array
     :param obs: observed data array
     """
-    wadj = syn - obs
-
-    return wadj
+    return _BatchedTraces(syn, obs, dt=None).adjoint("waveform")[0]
 
 
 def envelope(syn, obs, nt, dt, eps=0.05, *args, **kwargs):
@@ -47,14 +46,7 @@ def envelope(syn, obs, nt, dt, eps=0.05, *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    env_syn = abs(analytic(syn))
-    env_obs = abs(analytic(obs))
-
-    env_tmp = (env_syn - env_obs) / (env_syn + eps * env_syn.max())
-
-    wadj = env_tmp * syn - np.imag(analytic(env_tmp * np.imag(analytic(syn))))
-
-    return wadj
+    return _BatchedTraces(syn, obs, dt).adjoint("envelope", eps=eps)[0]
 
 
 def instantaneous_phase(syn, obs, nt, dt, eps=0.05, *args, **kwargs):
@@ -70,27 +62,11 @@ def instantaneous_phase(syn, obs, nt, dt, eps=0.05, *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    r = np.real(analytic(syn))
-    i = np.imag(analytic(syn))
-    phi_syn = np.arctan2(i, r)
-
-    r = np.real(analytic(obs))
-    i = np.imag(analytic(obs))
-    phi_obs = np.arctan2(i, r)
+    return _BatchedTraces(syn, obs, dt).adjoint("instantaneous_phase",
+                                               eps=eps)[0]
 
-    phi_rsd = phi_syn - phi_obs
-    env_syn = abs(analytic(syn))
-    env_max = max(env_syn**2.)
 
-    wadj_1 = phi_rsd * np.imag(analytic(syn)) / (env_syn ** 2. + eps * env_max) 
-    wadj_2 = np.imag(analytic(phi_rsd * syn / (env_syn**2. + eps * env_max)))
- 
-    wadj = wadj_1 + wadj_2
-
-    return wadj
-
-
-def traveltime(syn, obs, nt, dt, *args, **kwargs):
+def traveltime(syn, obs, nt, dt, subsample=False, *args, **kwargs):
     """
     Cross-correlation traveltime from Tromp et al. 2005 Eq. 45
 
@@ -102,14 +78,11 @@ def traveltime(syn, obs, nt, dt, *args, **kwargs):
     :param nt: number of time steps in the data array
     :type dt: float
     :param dt: time step in sec
+    :type subsample: bool
+    :param subsample: refine the cross-correlation lag to sub-sample precision
     """
-    wadj = np.zeros(nt)
-
-    wadj[1:-1] = (syn[2:] - syn[0:-2]) / (2. * dt)
-    wadj *= 1. / (sum(wadj * wadj) * dt)
-
-    wadj *= misfit.traveltime(syn, obs, nt, dt)
-    return wadj
+    return _BatchedTraces(syn, obs, dt, subsample=subsample).adjoint(
+        "traveltime")[0]
 
 
 def traveltime_inexact(syn, obs, nt, dt, *args, **kwargs):
@@ -125,17 +98,10 @@ def traveltime_inexact(syn, obs, nt, dt, *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    wadj = np.zeros(nt)
-
-    wadj[1:-1] = (syn[2:] - syn[0:-2]) / (2. * dt)
-    wadj *= 1. / (sum(wadj * wadj) * dt)
-
-    wadj *= misfit.traveltime_inexact(syn, obs, nt, dt)
+    return _BatchedTraces(syn, obs, dt).adjoint("traveltime_inexact")[0]
 
-    return wadj
 
-
-def amplitude(syn, obs, nt, dt, *args, **kwargs):
+def amplitude(syn, obs, nt, dt, subsample=False, *args, **kwargs):
     """
     Cross-correlation amplitude difference
 
@@ -147,11 +113,11 @@ def amplitude(syn, obs, nt, dt, *args, **kwargs):
     :param nt: number of time steps in the data array
     :type dt: float
     :param dt: time step in sec
+    :type subsample: bool
+    :param subsample: refine the cross-correlation lag to sub-sample precision
     """
-    wadj = 1. / (sum(syn * syn) * dt) * syn
-    wadj *= misfit.amplitude(syn, obs, nt, dt)
-
-    return wadj
+    return _BatchedTraces(syn, obs, dt, subsample=subsample).adjoint(
+        "amplitude")[0]
 
 
 def envelope2(syn, obs, nt, dt, eps=0., *args, **kwargs):
@@ -167,7 +133,7 @@ def envelope2(syn, obs, nt, dt, eps=0., *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    raise NotImplementedError
+    return _BatchedTraces(syn, obs, dt).adjoint("envelope2", eps=eps)[0]
 
 
 def envelope3(syn, obs, nt, dt, eps=0., *args, **kwargs):
@@ -183,17 +149,7 @@ def envelope3(syn, obs, nt, dt, eps=0., *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    env_syn = abs(analytic(syn))
-    env_obs = abs(analytic(obs))
-
-    env_rat = np.zeros(nt)
-    env_rat[1:-1] = (env_syn[2:] - env_syn[0:-2]) / (2. * dt)
-    env_rat[1:-1] /= env_syn[1:-1]
-    env_rat *= misfit.envelope3(syn, obs, nt, dt)
-
-    wadj = -env_rat * syn + hilbert(env_rat * hilbert(env_syn))
-
-    return wadj
+    return _BatchedTraces(syn, obs, dt).adjoint("envelope3", eps=eps)[0]
 
 
 def instantaneous_phase2(syn, obs, nt, dt, eps=0., *args, **kwargs):
@@ -209,40 +165,22 @@ def instantaneous_phase2(syn, obs, nt, dt, eps=0., *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    esyn = abs(analytic(syn))
-    eobs = abs(analytic(obs))
-
-    esyn1 = esyn + eps * max(esyn)
-    eobs1 = eobs + eps * max(eobs)
-    esyn3 = esyn ** 3 + eps * max(esyn ** 3)
-
-    diff1 = (syn / esyn1) - (obs / eobs1)
-    diff2 = (hilbert(syn) / esyn1) - (hilbert(obs) / eobs1)
-
-    part1 = diff1 * hilbert(syn) ** 2 / esyn3 
-    part2 = diff2 * syn * hilbert(syn) / esyn3
-    part3 = diff1 * syn * hilbert(syn) / esyn3 - diff2 * syn ** 2 / esyn3
-
-    wadj = part1 - part2 + hilbert(part3)
-
-    return wadj
+    return _BatchedTraces(syn, obs, dt).adjoint("instantaneous_phase2",
+                                               eps=eps)[0]
 
 
 def displacement(syn, obs, nt, dt, *args, **kwargs):
     """
     Displacement waveform for migration
     """
-    return obs
+    return _BatchedTraces(syn, obs, dt).adjoint("displacement")[0]
 
 
 def velocity(syn, obs, nt, dt, *args, **kwargs):
     """
     Velocity waveform for migration, taking derivative of obs
     """
-    adj = np.zeros(nt)
-    adj[1:-1] = (obs[2:] - obs[0:-2]) / (2. * dt)
-
-    return adj
+    return _BatchedTraces(syn, obs, dt).adjoint("velocity")[0]
 
 
 def acceleration(syn, obs, nt, dt, *args, **kwargs):
@@ -250,8 +188,4 @@ def acceleration(syn, obs, nt, dt, *args, **kwargs):
     Acceleration waveform for migration, second derivative of obs
     Use finite difference to differentiate observatio nwaveform
     """
-    adj = np.zeros(nt)
-    adj[1:-1] = (-obs[2:] + 2. * obs[1:-1] - obs[0:-2]) / (2. * dt)
-
-    return adj
-
+    return _BatchedTraces(syn, obs, dt).adjoint("acceleration")[0]
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+Batched misfit and adjoint source engine used by the 'default' preprocess
+class. Synthetic and observed waveforms are stacked into (ntrace, nt) arrays
+so that misfits and adjoint sources for all traces are calculated in one
+vectorized pass. Quantities derived from the waveforms (e.g., analytic
+signals, envelopes, cross-correlation lags) are calculated once for all
+traces along the last (time) axis and shared between misfit and adjoint
+source functions.
+
+The per-trace functions in `seisflows.plugins.preprocess.misfit` and
+`seisflows.plugins.preprocess.adjoint` are thin wrappers around this engine.
+"""
+import numpy as np
+from functools import cached_property
+from scipy import fft
+from scipy.signal import hilbert as analytic
+
+
+class BatchedTraces:
+    """
+    A stack of synthetic and observed waveforms which share the same number
+    of samples and sampling rate. Misfit and adjoint source functions are
+    defined as methods named `_misfit_{name}` and `_adjoint_{name}`, and are
+    accessed by name through `misfit()` and `adjoint()`
+
+    :type syn: np.array
+    :param syn: synthetic data array, shape (ntrace, nt), or (nt,) for a
+        single trace
+    :type obs: np.array
+    :param obs: observed data array, same shape as `syn`
+    :type dt: float
+    :param dt: time step in sec
+    :type subsample: bool
+    :param subsample: refine cross-correlation lags (and therefore traveltime
+        misfits and adjoint sources) to sub-sample precision, see `cc_lags`
+    """
+    def __init__(self, syn, obs, dt, subsample=False):
+        self.syn = np.atleast_2d(syn)
+        self.obs = np.atleast_2d(obs)
+        assert(self.syn.shape == self.obs.shape), \
+            f"synthetic and observed arrays must have the same shape"
+        self.dt = dt
+        self.subsample = subsample
+        self.ntrace, self.nt = self.syn.shape
+
+    def misfit(self, name, **kwargs):
+        """
+        Calculate the misfit of each trace
+
+        :type name: str
+        :param name: name of the misfit function, see
+            seisflows.plugins.preprocess.misfit
+        :rtype: np.array
+        :return: misfit of each trace, shape (ntrace,)
+        """
+        try:
+            func = getattr(self, f"_misfit_{name}")
+        except AttributeError:
+            raise NotImplementedError(f"misfit function '{name}' is not "
+                                      f"available for batched traces")
+        return func(**kwargs)
+
+    def adjoint(self, name, **kwargs):
+        """
+        Generate the adjoint source of each trace
+
+        :type name: str
+        :param name: name of the adjoint source function, see
+            seisflows.plugins.preprocess.adjoint
+        :rtype: np.array
+        :return: adjoint source of each trace, shape (ntrace, nt)
+        """
+        try:
+            func = getattr(self, f"_adjoint_{name}")
+        except AttributeError:
+            raise NotImplementedError(f"adjoint source function '{name}' is "
+                                      f"not available for batched traces")
+        return func(**kwargs)
+
+    @cached_property
+    def analytic_syn(self):
+        """Analytic signal of the synthetics"""
+        return analytic(self.syn, axis=-1)
+
+    @cached_property
+    def analytic_obs(self):
+        """Analytic signal of the observations"""
+        return analytic(self.obs, axis=-1)
+
+    @cached_property
+    def env_syn(self):
+        """Envelope of the synthetics"""
+        return np.abs(self.analytic_syn)
+
+    @cached_property
+    def env_obs(self):
+        """Envelope of the observations"""
+        return np.abs(self.analytic_obs)
+
+    @cached_property
+    def phase_rsd(self):
+        """Instantaneous phase difference between synthetics and observed"""
+        return np.angle(self.analytic_syn) - np.angle(self.analytic_obs)
+
+    @cached_property
+    def cc_lag(self):
+        """Cross-correlation lag (samples) of observations w.r.t synthetics"""
+        return cc_lags(self.syn, self.obs, subsample=self.subsample)
+
+    @cached_property
+    def env_cc_lag(self):
+        """Cross-correlation lag (samples) of observed w.r.t synthetic envs."""
+        return cc_lags(self.env_syn, self.env_obs, subsample=self.subsample)
+
+    def _norm(self, rsd):
+        """Time-integrated L2 norm of a residual for each trace"""
+        return np.sqrt(np.sum(rsd * rsd * self.dt, axis=-1))
+
+    def _misfit_waveform(self, **kwargs):
+        """Direct waveform differencing"""
+        return self._norm(self.syn - self.obs)
+
+    def _misfit_envelope(self, **kwargs):
+        """Waveform envelope difference from Yuan et al. 2015 Eq. 9"""
+        return self._norm(self.env_syn - self.env_obs)
+
+    def _misfit_instantaneous_phase(self, **kwargs):
+        """Instantaneous phase difference from Bozdag et al. 2011"""
+        return self._norm(self.phase_rsd)
+
+    def _misfit_traveltime(self, **kwargs):
+        """Cross-correlation traveltime"""
+        return self.cc_lag * self.dt
+
+    def _misfit_traveltime_inexact(self, **kwargs):
+        """A faster cc traveltime function but possibly innacurate"""
+        it = np.argmax(self.syn, axis=-1)
+        jt = np.argmax(self.obs, axis=-1)
+        return (jt - it) * self.dt
+
+    def _misfit_amplitude(self, **kwargs):
+        """
+        Cross-correlation amplitude difference, waveform difference after
+        aligning synthetics to observations by their cross-correlation lag
+        """
+        lag = np.rint(self.cc_lag).astype(int)
+        idx = np.arange(self.nt) - lag[:, None]
+        overlap = (idx >= 0) & (idx < self.nt)
+        syn_shifted = np.take_along_axis(self.syn, idx.clip(0, self.nt - 1),
+                                         axis=-1)
+        return self._norm(np.where(overlap, syn_shifted - self.obs, 0.))
+
+    def _misfit_envelope2(self, **kwargs):
+        """Envelope amplitude ratio from Yuan et al. 2015 Eq. B-1"""
+        raise NotImplementedError
+
+    def _misfit_envelope3(self, **kwargs):
+        """Envelope cross-correlation lag from Yuan et al. 2015, Eq. B-4"""
+        return self.env_cc_lag * self.dt
+
+    def _misfit_instantaneous_phase2(self, eps=0., **kwargs):
+        """Alterative instantaneous phase function"""
+        env_syn1 = self.env_syn + eps * self.env_syn.max(axis=-1, keepdims=True)
+        env_obs1 = self.env_obs + eps * self.env_obs.max(axis=-1, keepdims=True)
+
+        return self._norm((self.syn / env_syn1) - (self.obs / env_obs1))
+
+    def _adjoint_waveform(self, **kwargs):
+        """Waveform difference from Tromp et al 2005 Eq 9"""
+        return self.syn - self.obs
+
+    def _adjoint_envelope(self, eps=0.05, **kwargs):
+        """Waveform envelope difference from Yuan et al. 2015 Eq. 16"""
+        env_tmp = (self.env_syn - self.env_obs) / (
+                self.env_syn + eps * self.env_syn.max(axis=-1, keepdims=True))
+
+        return env_tmp * self.syn - hilbert(env_tmp * self.analytic_syn.imag)
+
+    def _adjoint_instantaneous_phase(self, eps=0.05, **kwargs):
+        """Instantaneous phase difference from Bozdag et al. 2011 Eq. 27"""
+        env_syn2 = self.env_syn ** 2.
+        env_syn2 += eps * env_syn2.max(axis=-1, keepdims=True)
+
+        wadj_1 = self.phase_rsd * self.analytic_syn.imag / env_syn2
+        wadj_2 = hilbert(self.phase_rsd * self.syn / env_syn2)
+
+        return wadj_1 + wadj_2
+
+    def _adjoint_traveltime(self, **kwargs):
+        """Cross-correlation traveltime from Tromp et al. 2005 Eq. 45"""
+        wadj = time_derivative(self.syn, self.dt)
+        wadj /= np.sum(wadj * wadj, axis=-1, keepdims=True) * self.dt
+
+        return wadj * self._misfit_traveltime()[:, None]
+
+    def _adjoint_traveltime_inexact(self, **kwargs):
+        """A faster cc traveltime function but possibly innacurate"""
+        wadj = time_derivative(self.syn, self.dt)
+        wadj /= np.sum(wadj * wadj, axis=-1, keepdims=True) * self.dt
+
+        return wadj * self._misfit_traveltime_inexact()[:, None]
+
+    def _adjoint_amplitude(self, **kwargs):
+        """Cross-correlation amplitude difference"""
+        wadj = self.syn / (np.sum(self.syn * self.syn, axis=-1,
+                                  keepdims=True) * self.dt)
+
+        return wadj * self._misfit_amplitude()[:, None]
+
+    def _adjoint_envelope2(self, **kwargs):
+        """Envelope amplitude ratio from Yuan et al. 2015 Eq. B-2"""
+        raise NotImplementedError
+
+    def _adjoint_envelope3(self, **kwargs):
+        """Envelope lag from Yuan et al. 2015 Eq. B-2, B-5"""
+        env_rat = time_derivative(self.env_syn, self.dt)
+        env_rat[:, 1:-1] /= self.env_syn[:, 1:-1]
+        env_rat *= self._misfit_envelope3()[:, None]
+
+        return -env_rat * self.syn + hilbert(env_rat * hilbert(self.env_syn))
+
+    def _adjoint_instantaneous_phase2(self, eps=0., **kwargs):
+        """Alterative instantaneous phase function"""
+        esyn, eobs = self.env_syn, self.env_obs
+        hsyn, hobs = self.analytic_syn.imag, self.analytic_obs.imag
+
+        esyn1 = esyn + eps * esyn.max(axis=-1, keepdims=True)
+        eobs1 = eobs + eps * eobs.max(axis=-1, keepdims=True)
+        esyn3 = esyn ** 3 + eps * (esyn ** 3).max(axis=-1, keepdims=True)
+
+        diff1 = (self.syn / esyn1) - (self.obs / eobs1)
+        diff2 = (hsyn / esyn1) - (hobs / eobs1)
+
+        part1 = diff1 * hsyn ** 2 / esyn3
+        part2 = diff2 * self.syn * hsyn / esyn3
+        part3 = diff1 * self.syn * hsyn / esyn3 - diff2 * self.syn ** 2 / esyn3
+
+        return part1 - part2 + hilbert(part3)
+
+    def _adjoint_displacement(self, **kwargs):
+        """Displacement waveform for migration"""
+        return self.obs
+
+    def _adjoint_velocity(self, **kwargs):
+        """Velocity waveform for migration, taking derivative of obs"""
+        return time_derivative(self.obs, self.dt)
+
+    def _adjoint_acceleration(self, **kwargs):
+        """Acceleration waveform for migration, second derivative of obs"""
+        adj = np.zeros(self.obs.shape)
+        adj[:, 1:-1] = (-self.obs[:, 2:] + 2. * self.obs[:, 1:-1] -
+                        self.obs[:, 0:-2]) / (2. * self.dt)
+        return adj
+
+
+def hilbert(w):
+    """
+    Hilbert transform (imaginary part of the analytic signal) of each trace
+    in a stack of traces
+
+    :type w: np.array
+    :param w: signal data, must be real, shape (ntrace, nt)
+    :rtype: np.array
+    :return: Hilbert transform of each trace
+    """
+    return analytic(w, axis=-1).imag
+
+
+def time_derivative(w, dt):
+    """
+    Central difference time derivative of each trace in a stack of traces.
+    The first and last samples are set to zero
+
+    :type w: np.array
+    :param w: signal data, shape (ntrace, nt)
+    :type dt: float
+    :param dt: time step in sec
+    :rtype: np.array
+    :return: time derivative of each trace
+    """
+    dwdt = np.zeros(w.shape)
+    dwdt[:, 1:-1] = (w[:, 2:] - w[:, 0:-2]) / (2. * dt)
+    return dwdt
+
+
+def cc_lags(syn, obs, subsample=False):
+    """
+    Lag (in samples) that maximizes the absolute cross-correlation of each
+    observed trace with its synthetic trace, positive if observed arrivals
+    are delayed w.r.t synthetic arrivals.
+
+    Cross-correlations for all lags are calculated at once in the frequency
+    domain, which scales as O(nt log nt) rather than the O(nt^2) of direct
+    correlation in the time domain.
+
+    :type syn: np.array
+    :param syn: synthetic data array, shape (ntrace, nt)
+    :type obs: np.array
+    :param obs: observed data array, shape (ntrace, nt)
+    :type subsample: bool
+    :param subsample: refine each lag by fitting a parabola through the
+        correlation peak and its two neighbouring samples. If False, lags are
+        whole numbers of samples
+    :rtype: np.array
+    :return: lag of each trace, shape (ntrace,). Integers if not `subsample`
+    """
+    cc = np.abs(cross_correlate(syn, obs))
+    nt = syn.shape[-1]
+    imax = np.argmax(cc, axis=-1)
+    lags = imax - nt + 1
+
+    if not subsample:
+        return lags
+
+    # Peaks at the ends of the correlation cannot be refined
+    inner = (imax > 0) & (imax < cc.shape[-1] - 1)
+    rows = np.arange(cc.shape[0])[inner]
+    y0 = cc[rows, imax[inner] - 1]
+    y1 = cc[rows, imax[inner]]
+    y2 = cc[rows, imax[inner] + 1]
+
+    lags = lags.astype(float)
+    lags[inner] += parabolic_peak(y0, y1, y2)
+
+    return lags
+
+
+def cross_correlate(syn, obs):
+    """
+    Full cross-correlation of each observed trace with its synthetic trace,
+    calculated via FFT. Equivalent to np.convolve(obs, np.flipud(syn)) for
+    each trace, i.e., index `nt - 1` is zero lag
+
+    :type syn: np.array
+    :param syn: synthetic data array, shape (ntrace, nt)
+    :type obs: np.array
+    :param obs: observed data array, shape (ntrace, nt)
+    :rtype: np.array
+    :return: cross-correlation for lags -(nt-1) to (nt-1),
+        shape (ntrace, 2 * nt - 1)
+    """
+    nt = syn.shape[-1]
+    nfft = fft.next_fast_len(2 * nt - 1, real=True)
+    cc = fft.irfft(fft.rfft(obs, n=nfft, axis=-1) *
+                   np.conj(fft.rfft(syn, n=nfft, axis=-1)), n=nfft, axis=-1)
+
+    # Circular correlation stores negative lags at the end of the array
+    return np.concatenate((cc[..., nfft - nt + 1:], cc[..., :nt]), axis=-1)
+
+
+def parabolic_peak(y0, y1, y2):
+    """
+    Offset of the vertex of a parabola through three equally spaced samples,
+    relative to the central sample. Used to locate a peak between samples
+
+    :type y0: np.array
+    :param y0: value of the sample before the peak sample
+    :type y1: np.array
+    :param y1: value of the peak sample
+    :type y2: np.array
+    :param y2: value of the sample after the peak sample
+    :rtype: np.array
+    :return: vertex offset in samples, within [-0.5, 0.5] for a peak sample
+    """
+    curvature = y0 - 2. * y1 + y2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        offset = np.where(curvature != 0, 0.5 * (y0 - y2) / curvature, 0.)
+    return offset
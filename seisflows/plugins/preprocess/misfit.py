@@ -13,9 +13,13 @@ All functions defined have four required positional arguments
     :param nt: number of time steps in the data array
     :type dt: float
     :param dt: time step in sec
+
+Functions operate on a single trace and wrap the batched engine in
+`seisflows.plugins.preprocess.batched`, which calculates misfits for many
+traces at once.
 """
-import numpy as np
-from scipy.signal import hilbert as analytic
+from seisflows.plugins.preprocess.batched import (BatchedTraces as
+                                                 _BatchedTraces)
 
 
 def waveform(syn, obs, nt, dt, *args, **kwargs):
@@ -31,9 +35,7 @@ def waveform(syn, obs, nt, dt, *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    wrsd = syn - obs
-
-    return np.sqrt(np.sum(wrsd * wrsd * dt))
+    return _BatchedTraces(syn, obs, dt).misfit("waveform")[0]
 
 
 def envelope(syn, obs, nt, dt, *args, **kwargs):
@@ -49,13 +51,7 @@ def envelope(syn, obs, nt, dt, *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    env_syn = abs(analytic(syn))
-    env_obs = abs(analytic(obs))
-
-    # Residual of envelopes
-    env_rsd = env_syn - env_obs
-
-    return np.sqrt(np.sum(env_rsd * env_rsd * dt))
+    return _BatchedTraces(syn, obs, dt).misfit("envelope")[0]
 
 
 def instantaneous_phase(syn, obs, nt, dt, *args, **kwargs):
@@ -71,20 +67,10 @@ def instantaneous_phase(syn, obs, nt, dt, *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    r = np.real(analytic(syn))
-    i = np.imag(analytic(syn))
-    phi_syn = np.arctan2(i, r)
-
-    r = np.real(analytic(obs))
-    i = np.imag(analytic(obs))
-    phi_obs = np.arctan2(i, r)
+    return _BatchedTraces(syn, obs, dt).misfit("instantaneous_phase")[0]
 
-    phi_rsd = phi_syn - phi_obs
 
-    return np.sqrt(np.sum(phi_rsd * phi_rsd * dt))
-
-
-def traveltime(syn, obs, nt, dt, *args, **kwargs):
+def traveltime(syn, obs, nt, dt, subsample=False, *args, **kwargs):
     """
     Cross-correlation traveltime 
 
@@ -96,10 +82,11 @@ def traveltime(syn, obs, nt, dt, *args, **kwargs):
     :param nt: number of time steps in the data array
     :type dt: float
     :param dt: time step in sec
+    :type subsample: bool
+    :param subsample: refine the cross-correlation lag to sub-sample precision
     """
-    cc = abs(np.convolve(obs, np.flipud(syn)))
-
-    return (np.argmax(cc) - nt + 1) * dt
+    return _BatchedTraces(syn, obs, dt, subsample=subsample).misfit(
+        "traveltime")[0]
 
 
 def traveltime_inexact(syn, obs, nt, dt, *args, **kwargs):
@@ -115,13 +102,10 @@ def traveltime_inexact(syn, obs, nt, dt, *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    it = np.argmax(syn)
-    jt = np.argmax(obs)
-
-    return (jt - it) * dt
+    return _BatchedTraces(syn, obs, dt).misfit("traveltime_inexact")[0]
 
 
-def amplitude(syn, obs, nt, dt, *args, **kwargs):
+def amplitude(syn, obs, nt, dt, subsample=False, *args, **kwargs):
     """
     Cross-correlation amplitude difference
 
@@ -133,15 +117,11 @@ def amplitude(syn, obs, nt, dt, *args, **kwargs):
     :param nt: number of time steps in the data array
     :type dt: float
     :param dt: time step in sec
+    :type subsample: bool
+    :param subsample: refine the cross-correlation lag to sub-sample precision
     """
-    ioff = (np.argmax(cc) - nt + 1) * dt
-
-    if ioff <= 0:
-        wrsd = syn[ioff:] - obs[:-ioff]
-    else:
-        wrsd = syn[:-ioff] - obs[ioff:]
-
-    return np.sqrt(np.sum(wrsd * wrsd * dt))
+    return _BatchedTraces(syn, obs, dt, subsample=subsample).misfit(
+        "amplitude")[0]
 
 
 def envelope2(syn, obs, nt, dt, *args, **kwargs):
@@ -157,10 +137,7 @@ def envelope2(syn, obs, nt, dt, *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    env_syn = abs(analytic(syn))
-    env_obs = abs(analytic(obs))
-
-    raise NotImplementedError
+    return _BatchedTraces(syn, obs, dt).misfit("envelope2")[0]
 
 
 def envelope3(syn, obs, nt, dt, eps=0., *args, **kwargs):
@@ -176,10 +153,7 @@ def envelope3(syn, obs, nt, dt, eps=0., *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    env_syn = abs(analytic(syn))
-    env_obs = abs(analytic(obs))
-
-    return Traveltime(env_syn, env_obs, nt, dt)
+    return _BatchedTraces(syn, obs, dt).misfit("envelope3", eps=eps)[0]
 
 
 def instantaneous_phase2(syn, obs, nt, dt, eps=0., *args, **kwargs):
@@ -195,15 +169,8 @@ def instantaneous_phase2(syn, obs, nt, dt, eps=0., *args, **kwargs):
     :type dt: float
     :param dt: time step in sec
     """
-    env_syn = abs(analytic(syn))
-    env_obs = abs(analytic(obs))
-
-    env_syn1 = env_syn + eps * max(env_syn)
-    env_obs1 = env_obs + eps * max(env_obs)
-
-    diff = (syn / env_syn1) - (obs / env_obs1)
-
-    return np.sqrt(np.sum(diff * diff * dt))
+    return _BatchedTraces(syn, obs, dt).misfit("instantaneous_phase2",
+                                              eps=eps)[0]
 
 
 def displacement(*args, **kwargs):
@@ -216,4 +183,3 @@ def velocity(*args, **kwargs):
 
 def acceleration(*args, **kwargs):
     return Exception("This function can only used for migration.")
-
@@ -6,7 +6,10 @@ seismic data, apply preprocessing such as filtering, quantify misfit,
 and write adjoint sources that are expected by the solver.
 """
 import os
+import re
+import hashlib
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from glob import glob
 from obspy import read as obspy_read
 from obspy import Stream, Trace, UTCDateTime
@@ -17,6 +20,7 @@ from seisflows.tools.config import Dict, get_task_id
 
 from seisflows.plugins.preprocess import misfit as misfit_functions
 from seisflows.plugins.preprocess import adjoint as adjoint_sources
+from seisflows.plugins.preprocess.batched import BatchedTraces
 
 
 class Default:
@@ -78,6 +82,26 @@ class Default:
         LATE: mute late arrivals;
         SHORT: mute short source-receiver distances;
         LONG: mute long source-receiver distances
+    :type subsample_cc_lag: bool
+    :param subsample_cc_lag: refine cross-correlation lags used by the
+        'traveltime', 'amplitude' and 'envelope3' misfits and adjoint sources
+        to sub-sample precision, by fitting a parabola to the correlation peak
+    :type ascii_cache: bool
+    :param ascii_cache: cache observed ASCII waveforms as hidden binary
+        sidecar files next to each waveform file, so that each file is only
+        parsed once over the course of a workflow. Sidecar files are ignored
+        (and rewritten) if they are older than the waveform file
+    :type obs_cache: bool
+    :param obs_cache: cache processed (filtered, muted, normalized) observed
+        waveforms of each source in one binary file in the preprocess scratch
+        directory, so that observed data are read and processed only once
+        per source. The cache is rebuilt whenever preprocessing parameters or
+        observed waveform files change
+    :type parallel: bool
+    :param parallel: quantify misfit and write adjoint sources for the
+        traces of each source in parallel, on a pool of worker processes
+        sized by the number of cores available to each task (`nproc`).
+        Residuals are written in the same order as in serial
 
     Paths
     -----
@@ -92,6 +116,8 @@ class Default:
                  min_period=None, max_period=None, min_freq=None, max_freq=None,
                  mute=None, early_slope=None, early_const=None, late_slope=None,
                  late_const=None, short_dist=None, long_dist=None,
+                 subsample_cc_lag=False, ascii_cache=False, obs_cache=False,
+                 parallel=False, nproc=1,
                  workdir=os.getcwd(), path_preprocess=None, path_solver=None,
                  **kwargs):
         """
@@ -104,6 +130,9 @@ class Default:
         :type syn_data_format: str
         :param syn_data_format: data format for reading synthetic traces into
             memory. Shared with solver module. Available formats: 'su', 'ascii'
+        :type nproc: int
+        :param nproc: number of cores available to each task, used to size
+            the worker pool when `parallel`. Shared with solver module
         :type workdir: str
         :param workdir: working directory in which to look for data and store
         results. Defaults to current working directory
@@ -134,11 +163,17 @@ class Default:
         self.short_dist = short_dist
         self.long_dist = long_dist
 
+        self.subsample_cc_lag = subsample_cc_lag
+        self.ascii_cache = ascii_cache
+        self.obs_cache = obs_cache
+        self.parallel = parallel
+
         self.path = Dict(
             scratch=path_preprocess or os.path.join(workdir, "scratch",
                                                     "preprocess"),
             solver=path_solver or os.path.join(workdir, "scratch", "solver")
         )
+        self.path["_obs_cache"] = os.path.join(self.path.scratch, "obs_cache")
 
         # The list <_obs_acceptable_data_formats> always includes
         # <_syn_acceptable_data_formats> in addition to more formats
@@ -154,6 +189,13 @@ class Default:
         self._acceptable_adjsrcs = [_ for _ in dir(adjoint_sources)
                                     if not _.startswith("_")]
 
+        # Parameters set by other modules. Keep hidden so `seisflows configure`
+        # doesn't attribute these to preprocess
+        self._nproc = nproc
+        # Maximum number of waveform files whose traces are stacked together
+        # for batched misfit calculation, bounds memory use per process
+        self._group_size = 500
+
         # Internal attributes used to keep track of inversion workflows
         self._iteration = None
         self._step_count = None
@@ -245,6 +287,10 @@ class Default:
         assert(self.unit_output.upper() in self._acceptable_unit_output), \
             f"unit output must be in {self._acceptable_unit_output}"
 
+        if self.parallel:
+            assert(self._nproc >= 1), \
+                f"parallel preprocessing requires `nproc` >= 1"
+
     def setup(self):
         """
         Sets up data preprocessing machinery by dynamicalyl loading the
@@ -253,7 +299,7 @@ class Default:
         """
         unix.mkdir(self.path.scratch)
 
-    def read(self, fid, data_format):
+    def read(self, fid, data_format, cache=False):
         """
         Waveform reading functionality. Imports waveforms as Obspy streams
 
@@ -261,6 +307,9 @@ class Default:
         :param fid: path to file to read data from
         :type data_format: str
         :param data_format: format of the file to read data from
+        :type cache: bool
+        :param cache: cache ASCII data as a binary sidecar file, see
+            `read_ascii`
         :rtype: obspy.core.stream.Stream
         :return: ObsPy stream containing data stored in `fid`
         """
@@ -270,7 +319,7 @@ class Default:
         elif data_format.upper() == "SAC":
             st = obspy_read(fid, format="SAC")
         elif data_format.upper() == "ASCII":
-            st = read_ascii(fid)
+            st = read_ascii(fid, cache=cache)
         return st
 
     def write(self, st, fid):
@@ -304,20 +353,6 @@ class Default:
                 data_out = np.vstack((tr.times() + time_offset, tr.data)).T
                 np.savetxt(fid, data_out, ["%13.7f", "%17.7f"])
 
-    def _calculate_misfit(self, **kwargs):
-        """Wrapper for plugins.preprocess.misfit misfit/objective function"""
-        if self.misfit is not None:
-            return getattr(misfit_functions, self.misfit)(**kwargs)
-        else:
-            return None
-
-    def _generate_adjsrc(self, **kwargs):
-        """Wrapper for plugins.preprocess.adjoint source/backproject function"""
-        if self.adjoint is not None:
-            return getattr(adjoint_sources, self.adjoint)(**kwargs)
-        else:
-            return None
-
     def initialize_adjoint_traces(self, data_filenames, output,
                                   data_format=None):
         """
@@ -406,18 +441,28 @@ class Default:
 
         return fid
 
-    def _setup_quantify_misfit(self, source_name):
+    def _setup_quantify_misfit(self, source_name, syn_path=None):
         """
         Gather waveforms from the Solver scratch directory which will be used
         for generating adjoint sources
+
+        :type source_name: str
+        :param source_name: name of the event to gather waveforms for
+        :type syn_path: str
+        :param syn_path: optional directory of synthetic waveforms, defaults
+            to the 'traces/syn' directory of the source in `path.solver`
         """
         source_name = source_name or self._source_names[get_task_id()]
 
         obs_path = os.path.join(self.path.solver, source_name, "traces", "obs")
-        syn_path = os.path.join(self.path.solver, source_name, "traces", "syn")
+        syn_path = syn_path or \
+            os.path.join(self.path.solver, source_name, "traces", "syn")
 
-        observed = sorted(os.listdir(obs_path))
-        synthetic = sorted(os.listdir(syn_path))
+        # Ignore hidden files, e.g., binary sidecar files from `read_ascii`
+        observed = sorted(_ for _ in os.listdir(obs_path)
+                          if not _.startswith("."))
+        synthetic = sorted(_ for _ in os.listdir(syn_path)
+                           if not _.startswith("."))
 
         assert(len(observed) != 0 and len(synthetic) != 0), \
             f"cannot quantify misfit, missing observed or synthetic traces"
@@ -479,7 +524,7 @@ class Default:
 
     def quantify_misfit(self, source_name=None, save_residuals=None,
                         export_residuals=None, save_adjsrcs=None, iteration=1,
-                        step_count=0, **kwargs):
+                        step_count=0, syn_path=None, **kwargs):
         """
         Prepares solver for gradient evaluation by writing residuals and
         adjoint traces. Meant to be called by solver.eval_func().
@@ -488,7 +533,14 @@ class Default:
         preprocessing, assesses misfit, and writes out adjoint sources and
         STATIONS_ADJOINT file.
 
-        TODO use concurrent futures to parallelize this
+        Traces are processed in contiguous groups of waveform files, see
+        `quantify_misfit_traces`. If `parallel`, groups are distributed over a
+        pool of `nproc` worker processes, each of which writes its own adjoint
+        sources. Residuals are collected and written in the order of the
+        (sorted) traces, so that the residuals file does not depend on the
+        number of workers. If `obs_cache`, processed observed data are read
+        from (or first written to) the source's cache file, see
+        `load_processed_observed`.
 
         :type source_name: str
         :param source_name: name of the event to quantify misfit for. If not
@@ -506,50 +558,56 @@ class Default:
         :param step_count: current step count of the line search. Information
             should be provided by the `optimize` module if we are running an
             inversion. Defaults to 0 if not given (1st evaluation)
+        :type syn_path: str
+        :param syn_path: optional directory of synthetic waveforms, e.g., of
+            a solver working directory other than that of the source in
+            `path.solver`. Observed waveforms are always read from the latter
         """
-        observed, synthetic = self._setup_quantify_misfit(source_name)
-
-        for obs_fid, syn_fid in zip(observed, synthetic):
-            obs = self.read(fid=obs_fid, data_format=self.obs_data_format)
-            syn = self.read(fid=syn_fid, data_format=self.syn_data_format)
-
-            # Process observations and synthetics identically
-            if self.filter:
-                obs = self._apply_filter(obs)
-                syn = self._apply_filter(syn)
-            if self.mute:
-                obs = self._apply_mute(obs)
-                syn = self._apply_mute(syn)
-            if self.normalize:
-                obs = self._apply_normalize(obs)
-                syn = self._apply_normalize(syn)
-
-            # Write the residuals/misfit and adjoint sources for each component
-            for tr_obs, tr_syn in zip(obs, syn):
-                # Simple check to make sure zip retains ordering
-                assert(tr_obs.stats.component == tr_syn.stats.component)
-                # Calculate the misfit value and write to file
-                if save_residuals and self._calculate_misfit:
-                    residual = self._calculate_misfit(
-                        obs=tr_obs.data, syn=tr_syn.data,
-                        nt=tr_syn.stats.npts, dt=tr_syn.stats.delta
-                    )
-                    with open(save_residuals, "a") as f:
+        source_name = source_name or self._source_names[get_task_id()]
+        observed, synthetic = self._setup_quantify_misfit(source_name,
+                                                          syn_path=syn_path)
+
+        # Split waveform files into contiguous groups, at least one per worker
+        nfile = len(observed)
+        max_workers = min(self._nproc, nfile) if self.parallel else 1
+        ngroup = max(max_workers, int(np.ceil(nfile / self._group_size)))
+        groups = np.array_split(np.arange(nfile), ngroup)
+
+        if max_workers > 1:
+            logger.debug(f"quantifying misfit for {nfile} traces with "
+                         f"{max_workers} processes")
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+            map_ = executor.map  # returns results in the order of the inputs
+        else:
+            executor = None
+            map_ = map
+
+        try:
+            if self.obs_cache:
+                obs_data = self.load_processed_observed(source_name, observed,
+                                                        map_=map_)
+                obs_data = [[obs_data[i] for i in idx] for idx in groups]
+            else:
+                obs_data = [None] * ngroup
+
+            # Arguments for `quantify_misfit_traces`, one entry per group
+            args = ([[observed[i] for i in idx] for idx in groups],
+                    [[synthetic[i] for i in idx] for idx in groups],
+                    [bool(save_residuals)] * ngroup, [save_adjsrcs] * ngroup,
+                    obs_data)
+            residuals = list(map_(self.quantify_misfit_traces, *args))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        # Write all residuals/misfit at once, ordered by trace and component
+        if save_residuals and self.misfit:
+            with open(save_residuals, "a") as f:
+                for residuals_group in residuals:
+                    for residual in residuals_group:
                         f.write(f"{residual:.2E}\n")
 
-                # Generate an adjoint source trace, write to file
-                if save_adjsrcs and self._generate_adjsrc:
-                    adjsrc = tr_syn.copy()
-                    adjsrc.data = self._generate_adjsrc(
-                        obs=tr_obs.data, syn=tr_syn.data,
-                        nt=tr_syn.stats.npts, dt=tr_syn.stats.delta
-                    )
-                    adjsrc = Stream(adjsrc)
-                    fid = os.path.basename(syn_fid)
-                    fid = self._rename_as_adjoint_source(fid)
-                    self.write(st=adjsrc, fid=os.path.join(save_adjsrcs, fid))
-
-        if save_adjsrcs and self._generate_adjsrc:
+        if save_adjsrcs and self.adjoint:
             self._check_adjoint_traces(source_name, save_adjsrcs, synthetic)
 
         # Exporting residuals to disk (output/) for more permanent storage
@@ -558,6 +616,228 @@ class Default:
                 unix.mkdir(export_residuals)
             unix.cp(src=save_residuals, dst=export_residuals)
 
+    def quantify_misfit_traces(self, observed, synthetic, save_residuals=False,
+                               save_adjsrcs=None, obs_data=None):
+        """
+        Read in, and identically process, a group of observed and synthetic
+        waveform files. Traces are then stacked into (ntrace, nt) arrays so
+        that the misfits and adjoint sources of all components are calculated
+        in one vectorized pass (see seisflows.plugins.preprocess.batched), and
+        adjoint sources are written out per synthetic file. Self-contained so
+        that groups may be run on separate processes by `quantify_misfit`
+
+        :type observed: list of str
+        :param observed: paths to the observed waveform files
+        :type synthetic: list of str
+        :param synthetic: paths to the matching synthetic waveform files
+        :type save_residuals: bool
+        :param save_residuals: calculate and return the misfit of each
+            component
+        :type save_adjsrcs: str
+        :param save_adjsrcs: if not None, path to write adjoint sources to
+        :type obs_data: list
+        :param obs_data: already processed observed data, one entry per file
+            as returned by `read_processed_observed`. If None, observed
+            waveform files are read and processed here
+        :rtype: list of float
+        :return: residual of each component of each file, in order. Empty if
+            not `save_residuals`
+        """
+        if obs_data is None:
+            obs_data = [self.read_processed_observed(fid) for fid in observed]
+
+        obs_traces, syn_traces, syn_fids = [], [], []
+        for obs, syn_fid in zip(obs_data, synthetic):
+            # Process synthetics identically to observations
+            syn = self.read(fid=syn_fid, data_format=self.syn_data_format)
+            syn = self._apply_processing(syn)
+
+            for (component, data), tr_syn in zip(obs, syn):
+                # Simple check to make sure zip retains ordering
+                assert(component == tr_syn.stats.component)
+                obs_traces.append(data)
+                syn_traces.append(tr_syn)
+                syn_fids.append(syn_fid)
+
+        # Only traces with the same length and sampling rate can be stacked
+        stacks = {}
+        for i, tr in enumerate(syn_traces):
+            stacks.setdefault((tr.stats.npts, tr.stats.delta), []).append(i)
+
+        residuals = np.zeros(len(syn_traces))
+        adjsrcs = [None] * len(syn_traces)
+        for (npts, delta), idx in stacks.items():
+            traces = BatchedTraces(
+                syn=np.array([syn_traces[i].data for i in idx]),
+                obs=np.array([obs_traces[i] for i in idx]), dt=delta,
+                subsample=self.subsample_cc_lag
+            )
+            if save_residuals and self.misfit:
+                residuals[idx] = traces.misfit(self.misfit)
+            if save_adjsrcs and self.adjoint:
+                for i, data in zip(idx, traces.adjoint(self.adjoint)):
+                    adjsrcs[i] = syn_traces[i].copy()
+                    adjsrcs[i].data = data
+
+        # Write adjoint sources, one file per synthetic file
+        if save_adjsrcs and self.adjoint:
+            streams = {}
+            for syn_fid, adjsrc in zip(syn_fids, adjsrcs):
+                streams.setdefault(syn_fid, Stream()).append(adjsrc)
+            for syn_fid, st in streams.items():
+                fid = self._rename_as_adjoint_source(os.path.basename(syn_fid))
+                self.write(st=st, fid=os.path.join(save_adjsrcs, fid))
+
+        if save_residuals and self.misfit:
+            return residuals.tolist()
+        else:
+            return []
+
+    def read_processed_observed(self, fid):
+        """
+        Read in and process one observed waveform file
+
+        :type fid: str
+        :param fid: path to the observed waveform file
+        :rtype: list of tuple
+        :return: (component, data) of each trace in the file
+        """
+        obs = self.read(fid=fid, data_format=self.obs_data_format,
+                        cache=self.ascii_cache)
+        obs = self._apply_processing(obs)
+
+        return [(tr.stats.component, tr.data) for tr in obs]
+
+    def load_processed_observed(self, source_name, observed, map_=map):
+        """
+        Load the processed observed data of a source from its cache file,
+        which stores all traces of the source in one binary .npz file. If the
+        cache file does not exist or is stale, observed data are read in and
+        processed, and the cache file is (re)written.
+
+        The cache is keyed by a hash of all parameters that affect processing
+        and the name, size and modification time of each observed waveform
+        file, so that changing either invalidates the cache.
+
+        :type source_name: str
+        :param source_name: name of the event whose data are cached
+        :type observed: list of str
+        :param observed: paths to the observed waveform files
+        :type map_: function
+        :param map_: map function used to read and process observed data,
+            e.g., Executor.map() to process files in parallel. Must preserve
+            the order of the inputs
+        :rtype: list
+        :return: processed observed data, one entry per file as returned by
+            `read_processed_observed`
+        """
+        cache_file = os.path.join(self.path._obs_cache, f"{source_name}.npz")
+        key = self._processed_observed_key(observed)
+
+        try:
+            with np.load(cache_file) as cache:
+                if str(cache["key"]) == key:
+                    data = np.split(cache["data"],
+                                    np.cumsum(cache["npts"])[:-1])
+                    traces = list(zip(cache["components"].tolist(), data))
+                    ntraces = cache["ntrace"].tolist()
+                    ends = np.cumsum(ntraces).tolist()
+                    return [traces[end - ntrace:end]
+                            for ntrace, end in zip(ntraces, ends)]
+        except (OSError, KeyError, ValueError):
+            pass
+
+        logger.debug(f"caching processed observed data for {source_name}")
+        obs_data = list(map_(self.read_processed_observed, observed))
+
+        traces = [trace for obs in obs_data for trace in obs]
+        unix.mkdir(self.path._obs_cache)
+        # Write to a temporary file first so that readers never see a partial
+        # file, e.g., when line search candidates share a source
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "wb") as f:
+            np.savez(f, key=key,
+                     data=np.concatenate([data for _, data in traces]),
+                     npts=[len(data) for _, data in traces],
+                     components=[component for component, _ in traces],
+                     ntrace=[len(obs) for obs in obs_data])
+        os.replace(tmp_file, cache_file)
+
+        return obs_data
+
+    def _processed_observed_key(self, observed):
+        """
+        Hash of the preprocessing parameters and observed waveform files
+        which together determine processed observed data
+
+        :type observed: list of str
+        :param observed: paths to the observed waveform files
+        :rtype: str
+        :return: hexadecimal hash
+        """
+        parameters = [self.obs_data_format, self.filter, self.min_freq,
+                      self.max_freq, sorted(_.upper() for _ in self.mute),
+                      self.early_slope, self.early_const, self.late_slope,
+                      self.late_const, self.short_dist, self.long_dist,
+                      sorted(_.upper() for _ in self.normalize)]
+        files = []
+        for fid in observed:
+            stat = os.stat(fid)
+            files.append([os.path.basename(fid), stat.st_size,
+                          stat.st_mtime_ns])
+
+        return hashlib.sha1(repr([parameters, files]).encode()).hexdigest()
+
+    def encode_observed_data(self, source_name, encoding):
+        """
+        Build encoded observed data for a supershot, i.e., a simulation of
+        several sources at once (see `solver.set_source_encoding`), by summing
+        the observed data of each of its sources with the source's polarity
+        and time shift applied. Encoded data are written to the observed
+        data directory of the supershot.
+
+        .. note::
+            Observed data of each source must already be prepared in the
+            source's solver directory. Filtering is linear and so can be applied
+            to encoded data as usual, whereas muting and normalization will act
+            on the encoded, rather than individual, traces
+
+        :type source_name: str
+        :param source_name: name of the supershot to build encoded data for
+        :type encoding: list of tuple
+        :param encoding: (source name, polarity, time shift in seconds) of
+            each source encoded in the supershot
+        """
+        # Encoded data are written in the format that the synthetics are read
+        assert(self.obs_data_format == self.syn_data_format), (
+            f"encoded observed data require `obs_data_format` to match "
+            f"`syn_data_format`"
+        )
+        encoded = {}
+        for name, polarity, shift in encoding:
+            obs_path = os.path.join(self.path.solver, name, "traces", "obs")
+            for fid in sorted(glob(os.path.join(obs_path, "*"))):
+                st = self.read(fid=fid, data_format=self.obs_data_format)
+                for tr in st:
+                    nshift = min(int(round(shift / tr.stats.delta)),
+                                 tr.stats.npts)
+                    data = np.zeros(tr.stats.npts)
+                    data[nshift:] = polarity * tr.data[:tr.stats.npts - nshift]
+                    tr.data = data
+                fid = os.path.basename(fid)
+                if fid in encoded:
+                    for tr_enc, tr in zip(encoded[fid], st):
+                        tr_enc.data += tr.data
+                else:
+                    encoded[fid] = st
+
+        assert(encoded), f"no observed data found to encode {source_name}"
+
+        obs_path = os.path.join(self.path.solver, source_name, "traces", "obs")
+        unix.mkdir(obs_path)
+        for fid, st in encoded.items():
+            self.write(st=st, fid=os.path.join(obs_path, fid))
+
     def finalize(self):
         """Teardown procedures for the default preprocessing class"""
         pass
@@ -575,6 +855,25 @@ class Default:
         """
         return np.sum(residuals ** 2.)
 
+    def _apply_processing(self, st):
+        """
+        Apply the optional filter, mute and normalization, in that order, to
+        waveform data. Observed and synthetic data are processed identically
+
+        :type st: obspy.core.stream.Stream
+        :param st: stream to be processed
+        :rtype: obspy.core.stream.Stream
+        :return: processed stream
+        """
+        if self.filter:
+            st = self._apply_filter(st)
+        if self.mute:
+            st = self._apply_mute(st)
+        if self.normalize:
+            st = self._apply_normalize(st)
+
+        return st
+
     def _apply_filter(self, st):
         """
         Apply a filter to waveform data using ObsPy
@@ -675,36 +974,43 @@ class Default:
         return st_out
 
 
-def read_ascii(fid, origintime=None):
+def read_ascii(fid, origintime=None, cache=False):
     """
-    Read waveforms in two-column ASCII format. This is copied directly from
-    pyatoa.utils.read.read_sem()
+    Read waveforms in two-column ASCII format. This is adapted from
+    pyatoa.utils.read.read_sem(). Both columns are parsed in a single pass.
+
+    .. note::
+        Parsing text is slow, so if `cache`, parsed data are cached as a
+        hidden binary sidecar file (e.g., .AA.S000000.BXY.semd.npy) which is
+        read instead for as long as it is newer than the ASCII file
+
+    :type fid: str
+    :param fid: full path to the ASCII waveform file to read
+    :type origintime: obspy.UTCDateTime
+    :param origintime: reference time that the first column is relative to.
+        Defaults to 1970-01-01T00:00:00
+    :type cache: bool
+    :param cache: read from and write to the binary sidecar file
+    :rtype: obspy.core.stream.Stream
+    :return: Stream containing a single trace
     """
-    try:
-        times = np.loadtxt(fname=fid, usecols=0)
-        data = np.loadtxt(fname=fid, usecols=1)
-
-    # At some point in 2018, the Specfem developers changed how the ascii files
-    # were formatted from two columns to comma separated values, and repeat
-    # values represented as 2*value_float where value_float represents the data
-    # value as a float
-    except ValueError:
-        times, data = [], []
-        with open(fid, 'r') as f:
-            lines = f.readlines()
-        for line in lines:
+    path, fname = os.path.split(fid)
+    cache_file = os.path.join(path, f".{fname}.npy")
+    times, data = None, None
+    if cache:
+        try:
+            if os.stat(cache_file).st_mtime_ns >= os.stat(fid).st_mtime_ns:
+                times, data = np.load(cache_file)
+        except (OSError, ValueError):
+            pass
+
+    if data is None:
+        times, data = _parse_ascii_columns(fid)
+        if cache:
             try:
-                time_, data_ = line.strip().split(',')
-            except ValueError:
-                if "*" in line:
-                    time_ = data_ = line.split('*')[-1]
-                else:
-                    raise ValueError
-            times.append(float(time_))
-            data.append(float(data_))
-
-        times = np.array(times)
-        data = np.array(data)
+                np.save(cache_file, np.vstack((times, data)))
+            except OSError as e:
+                logger.debug(f"could not cache ASCII waveform {fid}: {e}")
 
     if origintime is None:
         origintime = UTCDateTime("1970-01-01T00:00:00")
@@ -726,3 +1032,34 @@ def read_ascii(fid, origintime=None):
     st = Stream([Trace(data=data, header=stats)])
 
     return st
+
+
+def _parse_ascii_columns(fid):
+    """
+    Parse the two columns of an ASCII waveform file in one pass over the
+    file. Handles both whitespace separated columns and the comma separated
+    format which SPECFEM writes since 2018, where equal values in both
+    columns are written as a repeat count (e.g., '2*0.0' for '0.0,0.0')
+
+    :type fid: str
+    :param fid: full path to the ASCII waveform file to read
+    :rtype: tuple of np.array
+    :return: (times, data)
+    :raises ValueError: if the file is not made up of two numeric columns
+    """
+    with open(fid, "rb") as f:
+        text = f.read()
+
+    if b"," in text or b"*" in text:
+        text = re.sub(rb"\b2\*([^\s,]+)", rb"\1 \1", text)
+        text = text.replace(b",", b" ")
+
+    # Tokenize and convert all values at once, raises ValueError on bad values
+    values = np.array(text.split(), dtype=float)
+
+    if values.size % 2:
+        raise ValueError(f"{fid} does not contain two columns of values")
+
+    times, data = values.reshape(-1, 2).T
+
+    return times, np.ascontiguousarray(data)
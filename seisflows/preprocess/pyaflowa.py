@@ -302,7 +302,7 @@ class Pyaflowa:
 
     def quantify_misfit(self, source_name=None, save_residuals=None,
                         export_residuals=None, save_adjsrcs=None, iteration=1,
-                        step_count=0, parallel=False, **kwargs):
+                        step_count=0, parallel=False, syn_path=None, **kwargs):
         """
         Main processing function to be called by Workflow module. Generates
         total misfit and adjoint sources for a given event with name 
@@ -329,9 +329,13 @@ class Pyaflowa:
         :param step_count: current step count of the line search. Information
             should be provided by the `optimize` module if we are running an
             inversion. Defaults to 0 if not given (1st evaluation)
+        :type syn_path: str
+        :param syn_path: optional directory of synthetic waveforms, see
+            `set_config`
         """
         # Generate an event/evaluation specific config object to control Pyatoa
-        config = self.set_config(source_name, iteration, step_count)
+        config = self.set_config(source_name, iteration, step_count,
+                                 syn_path=syn_path)
 
         # Run misfit quantification for ALL stations and this given event
         misfit, nwin = 0, 0
@@ -381,7 +385,8 @@ class Pyaflowa:
             )
         self._collect_tmp_log_files(pyatoa_logger, config.event_id)
 
-    def set_config(self, source_name=None, iteration=1, step_count=0):
+    def set_config(self, source_name=None, iteration=1, step_count=0,
+                   syn_path=None):
         """
         Create an event-specific Config object which contains information about
         the current event, and position in the workflow evaluation. Also
@@ -400,6 +405,9 @@ class Pyaflowa:
         :param step_count: current step count of the line search. Information
             should be provided by the `optimize` module if we are running an
             inversion. Defaults to 0 if not given (1st evaluation)
+        :type syn_path: str
+        :param syn_path: optional directory of synthetic waveforms, defaults
+            to the 'traces/syn' directory of the source in `path.solver`
         :rtype: pyatoa.core.config.Config
         :return: Config object that is specifically crafted for a given event
             that can be directly fed to the Manager for misfit quantification
@@ -419,7 +427,8 @@ class Pyaflowa:
         obs_path = os.path.join(self.path.solver, source_name, "traces", "obs")
         config.paths["waveforms"].append(obs_path)
 
-        syn_path = os.path.join(self.path.solver, source_name, "traces", "syn")
+        syn_path = syn_path or \
+            os.path.join(self.path.solver, source_name, "traces", "syn")
         config.paths["synthetics"].append(syn_path)
 
         return config
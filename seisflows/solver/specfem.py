@@ -80,6 +80,11 @@ class Specfem:
     :type mpiexec: str
     :param mpiexec: MPI executable used to run parallel processes. Should also
         be defined for the system module
+    :type model_io_workers: int
+    :param model_io_workers: number of threads used by the workflow to read
+        and write the processor files of models, kernels and gradients.
+        Useful on parallel filesystems where per-file latency dominates, on
+        a local disk serial I/O is usually as fast. Set 1 for serial I/O
 
     Paths
     -----
@@ -97,7 +102,8 @@ class Specfem:
     def __init__(self, syn_data_format="ascii",  materials="acoustic",
                  density=False, nproc=1, ntask=1, attenuation=False,
                  smooth_h=0., smooth_v=0., components=None,
-                 source_prefix=None, mpiexec=None, workdir=os.getcwd(),
+                 source_prefix=None, mpiexec=None, model_io_workers=1,
+                 workdir=os.getcwd(),
                  path_solver=None, path_eval_grad=None,
                  path_data=None, path_specfem_bin=None, path_specfem_data=None,
                  path_model_init=None, path_model_true=None, path_output=None,
@@ -135,6 +141,7 @@ class Specfem:
         self.smooth_v = smooth_v
         self.components = components
         self.source_prefix = source_prefix or "SOURCE"
+        self.model_io_workers = model_io_workers
 
         # Define internally used directory structure
         self.path = Dict(
@@ -157,6 +164,7 @@ class Specfem:
 
         self._mpiexec = mpiexec
         self._source_names = None  # for property source_names
+        self._source_batch = None  # optional subset, see set_source_batch()
         self._ext = ""  # for database file extensions
 
         # Define available choices for check parameters
@@ -181,6 +189,9 @@ class Specfem:
         assert(self.materials.upper() in self._available_materials), \
             f"solver.materials must be in {self._available_materials}"
 
+        assert(self.model_io_workers >= 1), \
+            f"solver.model_io_workers must be >= 1"
+
         if self.syn_data_format.upper() not in self._syn_available_data_formats:
             raise NotImplementedError(
                 f"solver.syn_data_format must be "
@@ -281,6 +292,10 @@ class Specfem:
             Dependent on environment variable 'SEISFLOWS_TASKID' which is
             assigned by system.run() to each individually running process.
 
+        .. note::
+            If a batch of sources has been set with `set_source_batch`, only
+            the sources in the batch are returned
+
         :rtype: list
         :return: list of source names
         """
@@ -289,8 +304,31 @@ class Specfem:
                 path_specfem_data=self.path.specfem_data,
                 source_prefix=self.source_prefix, ntask=self.ntask
             )
+        if self._source_batch is not None:
+            return self._source_batch
         return self._source_names
 
+    def set_source_batch(self, source_names=None):
+        """
+        Restrict the sources considered by the solver to a subset (batch) of
+        all available sources, e.g., for mini-batch inversions. Task ids are
+        then assigned to sources within the batch, and kernels are only
+        combined for sources in the batch.
+
+        :type source_names: list of str
+        :param source_names: names of the sources in the batch, must be a
+            subset of all available sources. If None, resets the solver to
+            consider all available sources
+        """
+        self._source_batch = None
+        if source_names is not None:
+            for source_name in source_names:
+                assert(source_name in self.source_names), (
+                    f"source batch name '{source_name}' is not one of the "
+                    f"available sources"
+                )
+            self._source_batch = list(source_names)
+
     @property
     def source_name(self):
         """
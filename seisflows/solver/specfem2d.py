@@ -8,11 +8,13 @@ TODO
     Internal paramater f0 is not currently used. Can we remove or integrate?
 """
 import os
+import numpy as np
 from glob import glob
 
+from seisflows import logger
 from seisflows.solver.specfem import Specfem
 from seisflows.tools import unix
-from seisflows.tools.specfem import getpar, setpar
+from seisflows.tools.specfem import getpar, setpar, fortran_float
 
 
 class Specfem2D(Specfem):
@@ -41,6 +43,8 @@ class Specfem2D(Specfem):
 
         self.multiples = multiples
         self._f0 = None
+        # Supershot name -> list of (source name, polarity, time shift)
+        self._source_encoding = None
 
         # Define parameters based on material type
         if self.materials.upper() == "ACOUSTIC":
@@ -68,6 +72,119 @@ class Specfem2D(Specfem):
         # Copy in coordinate files to the Model definition so we can plot
         self._export_starting_models(parameters=["x", "z"])
 
+    @property
+    def source_names(self):
+        """
+        Returns list of source names, or the names of the supershots if the
+        sources have been encoded with `set_source_encoding`
+
+        :rtype: list
+        :return: list of source or supershot names
+        """
+        if self._source_encoding is not None:
+            return list(self._source_encoding)
+        return super().source_names
+
+    @property
+    def source_encoding(self):
+        """
+        Encoding of the sources into supershots, set by `set_source_encoding`
+
+        :rtype: dict or None
+        :return: supershot names as keys, each a list of the encoded sources
+            as tuples of (source name, polarity, time shift in seconds). None
+            if sources are not encoded
+        """
+        return self._source_encoding
+
+    def set_source_encoding(self, nsupershot=None, max_shift=0., seed=None):
+        """
+        Encode all sources into `nsupershot` supershots, each simulating a
+        random group of sources at once. Every source is given a random
+        polarity (+/-1) and a random time shift between 0 and `max_shift`,
+        rounded to the simulation time step `DT`. Supershots are then
+        considered by the solver in place of the sources (`source_names`).
+
+        Each supershot is run in its own working directory, where
+        DATA/SOURCE holds all of its encoded sources and `NSOURCES` in the
+        Par_file is set accordingly. Encoded observed data must be built
+        separately (see `preprocess.encode_observed_data`).
+
+        :type nsupershot: int
+        :param nsupershot: number of supershots to encode sources into. If
+            None, removes any encoding so that each source is run separately
+        :type max_shift: float
+        :param max_shift: maximum random time shift of a source, in seconds.
+            If 0, sources are encoded by polarity only
+        :type seed: int or list of int
+        :param seed: seed for the random encoding, e.g., [seed, iteration] to
+            draw a new, reproducible, encoding each iteration
+        """
+        self._source_encoding = None
+        if nsupershot is None:
+            return
+
+        source_names = self.source_names
+        par_file = os.path.join(self.path.specfem_data, "Par_file")
+        dt = fortran_float(getpar(key="DT", file=par_file)[1])
+
+        rng = np.random.default_rng(seed)
+        polarities = rng.choice([-1, 1], size=len(source_names))
+        shifts = dt * np.round(rng.uniform(0, max_shift,
+                                           size=len(source_names)) / dt)
+        groups = np.array_split(rng.permutation(len(source_names)),
+                                nsupershot)
+
+        encoding = {}
+        for i, group in enumerate(groups, start=1):
+            group = np.sort(group)
+            # Simulation start time is unchanged if one source is not shifted
+            shift_min = shifts[group].min()
+            encoding[f"supershot_{i:0>2}"] = [
+                (source_names[j], int(polarities[j]),
+                 float(shifts[j] - shift_min)) for j in group
+            ]
+
+        logger.info(f"encoding {len(source_names)} sources into "
+                    f"{len(encoding)} supershots")
+        self._source_encoding = encoding
+        for supershot in encoding:
+            self._write_encoded_source(supershot)
+
+    def _write_encoded_source(self, supershot):
+        """
+        Write the encoded sources of a supershot into the DATA/SOURCE file of
+        its working directory, initializing the working directory if it does
+        not exist yet. Polarity scales the amplification `factor` and the
+        time shift is added to `tshift` of each source
+
+        :type supershot: str
+        :param supershot: name of the supershot in `source_encoding`
+        """
+        cwd = os.path.join(self.path.scratch, supershot)
+        if not os.path.exists(cwd):
+            self._initialize_working_directory(cwd=cwd)
+
+        source_file = os.path.join(cwd, "DATA", self.source_prefix)
+        lines = []
+        for source_name, polarity, shift in self._source_encoding[supershot]:
+            unix.rm(source_file)
+            unix.cp(src=os.path.join(self.path.specfem_data,
+                                     f"{self.source_prefix}_{source_name}"),
+                    dst=source_file)
+            tshift = fortran_float(getpar(key="tshift", file=source_file)[1])
+            factor = fortran_float(getpar(key="factor", file=source_file)[1])
+            setpar(key="tshift", val=f"{tshift + shift:.6e}", file=source_file)
+            setpar(key="factor", val=f"{polarity * factor:.6e}",
+                   file=source_file)
+            with open(source_file, "r") as f:
+                lines += f.readlines()
+
+        with open(source_file, "w") as f:
+            f.writelines(lines)
+        setpar(key="NSOURCES", val=len(self._source_encoding[supershot]),
+               file=os.path.join(cwd, "DATA", "Par_file"))
+
     def smooth(self, input_path, output_path, parameters=None, span_h=None,
                span_v=None, use_gpu=False):
         """
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cross-correlation traveltime misfit and adjoint source of a
+stack of traces as a function of the number of samples per trace. The
+previous per-trace implementation, which cross-correlated each trace in the
+time domain (O(nt^2)) once for the misfit and again for the adjoint source,
+is compared against the batched engine, which cross-correlates all traces
+once in the frequency domain (O(nt log nt)) and shares the lags between
+misfit and adjoint source. Sub-sample (parabolic) lag refinement is timed
+alongside.
+
+.. note::
+    The previous implementation is only run on the first `--nold` traces
+    as it becomes prohibitively slow for long traces, its timings are
+    scaled up to the full number of traces.
+
+.. rubric::
+    $ python -m seisflows.tests.benchmarks.bench_cc_traveltime --nt 5000 20000
+"""
+import argparse
+import time
+import numpy as np
+
+from seisflows.plugins.preprocess.batched import BatchedTraces
+
+
+def make_traces(ntrace, nt, dt, max_shift=1.):
+    """
+    Create a stack of synthetic wavelets and randomly delayed observations
+
+    :type ntrace: int
+    :param ntrace: number of traces
+    :type nt: int
+    :param nt: number of samples per trace
+    :type dt: float
+    :param dt: time step in sec
+    :type max_shift: float
+    :param max_shift: maximum absolute delay of observations in sec
+    :rtype: tuple of np.array
+    :return: (syn, obs, shifts), stacks of shape (ntrace, nt) and the delay
+        of each observed trace
+    """
+    t = np.arange(nt) * dt
+    t0 = t[-1] / 2 + np.random.uniform(-1, 1, (ntrace, 1)) * t[-1] / 8
+    shifts = np.random.uniform(-max_shift, max_shift, (ntrace, 1))
+
+    def wavelet(t_):
+        return np.exp(-(t_ / (50 * dt)) ** 2) * np.sin(t_ / (10 * dt))
+
+    syn = wavelet(t - t0)
+    obs = wavelet(t - t0 - shifts)
+
+    return syn, obs, shifts[:, 0]
+
+
+def traveltime_previous(syn, obs, nt, dt):
+    """
+    Previous cross-correlation traveltime misfit, direct time-domain
+    correlation of a single trace
+
+    :type syn: np.array
+    :param syn: synthetic data array
+    :type obs: np.array
+    :param obs: observed data array
+    :type nt: int
+    :param nt: number of time steps in the data array
+    :type dt: float
+    :param dt: time step in sec
+    :rtype: float
+    :return: traveltime misfit
+    """
+    cc = abs(np.convolve(obs, np.flipud(syn)))
+
+    return (np.argmax(cc) - nt + 1) * dt
+
+
+def adjoint_previous(syn, obs, nt, dt):
+    """
+    Previous cross-correlation traveltime adjoint source of a single trace,
+    which recalculates the traveltime misfit
+
+    :type syn: np.array
+    :param syn: synthetic data array
+    :type obs: np.array
+    :param obs: observed data array
+    :type nt: int
+    :param nt: number of time steps in the data array
+    :type dt: float
+    :param dt: time step in sec
+    :rtype: np.array
+    :return: adjoint source
+    """
+    wadj = np.zeros(nt)
+
+    wadj[1:-1] = (syn[2:] - syn[0:-2]) / (2. * dt)
+    wadj *= 1. / (sum(wadj * wadj) * dt)
+
+    wadj *= traveltime_previous(syn, obs, nt, dt)
+    return wadj
+
+
+def measure_previous(syn, obs, dt):
+    """
+    Misfit and adjoint source of each trace with the previous implementation
+
+    :rtype: tuple
+    :return: (time in seconds, misfits)
+    """
+    nt = syn.shape[-1]
+    tic = time.perf_counter()
+    misfits = [traveltime_previous(s, o, nt, dt) for s, o in zip(syn, obs)]
+    _ = [adjoint_previous(s, o, nt, dt) for s, o in zip(syn, obs)]
+    toc = time.perf_counter() - tic
+
+    return toc, np.array(misfits)
+
+
+def measure_batched(syn, obs, dt, subsample=False):
+    """
+    Misfit and adjoint source of all traces with the batched engine
+
+    :rtype: tuple
+    :return: (time in seconds, misfits)
+    """
+    tic = time.perf_counter()
+    traces = BatchedTraces(syn, obs, dt, subsample=subsample)
+    misfits = traces.misfit("traveltime")
+    _ = traces.adjoint("traveltime")
+    toc = time.perf_counter() - tic
+
+    return toc, misfits
+
+
+def main():
+    """Run the benchmark and print a table of timings and traveltime errors"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--nt", nargs="+", type=int,
+                        default=[5000, 20000, 50000])
+    parser.add_argument("--ntrace", type=int, default=100)
+    parser.add_argument("--nold", type=int, default=10)
+    parser.add_argument("--dt", type=float, default=0.01)
+    args = parser.parse_args()
+
+    print(f"{'nt':>6} {'t_old':>9} {'t_fft':>8} {'t_sub':>8} {'x':>7} "
+          f"{'err_int':>8} {'err_sub':>8}")
+    for nt in args.nt:
+        syn, obs, shifts = make_traces(args.ntrace, nt, args.dt)
+        nold = min(args.nold, args.ntrace)
+
+        t_old, misfit_old = measure_previous(syn[:nold], obs[:nold], args.dt)
+        t_old *= args.ntrace / nold
+        t_fft, misfit_fft = measure_batched(syn, obs, args.dt)
+        t_sub, misfit_sub = measure_batched(syn, obs, args.dt, subsample=True)
+
+        assert(np.allclose(misfit_old, misfit_fft[:nold]))
+        err_int = np.abs(misfit_fft - shifts).max()
+        err_sub = np.abs(misfit_sub - shifts).max()
+        print(f"{nt:>6} {t_old:>9.3f} {t_fft:>8.3f} {t_sub:>8.3f} "
+              f"{t_old / t_fft:>7.1f} {err_int:>8.1E} {err_sub:>8.1E}")
+
+
+if __name__ == "__main__":
+    main()
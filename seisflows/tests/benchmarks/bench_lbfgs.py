@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark the bytes of L-BFGS history read from disk by one application of
+the inverse Hessian (the core of `LBFGS.compute_direction`) as a function of
+`lbfgs_mem`. The current two-loop recursion, which reads stored inner
+products, is compared against the previous recursion which recomputed them
+from the history vectors on every call. The compact representation
+(`lbfgs_compact`), which reads the history in blocked matrix products, is
+timed alongside.
+
+.. note::
+    Bytes are counted as the size of every history row accessed. Whether
+    those reads hit disk or the page cache depends on the model size and
+    available memory, timings are only indicative.
+
+.. rubric::
+    $ python -m seisflows.tests.benchmarks.bench_lbfgs --mem 3 5 10
+"""
+import os
+import argparse
+import tempfile
+import time
+import numpy as np
+
+from seisflows.tools.config import Dict
+from seisflows.tools.model import Model
+from seisflows.optimize.LBFGS import LBFGS
+
+
+class CountingHistory:
+    """
+    Wraps an L-BFGS history memmap and counts the bytes of each row accessed
+    """
+    def __init__(self, arr):
+        self.arr = arr
+        self.nbytes = 0
+
+    def __getitem__(self, idx):
+        out = self.arr[idx]
+        self.nbytes += out.nbytes
+        return out
+
+
+def make_lbfgs(path, n, mem):
+    """
+    Create an L-BFGS optimizer with a full history of random model and
+    gradient differences
+
+    :type path: str
+    :param path: scratch directory for the optimization module
+    :type n: int
+    :param n: length of the model vector
+    :type mem: int
+    :param mem: L-BFGS memory, number of stored pairs
+    :rtype: seisflows.optimize.LBFGS.LBFGS
+    :return: optimizer whose history holds `mem` pairs
+    """
+    lbfgs = LBFGS(path_optimize=path, path_output=path, lbfgs_mem=mem)
+    os.mkdir(lbfgs.path._LBFGS)
+
+    m = Model()
+    m.model = Dict(x=[np.zeros(n, dtype="float32")])
+    for name in ["m_old", "g_old", "m_new", "g_new"]:
+        m.update(vector=np.random.rand(n).astype("float32"))
+        lbfgs.save_vector(name, m)
+    for _ in range(mem):
+        lbfgs._update_search_history()  # NOQA
+
+    return lbfgs
+
+
+def apply_inverse_hessian_recompute(lbfgs, q, s, y):
+    """
+    Previous two-loop recursion, which recomputes the inner products of the
+    stored pairs from the history on every call
+
+    :type lbfgs: seisflows.optimize.LBFGS.LBFGS
+    :param lbfgs: optimizer holding the history
+    :type q: np.array
+    :param q: gradient direction to apply L-BFGS to
+    :type s: CountingHistory
+    :param s: memory of model differences
+    :type y: CountingHistory
+    :param y: memory of gradient direction differences
+    :rtype: np.array
+    :return: new search direction
+    """
+    rows = lbfgs._history_rows()  # NOQA
+    kk = len(rows)
+    rh = np.zeros(kk)
+    al = np.zeros(kk)
+    for ii, row in enumerate(rows):
+        rh[ii] = 1 / np.dot(y[row], s[row])
+        al[ii] = rh[ii] * np.dot(s[row], q)
+        q = q - al[ii] * y[row]
+
+    r = q
+    sty = np.dot(y[rows[0]], s[rows[0]])
+    yty = np.dot(y[rows[0]], y[rows[0]])
+    r *= sty / yty
+
+    for ii in range(kk - 1, -1, -1):
+        be = rh[ii] * np.dot(y[rows[ii]], r)
+        r = r + s[rows[ii]] * (al[ii] - be)
+
+    return r
+
+
+def measure(lbfgs, func, q):
+    """
+    Apply the inverse Hessian once, counting history bytes read
+
+    :type lbfgs: seisflows.optimize.LBFGS.LBFGS
+    :param lbfgs: optimizer holding the history
+    :type func: function
+    :param func: recursion to apply, called as func(q, s, y)
+    :type q: np.array
+    :param q: gradient direction to apply L-BFGS to
+    :rtype: tuple
+    :return: (bytes read, time in seconds, resulting direction)
+    """
+    s, y = lbfgs._open_search_history(n=len(q), mode="r")  # NOQA
+    s, y = CountingHistory(s), CountingHistory(y)
+    tic = time.perf_counter()
+    r = func(q.copy(), s, y)
+    toc = time.perf_counter() - tic
+
+    return s.nbytes + y.nbytes, toc, r
+
+
+def main():
+    """Run the benchmark and print a table of bytes read and timings"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--mem", nargs="+", type=int, default=[3, 5, 10])
+    parser.add_argument("--n", type=int, default=1000000)
+    args = parser.parse_args()
+
+    print(f"{'mem':>4} {'MB_old':>9} {'MB_new':>9} {'x':>5} "
+          f"{'t_old':>8} {'t_new':>8} {'t_cmp':>8}")
+    for mem in args.mem:
+        with tempfile.TemporaryDirectory() as path:
+            lbfgs = make_lbfgs(path, n=args.n, mem=mem)
+            q = np.random.rand(args.n).astype("float32")
+            b_old, t_old, r_old = measure(
+                lbfgs, lambda q_, s_, y_: apply_inverse_hessian_recompute(
+                    lbfgs, q_, s_, y_), q)
+            b_new, t_new, r_new = measure(
+                lbfgs, lbfgs._apply_inverse_hessian, q)  # NOQA
+            _, t_cmp, r_cmp = measure(
+                lbfgs, lambda q_, s_, y_: lbfgs._apply_inverse_hessian_compact(
+                    q_, s_.arr, y_.arr), q)  # NOQA
+            assert(np.allclose(r_old, r_new, rtol=1e-4))
+            assert(np.allclose(r_new, r_cmp, rtol=1e-4))
+        print(f"{mem:>4} {b_old / 1E6:>9.1f} {b_new / 1E6:>9.1f} "
+              f"{b_old / b_new:>5.2f} {t_old:>8.4f} {t_new:>8.4f} "
+              f"{t_cmp:>8.4f}")
+
+
+if __name__ == "__main__":
+    main()
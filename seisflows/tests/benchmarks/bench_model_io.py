@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark serial vs. threaded Model I/O as a function of the number of
+processor slices that make up a model. Synthetic Fortran binary models are
+written to a temporary directory, and then read and written back with
+`Model(max_workers=...)`.
+
+.. note::
+    Speedups are largest on parallel filesystems (Lustre, GPFS) where
+    per-file latency, not bandwidth, dominates. On a local disk with a warm
+    page cache the threaded path mostly measures Python overhead.
+
+.. rubric::
+    $ python -m seisflows.tests.benchmarks.bench_model_io --nproc 16 64 256
+"""
+import os
+import argparse
+import tempfile
+import time
+import numpy as np
+
+from seisflows.tools.config import Dict
+from seisflows.tools.model import Model
+
+
+def make_model(path, nproc, ngll, parameters=("vp", "vs", "rho")):
+    """
+    Write a random Fortran binary model to disk
+
+    :type path: str
+    :param path: directory to write the model to
+    :type nproc: int
+    :param nproc: number of processor slices
+    :type ngll: int
+    :param ngll: number of GLL points per slice
+    :type parameters: tuple of str
+    :param parameters: model parameters to write
+    """
+    model = Model()
+    model.model = Dict({
+        key: [np.random.rand(ngll).astype("float32") for _ in range(nproc)]
+        for key in parameters
+    })
+    model.fmt = ".bin"
+    model.write(path=path)
+
+
+def time_io(path, max_workers, repeat=3):
+    """
+    Time reading and writing a model with a given number of threads, taking
+    the best of `repeat` attempts
+
+    :type path: str
+    :param path: directory containing the model to read
+    :type max_workers: int
+    :param max_workers: number of I/O threads to use
+    :type repeat: int
+    :param repeat: number of times to repeat each measurement
+    :rtype: tuple of float
+    :return: (read time, write time) in seconds
+    """
+    t_read, t_write = np.inf, np.inf
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        model = Model(path=path, fmt=".bin", flavor="3D",
+                      max_workers=max_workers)
+        t_read = min(t_read, time.perf_counter() - tic)
+
+        with tempfile.TemporaryDirectory() as out:
+            tic = time.perf_counter()
+            model.write(path=out)
+            t_write = min(t_write, time.perf_counter() - tic)
+
+    return t_read, t_write
+
+
+def main():
+    """Run the benchmark and print a table of timings and speedups"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--nproc", nargs="+", type=int,
+                        default=[16, 64, 256])
+    parser.add_argument("--ngll", type=int, default=50000)
+    parser.add_argument("--max_workers", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'nproc':>6} {'read_1':>9} {'read_N':>9} {'x':>5} "
+          f"{'write_1':>9} {'write_N':>9} {'x':>5}")
+    for nproc in args.nproc:
+        with tempfile.TemporaryDirectory() as path:
+            make_model(path, nproc=nproc, ngll=args.ngll)
+            r1, w1 = time_io(path, max_workers=1)
+            rn, wn = time_io(path, max_workers=args.max_workers)
+        print(f"{nproc:>6} {r1:>9.4f} {rn:>9.4f} {r1 / rn:>5.1f} "
+              f"{w1:>9.4f} {wn:>9.4f} {w1 / wn:>5.1f}")
+
+
+if __name__ == "__main__":
+    main()
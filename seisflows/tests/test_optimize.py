@@ -6,6 +6,7 @@ import os
 import pytest
 import numpy as np
 import matplotlib.pyplot as plt
+from glob import glob
 from seisflows.tools.config import Dict
 from seisflows.tools.model import Model
 from seisflows.tools.math import angle
@@ -450,3 +451,296 @@ def test_inversion_optimization_problem_with_NLCG(  # NOQA
         plt.ylabel("Misfit")
         plt.axhline(1e-3, c="k")
         plt.savefig(os.path.join(tmpdir, "nlcg_misfit.png"))
+
+
+def test_LBFGS_search_history_ring_buffer(tmpdir):  # NOQA
+    """
+    L-BFGS history is stored as contiguous rows of a ring buffer, so that new
+    iterates overwrite the oldest row and are read back newest first
+    """
+    lbfgs = LBFGS(path_optimize=tmpdir, path_output=tmpdir, lbfgs_mem=3)
+    os.mkdir(lbfgs.path._LBFGS)
+
+    m = Model()
+    m.model = Dict(x=[np.zeros(4)])
+    for name in ["m_old", "g_old"]:
+        lbfgs.save_vector(name, m)
+    m.update(vector=np.ones(4))
+    lbfgs.save_vector("g_new", m)
+
+    for i in range(1, 6):
+        m.update(vector=np.full(4, float(i)))
+        lbfgs.save_vector("m_new", m)
+        s, y = lbfgs._update_search_history()  # NOQA
+
+    assert(s.shape == (3, 4))
+    assert(lbfgs._memory_used == 3)  # NOQA
+    assert([s[row][0] for row in lbfgs._history_rows()] == [5., 4., 3.])  # NOQA
+
+    # Inner products are stored for each pair when it is added
+    dots = np.load(lbfgs.path._dot_file)[lbfgs._history_rows()]  # NOQA
+    assert(np.allclose(dots[:, 0], [20., 16., 12.]))  # y.s
+    assert(np.allclose(dots[:, 1], 4.))  # y.y
+    assert(dots.dtype == np.float64)
+
+    # Ring buffer position survives checkpointing
+    lbfgs.checkpoint()
+    lbfgs_reload = LBFGS(path_optimize=tmpdir, path_output=tmpdir, lbfgs_mem=3)
+    lbfgs_reload.load_checkpoint()
+    assert(lbfgs_reload._history_rows() == lbfgs._history_rows())  # NOQA
+
+    # Checkpoints of the previous history layout reset the memory
+    checkpoint = dict(np.load(lbfgs.path._checkpoint))
+    checkpoint.pop("memory_head")
+    np.savez(file=lbfgs.path._checkpoint, **checkpoint)
+    lbfgs_reload = LBFGS(path_optimize=tmpdir, path_output=tmpdir, lbfgs_mem=3)
+    lbfgs_reload.load_checkpoint()
+    assert(lbfgs_reload._memory_used == 0)  # NOQA
+    assert(lbfgs_reload._history_rows() == [])  # NOQA
+
+
+def test_LBFGS_curvature_check(tmpdir):  # NOQA
+    """
+    With the curvature check (used by mini-batch inversions), L-BFGS pairs
+    with y.s <= 0 are not stored, and the search direction falls back to the
+    inverse gradient while no history is available
+    """
+    lbfgs = LBFGS(path_optimize=tmpdir, path_output=tmpdir, lbfgs_mem=3,
+                  lbfgs_curvature_check=True)
+    os.mkdir(lbfgs.path._LBFGS)
+
+    m = Model()
+    m.model = Dict(x=[np.zeros(4)])
+    for name in ["m_old", "g_old"]:
+        lbfgs.save_vector(name, m)
+    m.update(vector=np.ones(4))
+    lbfgs.save_vector("m_new", m)
+
+    # Gradient decreases along the model update: negative curvature
+    m.update(vector=-1 * np.ones(4))
+    lbfgs.save_vector("g_new", m)
+    lbfgs._LBFGS_iter = 1  # NOQA
+    p_new = lbfgs.compute_direction()
+    assert(lbfgs._memory_used == 0)  # NOQA
+    assert(np.allclose(p_new.vector, 1.))
+    assert(not lbfgs._restarted)  # NOQA
+
+    # Positive curvature pair is stored, a subsequent bad pair is skipped
+    m.update(vector=np.ones(4))
+    lbfgs.save_vector("g_new", m)
+    s, y = lbfgs._update_search_history()  # NOQA
+    assert(lbfgs._memory_used == 1)  # NOQA
+    m.update(vector=-1 * np.ones(4))
+    lbfgs.save_vector("g_new", m)
+    s, y = lbfgs._update_search_history()  # NOQA
+    assert(lbfgs._memory_used == 1)  # NOQA
+    assert(np.allclose(y[lbfgs._memory_head], 1.))  # NOQA
+
+
+def test_LBFGS_compact_representation(tmpdir):  # NOQA
+    """
+    The compact representation of the L-BFGS inverse Hessian should give the
+    same search direction as the two-loop recursion
+    """
+    lbfgs = LBFGS(path_optimize=tmpdir, path_output=tmpdir, lbfgs_mem=3)
+    os.mkdir(lbfgs.path._LBFGS)
+
+    np.random.seed(0)
+    m = Model()
+    m.model = Dict(x=[np.zeros(100)])
+    for _ in range(5):
+        s_k, m_old, g_old = np.random.rand(3, 100)
+        for name, vector in [("m_old", m_old), ("g_old", g_old),
+                             ("m_new", m_old + s_k),
+                             ("g_new", g_old + 2 * s_k)]:
+            m.update(vector=vector)
+            lbfgs.save_vector(name, m)
+        s, y = lbfgs._update_search_history()  # NOQA
+
+    q = np.random.rand(100)
+    r = lbfgs._apply_inverse_hessian(q.copy(), s, y)  # NOQA
+    r_compact = lbfgs._apply_inverse_hessian_compact(  # NOQA
+        q.copy(), s, y, block_size=32)
+    # The history `s`, `y` is stored in single precision (eps ~1E-7), and the
+    # two methods round in a different order (two-loop updates vs. blocked
+    # products and a small solve). Directions differ by a few 1E-6, so
+    # compare at a tolerance just above single precision accuracy
+    assert(np.allclose(r, r_compact, rtol=1e-5))
+
+    # Search directions keep the single precision of the gradient
+    lbfgs = LBFGS(path_optimize=os.path.join(tmpdir, "compact"),
+                  path_output=tmpdir, lbfgs_compact=True)
+    os.makedirs(lbfgs.path._LBFGS)
+    lbfgs._LBFGS_iter = 1  # NOQA
+    s_k, m_old, g_old = np.random.rand(3, 100).astype("float32")
+    y_k = s_k * np.random.uniform(0.5, 2., 100).astype("float32")
+    for name, vector in [("m_old", m_old), ("g_old", g_old),
+                         ("m_new", m_old + s_k), ("g_new", g_old + y_k)]:
+        m.update(vector=vector)
+        lbfgs.save_vector(name, m)
+    p_new = lbfgs.compute_direction()
+    assert(not lbfgs._restarted)  # NOQA
+    assert(p_new.vector.dtype == np.float32)
+
+
+def test_optimize_vector_cache(tmpdir, setup_optimization_vectors,
+                               monkeypatch):
+    """
+    Repeat loads of the same Model vector are served from memory until the
+    vector is saved again, and modifying a loaded Model does not change the
+    cached one
+    """
+    optimize = Gradient(path_optimize=tmpdir)
+    g_new = optimize.load_vector("g_new")
+    assert("g_new" in optimize._vector_cache)  # NOQA
+
+    # Loading again does not re-read the file
+    def fail(*args, **kwargs):
+        raise AssertionError("vector should not be read from disk")
+    monkeypatch.setattr(Model, "__init__", fail)
+    g_cached = optimize.load_vector("g_new")
+    monkeypatch.undo()
+    assert(np.all(g_cached.vector == g_new.vector))
+
+    # In-place changes to a loaded Model do not reach the cache
+    g_cached.scale_(-1)
+    assert(np.all(optimize.load_vector("g_new").vector == g_new.vector))
+
+    # Saving a vector invalidates its cache entry
+    optimize.save_vector("g_new", g_cached)
+    assert("g_new" not in optimize._vector_cache)  # NOQA
+    assert(np.all(optimize.load_vector("g_new").vector == -1 * g_new.vector))
+
+
+def test_optimize_preconditioner(tmpdir, monkeypatch):
+    """
+    Preconditioners are built once, either from a model-formatted diagonal
+    or from SPECFEM Hessian kernels, and then re-used from the scratch dir
+    """
+    g = Model()
+    g.model = Dict(vp=[np.ones(3), np.ones(3)], vs=[np.ones(3), np.ones(3)])
+    g.fmt = ".bin"
+
+    # Diagonal preconditioner formatted the same as the model
+    precond = g.copy()
+    precond.update(vector=np.arange(12.))
+    precond.write(path=os.path.join(tmpdir, "diagonal"))
+    optimize = Gradient(path_optimize=tmpdir, preconditioner="diagonal",
+                        path_preconditioner=os.path.join(tmpdir, "diagonal"))
+    assert(np.all(optimize._precondition(g.vector) == np.arange(12.)))  # NOQA
+
+    # Subsequent calls neither read nor check the preconditioner files again
+    def fail(*args, **kwargs):
+        raise AssertionError("preconditioner should not be re-read")
+    monkeypatch.setattr("seisflows.optimize.gradient.Model", fail)
+    monkeypatch.setattr(optimize, "_get_preconditioner_sources", fail)
+    assert(np.all(optimize._precondition(g.vector) == np.arange(12.)))  # NOQA
+    monkeypatch.undo()
+
+    # Hessian preconditioner is the inverse Hessian applied to each parameter
+    hess = Model()
+    hess.model = Dict(vp=[np.full(3, 2.), np.full(3, 4.)])
+    hess.fmt = ".bin"
+    hess.write(path=os.path.join(tmpdir, "hessian"))
+    for fid in glob(os.path.join(tmpdir, "hessian", "*_vp.bin")):
+        os.rename(fid, fid.replace("_vp.bin", "_hess_kernel.bin"))
+    optimize = Gradient(path_optimize=os.path.join(tmpdir, "hess_scratch"),
+                        preconditioner="hessian",
+                        path_preconditioner=os.path.join(tmpdir, "hessian"))
+    os.mkdir(optimize.path.scratch)
+    optimize.save_vector("g_new", g)
+    p = optimize._precondition(g.vector)  # NOQA
+    water_level = optimize._hessian_water_level * 4.  # NOQA
+    expected = 1 / (np.array([2., 2., 2., 4., 4., 4.]) + water_level)
+    assert(np.allclose(p, np.tile(expected, 2)))
+
+    # Changing the Hessian kernels, e.g., in a new iteration, rebuilds it
+    hess.update(vector=hess.vector * 2)
+    hess.write(path=os.path.join(tmpdir, "hessian"))
+    for fid in glob(os.path.join(tmpdir, "hessian", "*_vp.bin")):
+        os.replace(fid, fid.replace("_vp.bin", "_hess_kernel.bin"))
+        # Make sure the modification time changes on coarse file systems
+        stat = os.stat(fid.replace("_vp.bin", "_hess_kernel.bin"))
+        os.utime(fid.replace("_vp.bin", "_hess_kernel.bin"),
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    # Kernels are only checked again once a new gradient has been saved
+    p = optimize._precondition(g.vector)  # NOQA
+    assert(np.allclose(p, np.tile(expected, 2)))
+    optimize.save_vector("g_new", g)
+    for optimize_ in [optimize, Gradient(
+            path_optimize=os.path.join(tmpdir, "hess_scratch"),
+            preconditioner="hessian",
+            path_preconditioner=os.path.join(tmpdir, "hessian"))]:
+        p = optimize_._precondition(g.vector)  # NOQA
+        assert(np.allclose(p, np.tile(expected / 2, 2)))
+
+
+def test_optimize_flat_vectors(tmpdir, setup_optimization_vectors):
+    """
+    Model vectors are saved as flat .npy files which are memory-mapped when
+    loaded, and carried over as the line search is finalized
+    """
+    optimize = Gradient(path_optimize=tmpdir)
+    g_new = optimize.load_vector("g_new")  # saved as .npz by the fixture
+    optimize.save_vector("g_new", g_new)
+    assert(os.path.exists(os.path.join(tmpdir, "g_new.npy")))
+    assert(not os.path.exists(os.path.join(tmpdir, "g_new.npz")))
+
+    g_flat = Gradient(path_optimize=tmpdir).load_vector("g_new")
+    assert(isinstance(g_flat.vector, np.memmap))
+    assert(np.all(g_flat.vector == g_new.vector))
+
+    # The accepted trial model becomes the current model
+    optimize.save_vector("p_new", g_new.copy().scale_(-1))
+    m_try = g_new.copy()
+    optimize.save_vector("m_try", m_try)
+    for step_len, func_val in [(0., 1.), (1., .5)]:
+        optimize._line_search.update_search_history(  # NOQA
+            step_len=step_len, func_val=func_val)
+    optimize._line_search.step_count = 1  # NOQA
+    optimize.finalize_search()
+    assert(np.all(optimize.load_vector("m_new").vector == m_try.vector))
+    assert(np.all(optimize.load_vector("g_old").vector == g_new.vector))
+
+
+def test_speculative_line_search(tmpdir, setup_optimization_vectors):
+    """
+    A speculative line search evaluates several trial step lengths at once.
+    Check that the Bracket'ing line search passes in fewer rounds of
+    evaluations than it takes steps when evaluating one step at a time, and
+    that the accepted step length is one of those evaluated
+    """
+    optimize = Gradient(path_optimize=tmpdir, path_output=tmpdir,
+                        line_search_method="bracket", step_count_max=100,
+                        speculative_steps=4)
+    p_new = optimize.compute_direction()
+    optimize.save_vector("p_new", p_new)
+
+    m_try, alpha = optimize.initialize_search()
+    alphas = optimize.propose_step_lengths(alpha)
+    assert(len(alphas) == 4)
+    assert(alphas[0] == alpha)
+
+    evaluated = []
+    for rounds in range(1, 10):
+        optimize.increment_step_count()
+        optimize.save_vector("alpha", alphas)
+        f_try = [rosenbrock_objective_function(
+            optimize.compute_trial_model(alpha_).vector) for alpha_ in alphas]
+        optimize.save_vector("f_try", np.array(f_try))
+        evaluated.extend(alphas)
+
+        m_try, alpha, status = optimize.update_line_search()
+        if status == "PASS":
+            break
+        alphas = optimize.propose_step_lengths(alpha)
+
+    assert(status == "PASS")
+    assert(rounds < 4)  # sequential bracketing line search takes 4 steps
+    assert(optimize.step_count == len(evaluated))
+    assert(alpha in evaluated)
+    assert(min(optimize._line_search.func_vals) == pytest.approx(4.22, 1E-2))
+
+    # Accepted step length is saved as a float, replacing the array on disk
+    optimize.save_vector("alpha", alpha)
+    assert(optimize.load_vector("alpha") == pytest.approx(alpha))
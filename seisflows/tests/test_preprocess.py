@@ -6,10 +6,13 @@ import os
 import numpy as np
 import pytest
 from glob import glob
+from scipy.signal import hilbert as analytic
 from seisflows import ROOT_DIR
 from seisflows.tools import unix
-from seisflows.preprocess.default import Default
+from seisflows.preprocess.default import Default, read_ascii
 from seisflows.preprocess.pyaflowa import Pyaflowa
+from seisflows.plugins.preprocess import misfit, adjoint
+from seisflows.plugins.preprocess.batched import BatchedTraces, cross_correlate
 
 
 TEST_DATA = os.path.join(ROOT_DIR, "tests", "test_data", "test_preprocess")
@@ -40,6 +43,44 @@ def test_default_read():
     assert(st3[0].stats.npts == st2[0].stats.npts)
 
 
+def test_read_ascii(tmpdir):
+    """
+    Test that two-column and comma separated ASCII waveforms are parsed
+    identically, and that parsed data are cached in a binary sidecar file
+    """
+    src = os.path.join(TEST_DATA, "AA.S0001.BXY.semd")
+    times, data = np.loadtxt(src, unpack=True)
+    st = read_ascii(src)
+    assert(np.allclose(st[0].data, data))
+    assert(st[0].stats.time_offset == times[0])
+
+    # Comma separated format, repeated values written with a repeat count
+    fid = os.path.join(tmpdir, "AA.S0001.BXY.semd")
+    data[:2] = times[:2]
+    with open(fid, "w") as f:
+        f.write(f"2*{times[0]}\n2*{times[1]}\n")
+        for time_, data_ in zip(times[2:], data[2:]):
+            f.write(f"{time_},{data_}\n")
+    assert(np.allclose(read_ascii(fid)[0].data, data))
+
+    cache_file = os.path.join(tmpdir, ".AA.S0001.BXY.semd.npy")
+    assert(not os.path.exists(cache_file))
+    st = read_ascii(fid, cache=True)
+    assert(os.path.exists(cache_file))
+    assert(np.allclose(st[0].data, data))
+    assert(np.allclose(read_ascii(fid, cache=True)[0].data, data))
+
+    # The sidecar file is ignored once the ASCII file is newer
+    np.savetxt(fid, np.vstack((times, 2 * data)).T)
+    os.utime(cache_file, ns=(0, 0))
+    assert(np.allclose(read_ascii(fid, cache=True)[0].data, 2 * data))
+
+    with open(fid, "a") as f:
+        f.write("1.0\n")
+    with pytest.raises(ValueError):
+        read_ascii(fid)
+
+
 def test_default_write(tmpdir):
     """
     Test that we can write synthetic waveforms to formats that SPECFEM recognizes
@@ -116,6 +157,226 @@ def test_default_quantify_misfit(tmpdir):
     assert(float(residuals[0]) == pytest.approx(0.0269, 3))
 
 
+def test_default_quantify_misfit_parallel(tmpdir):
+    """
+    Quantify misfit on a process pool, residuals and adjoint sources should
+    match those from the serial run, with residuals in the same order
+    """
+    residuals, adjsrcs = {}, {}
+    for parallel in [False, True]:
+        path = os.path.join(tmpdir, str(parallel))
+        preprocess = Default(syn_data_format="ascii", obs_data_format="ascii",
+                             unit_output="disp", misfit="waveform",
+                             adjoint="waveform", path_preprocess=path,
+                             path_solver=TEST_SOLVER, parallel=parallel,
+                             nproc=2)
+        preprocess.check()
+        preprocess.setup()
+        preprocess.quantify_misfit(
+            source_name="001", save_residuals=os.path.join(path, "residuals"),
+            save_adjsrcs=path
+        )
+        residuals[parallel] = np.loadtxt(os.path.join(path, "residuals"))
+        adjsrcs[parallel] = sorted(
+            os.path.basename(_) for _ in glob(os.path.join(path, "*.adj")))
+
+    assert(len(residuals[True]) == 2)
+    assert((residuals[True] == residuals[False]).all())
+    assert(adjsrcs[True] and adjsrcs[True] == adjsrcs[False])
+
+
+def test_batched_misfit_adjoint():
+    """
+    Misfits and adjoint sources calculated for a stack of traces at once
+    should match the one-trace-at-a-time formulas they replaced
+    """
+    nt, dt = 500, 0.01
+    t = np.arange(nt) * dt
+    syn = np.array([np.exp(-((t - t0) / .2) ** 2) * np.sin(20 * t)
+                    for t0 in [1.5, 2., 2.5]])
+    obs = 0.8 * np.roll(syn, 13, axis=-1) + 0.01 * np.cos(3 * t)
+
+    def norm(rsd):
+        return np.sqrt(np.sum(rsd * rsd * dt))
+
+    def derivative(w):
+        dwdt = np.zeros(nt)
+        dwdt[1:-1] = (w[2:] - w[0:-2]) / (2. * dt)
+        return dwdt / (sum(dwdt * dwdt) * dt)
+
+    def phase(w):
+        return np.arctan2(np.imag(analytic(w)), np.real(analytic(w)))
+
+    def waveform(syn_, obs_):
+        return norm(syn_ - obs_), syn_ - obs_
+
+    def envelope(syn_, obs_, eps=0.05):
+        env_syn = abs(analytic(syn_))
+        env_obs = abs(analytic(obs_))
+        env_tmp = (env_syn - env_obs) / (env_syn + eps * env_syn.max())
+        wadj = env_tmp * syn_ - np.imag(analytic(env_tmp *
+                                                 np.imag(analytic(syn_))))
+        return norm(env_syn - env_obs), wadj
+
+    def instantaneous_phase(syn_, obs_, eps=0.05):
+        phi_rsd = phase(syn_) - phase(obs_)
+        env_syn = abs(analytic(syn_))
+        env_max = max(env_syn ** 2.)
+        wadj_1 = phi_rsd * np.imag(analytic(syn_)) / (env_syn ** 2. +
+                                                      eps * env_max)
+        wadj_2 = np.imag(analytic(phi_rsd * syn_ / (env_syn ** 2. +
+                                                    eps * env_max)))
+        return norm(phi_rsd), wadj_1 + wadj_2
+
+    def traveltime(syn_, obs_):
+        cc = abs(np.convolve(obs_, np.flipud(syn_)))
+        misfit_ = (np.argmax(cc) - nt + 1) * dt
+        return misfit_, derivative(syn_) * misfit_
+
+    def traveltime_inexact(syn_, obs_):
+        misfit_ = (np.argmax(obs_) - np.argmax(syn_)) * dt
+        return misfit_, derivative(syn_) * misfit_
+
+    # Per-trace formulas of the misfit and adjoint source functions, as they
+    # were before being batched
+    reference = {"waveform": waveform, "envelope": envelope,
+                 "instantaneous_phase": instantaneous_phase,
+                 "traveltime": traveltime,
+                 "traveltime_inexact": traveltime_inexact}
+
+    traces = BatchedTraces(syn=syn, obs=obs, dt=dt)
+    for name, func in reference.items():
+        misfits = traces.misfit(name)
+        adjsrcs = traces.adjoint(name)
+        assert(misfits.shape == (3,))
+        assert(adjsrcs.shape == (3, nt))
+        for i in range(3):
+            misfit_, adjsrc = func(syn[i], obs[i])
+            assert(misfits[i] == pytest.approx(misfit_))
+            assert(np.allclose(adjsrcs[i], adjsrc))
+            # Per-trace wrappers around the batched engine
+            assert(getattr(misfit, name)(syn=syn[i], obs=obs[i], nt=nt,
+                                         dt=dt) == pytest.approx(misfit_))
+            assert(np.allclose(getattr(adjoint, name)(
+                syn=syn[i], obs=obs[i], nt=nt, dt=dt), adjsrc))
+
+    # Observed arrivals are delayed by 13 samples
+    assert(np.allclose(traces.misfit("traveltime"), 13 * dt))
+
+    # Amplitude and envelope lag misfits had no working per-trace formula.
+    # Observations which are scaled and delayed copies of the synthetics
+    # have an envelope delayed by the same lag, and a residual of the scaled
+    # synthetics once aligned
+    obs = 0.8 * np.roll(syn, 13, axis=-1)
+    traces = BatchedTraces(syn=syn, obs=obs, dt=dt)
+    assert(np.allclose(traces.misfit("envelope3"), 13 * dt))
+    assert(np.allclose(traces.misfit("amplitude"),
+                       [norm(0.2 * syn_) for syn_ in syn]))
+    for i in range(3):
+        wadj = syn[i] / (sum(syn[i] * syn[i]) * dt) * norm(0.2 * syn[i])
+        assert(np.allclose(traces.adjoint("amplitude")[i], wadj))
+
+    # The batched engine is not itself a choice of misfit or adjoint source
+    preprocess = Default()
+    assert("BatchedTraces" not in preprocess._acceptable_misfits)  # NOQA
+    assert("BatchedTraces" not in preprocess._acceptable_adjsrcs)  # NOQA
+
+
+def test_batched_cross_correlation():
+    """
+    FFT cross-correlation should match direct correlation, and sub-sample
+    refinement should recover a traveltime shift between samples
+    """
+    syn, obs = np.random.rand(2, 3, 101)
+    cc = [np.convolve(obs_, np.flipud(syn_)) for syn_, obs_ in zip(syn, obs)]
+    assert(np.allclose(cross_correlate(syn, obs), cc))
+
+    nt, dt, shift = 1000, 0.01, 0.1234
+    t = np.arange(nt) * dt
+    syn = np.exp(-((t - 5.) / .3) ** 2) * np.sin(6 * t)
+    obs = np.exp(-((t - 5. - shift) / .3) ** 2) * np.sin(6 * (t - shift))
+
+    assert(misfit.traveltime(syn, obs, nt, dt) == pytest.approx(0.12))
+    assert(misfit.traveltime(syn, obs, nt, dt, subsample=True) ==
+           pytest.approx(shift, abs=1E-4))
+
+
+def test_default_observed_data_cache(tmpdir, monkeypatch):
+    """
+    Processed observed data are cached per source and reused as long as the
+    preprocessing parameters do not change
+    """
+    preprocess = Default(syn_data_format="ascii", obs_data_format="ascii",
+                         unit_output="disp", misfit="waveform",
+                         adjoint="waveform", path_preprocess=tmpdir,
+                         path_solver=TEST_SOLVER, obs_cache=True,
+                         filter="bandpass", min_freq=0.1, max_freq=1.)
+    preprocess.check()
+    preprocess.setup()
+
+    def quantify_misfit(fid):
+        preprocess.quantify_misfit(source_name="001", save_residuals=fid)
+        return np.loadtxt(fid)
+
+    residuals = quantify_misfit(os.path.join(tmpdir, "residuals_1"))
+    assert(os.path.exists(os.path.join(tmpdir, "obs_cache", "001.npz")))
+
+    # Observed data must not be read again once cached
+    def read_processed_observed(*args, **kwargs):
+        raise AssertionError("observed data read despite cache")
+
+    with monkeypatch.context() as m:
+        m.setattr(preprocess, "read_processed_observed",
+                  read_processed_observed)
+        assert((quantify_misfit(os.path.join(tmpdir, "residuals_2")) ==
+                residuals).all())
+
+        # Changing preprocessing parameters invalidates the cache
+        preprocess.max_freq = 2.
+        with pytest.raises(AssertionError):
+            quantify_misfit(os.path.join(tmpdir, "residuals_3"))
+
+    preprocess.max_freq = 1.
+    preprocess.obs_cache = False
+    assert((quantify_misfit(os.path.join(tmpdir, "residuals_4")) ==
+            residuals).all())
+
+
+def test_default_encode_observed_data(tmpdir):
+    """
+    Encoded observed data of a supershot are the sum of the observed data of
+    its sources, each scaled by its polarity and delayed by its time shift
+    """
+    path_solver = os.path.join(tmpdir, "solver")
+    for source_name in ["001", "002"]:
+        unix.mkdir(os.path.join(path_solver, source_name, "traces"))
+        unix.cp(src=os.path.join(TEST_SOLVER, source_name, "traces", "obs"),
+                dst=os.path.join(path_solver, source_name, "traces", "obs"))
+
+    preprocess = Default(syn_data_format="ascii", obs_data_format="ascii",
+                         path_preprocess=tmpdir, path_solver=path_solver)
+    fid = "AA.S000000.BXY.semd"
+    tr1 = preprocess.read(os.path.join(path_solver, "001", "traces", "obs",
+                                       fid), data_format="ascii")[0]
+    tr2 = preprocess.read(os.path.join(path_solver, "002", "traces", "obs",
+                                       fid), data_format="ascii")[0]
+    nshift = 5
+
+    preprocess.encode_observed_data(
+        source_name="supershot_01",
+        encoding=[("001", 1, 0.), ("002", -1, nshift * tr2.stats.delta)]
+    )
+
+    obs_path = os.path.join(path_solver, "supershot_01", "traces", "obs")
+    assert(sorted(os.listdir(obs_path)) ==
+           sorted(os.listdir(os.path.join(path_solver, "001", "traces",
+                                          "obs"))))
+    tr = preprocess.read(os.path.join(obs_path, fid), data_format="ascii")[0]
+    expected = tr1.data.copy()
+    expected[nshift:] -= tr2.data[:-nshift]
+    assert(np.allclose(tr.data, expected, atol=1E-7))  # ASCII precision
+
+
 def test_pyaflowa_setup(tmpdir):
     """
     Test setup procedure for SeisFlows which internalizes some workflow
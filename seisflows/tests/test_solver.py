@@ -4,10 +4,14 @@ SPECFEM
 """
 import os
 import pytest
+import numpy as np
 from glob import glob
 from seisflows import ROOT_DIR
+from seisflows.tools import unix
 from seisflows.tools.config import set_task_id
+from seisflows.tools.specfem import getpar
 from seisflows.solver.specfem import Specfem
+from seisflows.solver.specfem2d import Specfem2D
 
 
 TEST_DATA = os.path.join(ROOT_DIR, "tests", "test_data", "test_solver")
@@ -31,6 +35,85 @@ def test_source_names():
     assert(source_names == solver.source_names)
 
 
+def test_source_batch():
+    """
+    Check that a batch of sources restricts the source names, and the sources
+    assigned to task ids, to a subset of all sources
+    """
+    sources = os.path.join(TEST_DATA, "sources")
+    solver = Specfem(path_specfem_data=sources, source_prefix="CMTSOLUTION",
+                     ntask=2)
+    all_source_names = solver.source_names
+
+    solver.set_source_batch([all_source_names[1]])
+    assert(solver.source_names == [all_source_names[1]])
+    set_task_id(0)
+    assert(solver.source_name == all_source_names[1])
+    # The number of available sources is kept to scale batch estimates
+    assert(solver.ntask == 2)
+
+    with pytest.raises(AssertionError):
+        solver.set_source_batch(["not_a_source"])
+
+    solver.set_source_batch(None)
+    assert(solver.source_names == all_source_names)
+
+
+def test_source_encoding(tmpdir):
+    """
+    Check that SPECFEM2D sources are encoded into supershots, each with a
+    multi-source SOURCE file of polarity- and time shift-encoded sources
+    """
+    specfem_data = os.path.join(tmpdir, "DATA")
+    unix.cp(src=os.path.join(TEST_DATA, "mainsolver", "DATA"), dst=specfem_data)
+    with open(os.path.join(specfem_data, "Par_file"), "w") as f:
+        f.write("NSOURCES                        = 1\n"
+                "DT                              = 1.1d-2\n")
+    # SPECFEM source files may write reals with Fortran 'd' exponents
+    for i, fid in enumerate(sorted(glob(os.path.join(specfem_data,
+                                                     "SOURCE_*")))):
+        with open(fid) as f:
+            text = f.read()
+        text = text.replace("0.000e+00", "0.d0")
+        text = text.replace("1.000e+10", ["1.d10", "1.0D+10"][i % 2])
+        with open(fid, "w") as f:
+            f.write(text)
+
+    solver = Specfem2D(path_specfem_data=specfem_data,
+                       path_specfem_bin=os.path.join(TEST_DATA, "mainsolver",
+                                                     "bin"),
+                       workdir=tmpdir, ntask=25)
+    solver.set_source_encoding(nsupershot=4, max_shift=0.1, seed=[0, 1])
+
+    assert(solver.source_names ==
+           [f"supershot_{i:0>2}" for i in range(1, 5)])
+    encoded = [code for codes in solver.source_encoding.values()
+               for code in codes]
+    assert(sorted([code[0] for code in encoded]) ==
+           [f"{i:0>3}" for i in range(1, 26)])
+    for codes in solver.source_encoding.values():
+        shifts = np.array([code[2] for code in codes])
+        assert(shifts.min() == 0)
+        assert(np.allclose(np.round(shifts / 1.1E-2), shifts / 1.1E-2))
+
+    # Each source block is written with its polarity and time shift
+    set_task_id(0)
+    codes = solver.source_encoding[solver.source_name]
+    source_file = os.path.join(solver.cwd, "DATA", "SOURCE")
+    lines = open(source_file).readlines()
+    factors = [float(line.split("=")[1].split()[0]) for line in lines
+               if line.startswith("factor")]
+    tshifts = [float(line.split("=")[1].split()[0]) for line in lines
+               if line.startswith("tshift")]
+    assert(factors == pytest.approx([code[1] * 1E10 for code in codes]))
+    assert(tshifts == pytest.approx([code[2] for code in codes]))
+    assert(getpar("NSOURCES", os.path.join(solver.cwd, "DATA", "Par_file"))[1]
+           == str(len(codes)))
+
+    solver.set_source_encoding(None)
+    assert(len(solver.source_names) == 25)
+
+
 def test_initialize_working_directory(tmpdir):
     """
     Test that data filenames are returned correctly
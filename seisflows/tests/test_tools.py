@@ -7,6 +7,7 @@ import numpy as np
 from glob import glob
 from seisflows import ROOT_DIR
 from seisflows.tools.config import Dict
+from seisflows.tools.math import angle, inner_products, poissons_ratio
 from seisflows.tools.model import Model
 from seisflows.tools.config import custom_import
 
@@ -58,6 +59,368 @@ def test_specfem_model(tmpdir):
     assert(m.parameters == ["x"])
 
 
+def test_model_flat_buffer():
+    """
+    Model data are stored in a single contiguous buffer and the dictionary and
+    vector representations are views into that buffer
+    """
+    m = Model()
+    m.model = Dict(vs=[np.array([1., 2.]), np.array([3., 4., 5.])],
+                   vp=[np.array([6., 7.]), np.array([8., 9., 10.])])
+    assert(m.ngll == [2, 3])
+    assert(m.nproc == 2)
+    assert(m.parameters == ["vp", "vs"])
+    # Parameters are stored in sorted order, processors in numerical order
+    assert(np.all(m.vector == np.arange(1, 11)[[5, 6, 7, 8, 9, 0, 1, 2, 3, 4]]))
+    assert(np.all(m.merge(parameter="vs") == [1., 2., 3., 4., 5.]))
+
+    # Views share memory with the internal buffer
+    assert(np.shares_memory(m.model.vs[1], m.vector))
+    m.vector[0] = -6.
+    assert(m.model.vp[0][0] == -6.)
+
+    # Updating with a vector adopts it without copying, split creates views
+    vector = np.arange(10, dtype="float32")
+    m.update(vector=vector)
+    assert(np.shares_memory(m.vector, vector))
+    assert(np.all(m.model.vs[1] == [7., 8., 9.]))
+    assert(np.shares_memory(m.split(vector)["vs"][1], vector))
+    with pytest.raises(ValueError):
+        m.update(vector=np.arange(9))
+
+    # Copies do not share memory with the original
+    m_copy = m.copy()
+    assert(not np.shares_memory(m_copy.vector, m.vector))
+    assert(np.shares_memory(m_copy.model.vs[0], m_copy.vector))
+    assert(np.all(m_copy.vector == m.vector))
+
+
+def test_model_lazy_loading(tmpdir):
+    """
+    Lazily loaded models memory-map the Fortran binary files and only read
+    data into memory when the full vector is requested
+    """
+    model_data = os.path.join(TEST_DIR, "test_data", "test_tools",
+                              "test_file_formats")
+    m = Model(path=model_data, fmt=".bin")
+    m_lazy = Model(path=model_data, fmt=".bin", lazy=True)
+
+    assert(isinstance(m_lazy.model.vp[0], np.memmap))
+    assert(m_lazy.ngll == m.ngll)
+    assert(m_lazy.nproc == m.nproc)
+    assert(m_lazy.model.vp[0][0] == 5800.)
+    assert(np.all(m_lazy.merge(parameter="vs") == m.merge(parameter="vs")))
+    m_lazy.check()
+    assert(m_lazy._buffer is None)  # NOQA
+
+    # Copies share the read-only memory maps
+    m_copy = m_lazy.copy()
+    assert(isinstance(m_copy.model.vs[0], np.memmap))
+
+    # Writing does not require reading the whole model into memory
+    m_lazy.write(path=tmpdir)
+    assert(np.all(Model(path=tmpdir, fmt=".bin").vector == m.vector))
+
+    # Accessing the vector reads the model into memory
+    assert(np.all(m_lazy.vector == m.vector))
+    assert(not isinstance(m_lazy.model.vp[0], np.memmap))
+
+
+def test_model_threaded_io(tmpdir):
+    """
+    Reading and writing processor files on a thread pool should give the same,
+    deterministically ordered result as serial I/O
+    """
+    m = Model()
+    m.model = Dict({key: [np.random.rand(10 + i).astype("float32")
+                          for i in range(8)] for key in ["vp", "vs"]})
+    m.fmt = ".bin"
+    m.write(path=os.path.join(tmpdir, "serial"))
+    m.write(path=os.path.join(tmpdir, "threaded"), max_workers=4)
+
+    m_serial = Model(path=os.path.join(tmpdir, "serial"), flavor="3D")
+    m_threaded = Model(path=os.path.join(tmpdir, "threaded"), flavor="3D",
+                       max_workers=4)
+    assert(m_threaded.ngll == m.ngll)
+    assert(np.all(m_serial.vector == m.vector))
+    assert(np.all(m_threaded.vector == m.vector))
+
+
+def test_model_directory_index(tmpdir, monkeypatch):
+    """
+    The first Model read of a directory writes a sidecar index which later
+    reads reuse instead of scanning the directory, until the directory changes
+    """
+    m = Model()
+    m.model = Dict({key: [np.random.rand(10 + i).astype("float32")
+                          for i in range(4)] for key in ["vp", "vs"]})
+    m.fmt = ".bin"
+    m.write(path=tmpdir)
+
+    m_first = Model(path=tmpdir, flavor="3D")
+    assert(os.path.exists(os.path.join(tmpdir, Model.index_file)))
+    assert(m_first._index["nproc"] == 4)  # NOQA
+    assert(m_first._index["parameters"] == ["vp", "vs"])  # NOQA
+
+    # Reusing the index does not require listing the directory again
+    def fail(*args, **kwargs):
+        raise AssertionError("directory should not be scanned")
+    monkeypatch.setattr(os, "scandir", fail)
+    monkeypatch.setattr(Model, "_get_nproc_parameters", fail)
+    m_cached = Model(path=tmpdir, flavor="3D")
+    assert(np.all(m_cached.vector == m.vector))
+    monkeypatch.undo()
+
+    # Overwriting the model in place invalidates the index
+    m.scale_(2.)
+    m.write(path=tmpdir)
+    m_new = Model(path=tmpdir, flavor="3D")
+    assert(np.all(m_new.vector == m.vector))
+
+
+def test_model_inplace_arithmetic():
+    """
+    In-place arithmetic should match the equivalent vector expressions while
+    operating on the existing buffer rather than allocating a new one
+    """
+    m = Model()
+    m.model = Dict({key: [np.random.rand(10 + i).astype("float32")
+                          for i in range(4)] for key in ["vp", "vs"]})
+    x = m.copy()
+    x.update(vector=np.random.rand(len(m.vector)).astype("float32"))
+    m0, x0 = m.vector.copy(), x.vector.copy()
+    buffer = m.vector
+
+    assert(m.axpy(2., x) is m)
+    assert(m.vector is buffer)
+    assert(np.allclose(m.vector, m0 + 2. * x0))
+
+    m.update(vector=m0.copy())
+    buffer = m.vector
+    m.scale_(-1)
+    assert(np.allclose(m.vector, -1 * m0))
+    m.add_(x)
+    assert(np.allclose(m.vector, x0 - m0))
+    m.mul_(x0)
+    assert(np.allclose(m.vector, (x0 - m0) * x0))
+    assert(m.vector is buffer)
+
+    assert(m.dot(x) == pytest.approx(np.dot(m.vector.astype("float64"), x0)))
+    assert(m.norm() == pytest.approx(np.linalg.norm(m.vector)))
+    assert(m.norm(ord=np.inf) == pytest.approx(np.abs(m.vector).max()))
+    with pytest.raises(NotImplementedError):
+        m.norm(ord=3)
+
+
+def test_model_check_statistics():
+    """
+    Model statistics are gathered in one sweep over the slices and should
+    match the equivalent reductions over the full vectors, serial or threaded
+    """
+    m = Model()
+    m.model = Dict({"vp": [np.random.rand(10 + i).astype("float32") + 2.
+                           for i in range(4)],
+                    "vs": [np.random.rand(10 + i).astype("float32")
+                           for i in range(4)]})
+    m.flavor = "2D"
+    pr = poissons_ratio(vp=m.merge("vp"), vs=m.merge("vs"))
+
+    for max_workers in [1, 4]:
+        stats = m.statistics(pairs=[("vp", "vs")], max_workers=max_workers)
+        assert(stats.vp == (m.merge("vp").min(), m.merge("vp").max()))
+        assert(stats.vs == (m.merge("vs").min(), m.merge("vs").max()))
+        assert(stats[("vp", "vs")] == pytest.approx((pr.min(), pr.max())))
+
+    m.check(max_workers=4)
+
+
+def test_model_copy_on_write():
+    """
+    Shallow copies share data until one of the Models is modified in place,
+    and replacing the data of a shallow copy never copies the original
+    """
+    m = Model()
+    m.model = Dict({key: [np.random.rand(10).astype("float32")
+                          for i in range(4)] for key in ["vp", "vs"]})
+    m0 = m.vector.copy()
+
+    buffer = m.vector
+    m_copy = m.copy(deep=False)
+    assert(np.shares_memory(m.vector, m_copy.vector))
+    with pytest.raises(ValueError):
+        m_copy.vector[0] = 1.
+    # The original Model keeps its own, writeable, data
+    assert(m.vector is buffer)
+    assert(m.vector.flags.writeable)
+
+    vector = np.ones(len(m0), dtype="float32")
+    m_copy.update(vector=vector)
+    assert(np.shares_memory(m_copy.vector, vector))
+    assert(np.all(m.vector == m0))
+
+    m_copy = m.copy(deep=False)
+    m_copy.scale_(2.)
+    assert(not np.shares_memory(m.vector, m_copy.vector))
+    assert(np.allclose(m_copy.vector, 2. * m0))
+    assert(np.all(m.vector == m0))
+    m.add_(m_copy)
+    assert(np.allclose(m.vector, 3. * m0))
+
+    # Modifying the original in place first leaves the shallow copy intact
+    m_copy = m.copy(deep=False)
+    m.scale_(2.)
+    assert(not np.shares_memory(m.vector, m_copy.vector))
+    assert(np.allclose(m_copy.vector, 3. * m0))
+    assert(np.allclose(m.vector, 6. * m0))
+
+    m_deep = m.copy()
+    assert(not np.shares_memory(m.vector, m_deep.vector))
+
+
+def test_model_streaming(tmpdir):
+    """
+    Reductions and element-wise updates on lazily loaded models should be
+    computed slice by slice from disk without reading the model into memory
+    """
+    m = Model()
+    m.model = Dict({"vp": [np.random.rand(10 + i).astype("float32") + 2.
+                           for i in range(4)],
+                    "vs": [np.random.rand(10 + i).astype("float32")
+                           for i in range(4)]})
+    m.fmt = ".bin"
+    m.flavor = "3D"
+    m.write(path=os.path.join(tmpdir, "m"))
+    m.write(path=os.path.join(tmpdir, "p"))
+
+    m_lazy = Model(path=os.path.join(tmpdir, "m"), lazy=True)
+    p_lazy = Model(path=os.path.join(tmpdir, "p"), lazy=True)
+    assert(m_lazy.minmax("vp") == (m.merge("vp").min(), m.merge("vp").max()))
+    assert(m_lazy.dot(p_lazy) == pytest.approx(m.dot(m)))
+    m_lazy.check()
+    assert(m_lazy._buffer is None)
+
+    m_try = m_lazy.apply(lambda m_, p_: m_ + 0.5 * p_, p_lazy,
+                         path=os.path.join(tmpdir, "m_try"))
+    assert(m_try._buffer is None and m_lazy._buffer is None)
+    assert(np.allclose(m_try.vector, 1.5 * m.vector))
+    assert(np.allclose(Model(path=os.path.join(tmpdir, "m_try")).vector,
+                       1.5 * m.vector))
+
+    m.apply(lambda m_: m_ ** 2)
+    assert(np.allclose(m.vector, m_lazy.vector ** 2))
+
+
+def test_model_incremental_write(tmpdir):
+    """
+    Incremental writes should only rewrite processor files whose contents
+    changed since the last write
+    """
+    m = Model()
+    m.model = Dict({key: [np.random.rand(10).astype("float32")
+                          for i in range(4)] for key in ["vp", "vs"]})
+    m.fmt = ".bin"
+    m.flavor = "3D"
+    assert(m.write(path=tmpdir, incremental=True) == 0)
+    assert(os.path.exists(os.path.join(tmpdir, Model.hash_file)))
+
+    # Nothing changed, so no files are rewritten
+    nbytes_file = 4 * 10 + 8
+    assert(m.write(path=tmpdir, incremental=True) == 8 * nbytes_file)
+
+    # Only the changed slice is rewritten
+    m.model.vp[1] *= 2.
+    assert(m.write(path=tmpdir, incremental=True) == 7 * nbytes_file)
+    assert(np.all(Model(path=tmpdir).vector == m.vector))
+
+    # A full write drops the hashes, the next incremental write rewrites all
+    m.write(path=tmpdir)
+    assert(not os.path.exists(os.path.join(tmpdir, Model.hash_file)))
+    assert(m.write(path=tmpdir, incremental=True) == 0)
+
+
+def test_model_flat_vector(tmpdir):
+    """
+    Models saved as flat vectors are memory-mapped when lazily loaded, and
+    element-wise operations can be streamed into a new flat vector
+    """
+    m = Model()
+    m.model = Dict({key: [np.random.rand(10 + i).astype("float32")
+                          for i in range(3)] for key in ["vp", "vs"]})
+    m.fmt = ".bin"
+    m.flavor = "3D"
+    m.save_flat(path=os.path.join(tmpdir, "m.npy"))
+    assert(os.path.exists(Model.flat_metadata(os.path.join(tmpdir, "m.npy"))))
+
+    m_lazy = Model(path=os.path.join(tmpdir, "m.npy"), lazy=True)
+    assert(isinstance(m_lazy.vector, np.memmap))
+    assert(m_lazy.parameters == m.parameters and m_lazy.ngll == m.ngll)
+    assert(m_lazy.fmt == ".bin" and m_lazy.flavor == "3D")
+    assert(np.all(m_lazy.vector == m.vector))
+
+    # Memory-mapped data are copied before being modified
+    m_lazy.scale_(2.)
+    assert(np.all(m_lazy.vector == 2 * m.vector))
+    assert(np.all(Model(path=os.path.join(tmpdir, "m.npy")).vector ==
+                  m.vector))
+
+    m_try = m.apply(lambda m_, p_: m_ + 0.5 * p_, m,
+                    path=os.path.join(tmpdir, "m_try.npy"))
+    assert(isinstance(m_try.vector, np.memmap))
+    assert(np.allclose(m_try.vector, 1.5 * m.vector))
+
+
+def test_model_ascii(tmpdir):
+    """
+    SPECFEM2D ASCII models are parsed once per file for all parameters and
+    coordinates, and the parsed data are cached in a binary sidecar file
+    """
+    data = [np.random.rand(5, 10 + i) for i in range(2)]
+    for i, arr in enumerate(data):
+        np.savetxt(os.path.join(tmpdir, f"proc{i:0>6}_rho_vp_vs.dat"), arr.T)
+
+    m = Model(path=tmpdir, flavor="2D")
+    assert(m.fmt == ".dat")
+    assert(m.nproc == 2)
+    assert(sorted(m.parameters) == ["rho", "vp", "vs"])
+    for i, arr in enumerate(data):
+        assert(np.allclose(m.model.vp[i], arr[3]))
+    assert(os.path.exists(os.path.join(tmpdir, ".proc000000_rho_vp_vs.dat.npy")))
+
+    # Writing the sidecar files does not invalidate the directory index
+    assert(m._read_index() is not None)  # NOQA
+    with open(os.path.join(tmpdir, "proc000002_rho_vp_vs.dat"), "w") as f:
+        f.write("")
+    assert(m._read_index() is None)  # NOQA
+
+    coords = m.read_coordinates_specfem2d()
+    assert(np.allclose(coords["x"][1], data[1][0]))
+    assert(np.allclose(coords["z"][1], data[1][1]))
+
+
+def test_inner_products(tmpdir):
+    """
+    Dot products and angles are reduced in blocks, in double precision, and
+    the result does not depend on the number of threads or on the input being
+    memory-mapped
+    """
+    x = np.random.rand(10001).astype(np.float32)
+    y = np.random.rand(10001).astype(np.float32) - 0.5
+    np.save(os.path.join(tmpdir, "y.npy"), y)
+    y_mmap = np.load(os.path.join(tmpdir, "y.npy"), mmap_mode="r")
+
+    x64, y64 = x.astype(np.float64), y.astype(np.float64)
+    expected = (x64 @ y64, x64 @ x64, y64 @ y64)
+
+    serial = inner_products(x, y_mmap, block_size=1000)
+    threaded = inner_products(x, y_mmap, block_size=1000, max_workers=4)
+    assert(serial == threaded)
+    assert(np.allclose(serial, expected, rtol=1E-12))
+
+    cos = expected[0] / (expected[1] * expected[2]) ** 0.5
+    assert(angle(x, y, block_size=1000) == pytest.approx(np.arccos(cos)))
+    assert(angle(x, x) == 0.)
+
+
 def test_custom_import():
     """
     Test that importing based on internal modules works for various inputs
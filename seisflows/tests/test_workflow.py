@@ -0,0 +1,214 @@
+"""
+Test the Inversion workflow machinery which sits between the solver,
+preprocess and optimization modules, with a stand-in for the external
+numerical solver
+"""
+import os
+import pytest
+import numpy as np
+from glob import glob
+from seisflows import ROOT_DIR
+from seisflows.tools import unix
+from seisflows.tools.config import Dict
+from seisflows.tools.model import Model
+from seisflows.tools.specfem import read_fortran_binary
+from seisflows.system.workstation import Workstation
+from seisflows.solver.specfem2d import Specfem2D
+from seisflows.preprocess.default import Default
+from seisflows.optimize.gradient import Gradient
+from seisflows.workflow.inversion import Inversion
+from seisflows.workflow.migration import Migration
+
+
+TEST_SOLVER = os.path.join(ROOT_DIR, "tests", "test_data", "test_solver")
+
+
+def forward_simulation(solver, save_traces, **kwargs):
+    """
+    Stand-in for a SPECFEM2D forward simulation, run in the current solver
+    working directory. Synthetics are the observed traces scaled by the
+    (constant) value of the model imported into the working directory
+    """
+    value = np.mean([read_fortran_binary(fid) for fid in
+                     glob(os.path.join(solver.cwd, "DATA", "proc*_vs.bin"))])
+    for fid in glob(os.path.join(solver.cwd, "traces", "obs", "*.semd")):
+        data = np.loadtxt(fid)
+        data[:, 1] *= value
+        np.savetxt(os.path.join(save_traces, os.path.basename(fid)), data,
+                   fmt="%.10e")
+
+
+def make_inversion(workdir, ntask, speculative_steps=1, **kwargs):
+    """
+    Create an Inversion workflow and its modules for `ntask` sources,
+    without running the setup of the external solver
+
+    :type workdir: str
+    :param workdir: working directory of the workflow
+    :type ntask: int
+    :param ntask: number of sources
+    :type speculative_steps: int
+    :param speculative_steps: number of speculative line search candidates
+    :rtype: seisflows.workflow.inversion.Inversion
+    :return: workflow with modules assigned as attributes
+    """
+    modules = Dict(
+        system=Workstation(workdir=workdir, ntask=ntask),
+        solver=Specfem2D(workdir=workdir, ntask=ntask,
+                         path_specfem_data=os.path.join(TEST_SOLVER, "001",
+                                                        "DATA"),
+                         path_specfem_bin=os.path.join(TEST_SOLVER, "001",
+                                                       "bin")),
+        preprocess=Default(workdir=workdir, syn_data_format="ascii",
+                           obs_data_format="ascii", unit_output="disp",
+                           misfit="waveform", adjoint="waveform"),
+        optimize=Gradient(workdir=workdir, line_search_method="bracket",
+                          speculative_steps=speculative_steps),
+    )
+    workflow = Inversion(modules=modules, workdir=workdir, **kwargs)
+    for name, module in modules.items():
+        setattr(workflow, name, module)
+
+    unix.mkdir(modules.system.path.log_files)
+    unix.mkdir(modules.optimize.path.scratch)
+    unix.mkdir(workflow.path.eval_grad)
+    unix.mkdir(workflow.path.eval_func)
+
+    return workflow
+
+
+@pytest.fixture
+def inversion(tmpdir, monkeypatch):
+    """
+    An Inversion workflow for two sources with a speculative line search,
+    whose solver working directories hold observed data, and whose forward
+    simulations are replaced by `forward_simulation`
+    """
+    workflow = make_inversion(tmpdir, ntask=2, speculative_steps=2)
+    modules = workflow._modules  # NOQA
+    # Trial models are written to the solver with threaded I/O
+    modules.solver.model_io_workers = 2
+    for source_name in modules.solver.source_names:
+        cwd = os.path.join(modules.solver.path.scratch, source_name)
+        unix.mkdir(os.path.join(cwd, "DATA"))
+        unix.cp(src=os.path.join(TEST_SOLVER, "001", "DATA", "STATIONS"),
+                dst=os.path.join(cwd, "DATA"))
+        unix.cp(src=os.path.join(TEST_SOLVER, "001", "traces", "obs"),
+                dst=os.path.join(cwd, "traces", "obs"))
+        for name in ["syn", "adj"]:
+            unix.mkdir(os.path.join(cwd, "traces", name))
+
+    monkeypatch.setattr(modules.solver, "forward_simulation",
+                        lambda **kwargs: forward_simulation(modules.solver,
+                                                            **kwargs))
+
+    return workflow
+
+
+def test_speculative_line_search_misfit(inversion):
+    """
+    Each candidate of a speculative line search is simulated in its own
+    working directory, and its misfit is quantified from its own synthetics
+    """
+    optimize = inversion.optimize
+    m = Model()
+    m.model = Dict(vs=[np.full(10, 1.2, dtype="float32")])
+    m.fmt = ".bin"
+    optimize.save_vector("m_new", m)
+    g = m.copy()
+    g.update(vector=np.full(10, .1, dtype="float32"))
+    optimize.save_vector("g_new", g)
+    optimize.save_vector("p_new", g.copy().scale_(-1))
+    optimize.save_vector("f_new", 1.)
+
+    m_try, alpha = optimize.initialize_search()
+    inversion._expose_trial_models(m_try, alpha)  # NOQA
+    optimize.increment_step_count()
+    inversion._evaluate_line_search_misfit()  # NOQA
+
+    alphas = optimize.load_vector("alpha")
+    f_try = optimize.load_vector("f_try")
+    assert(len(alphas) == len(f_try) == 2)
+    assert(alphas[0] != alphas[1])
+
+    # Waveform misfit of synthetics v * obs is |v - 1| * ||obs||, summed
+    # over the squared residuals of both traces of both sources. Residuals
+    # files only hold 3 significant digits
+    obs_norm = sum(np.sum(np.loadtxt(fid)[:, 1] ** 2) * 0.06 for fid in glob(
+        os.path.join(TEST_SOLVER, "001", "traces", "obs", "*.semd")))
+    for candidate, alpha_ in enumerate(alphas):
+        value = np.mean(Model(path=os.path.join(
+            inversion.path.eval_func, f"model_{candidate:0>2}"),
+            flavor="2D").vector)
+        assert(value == pytest.approx(1.2 - .1 * alpha_))
+        assert(f_try[candidate] ==
+               pytest.approx(2 * (value - 1) ** 2 * obs_norm, rel=1e-2))
+
+
+def test_mini_batch_sources(tmpdir, monkeypatch):
+    """
+    Mini-batches are drawn reproducibly from the batch seed and iteration,
+    the solver and system are restricted to each batch during an iteration,
+    and all sources are restored once the inversion finishes
+    """
+    inversion = make_inversion(tmpdir, ntask=5, batch_size=2, batch_seed=3,
+                               end=3)
+    source_names = inversion.solver.source_names
+    with open(inversion.path.state_file, "w") as f:
+        f.write("# SeisFlows State File\n")
+
+    batches = []
+
+    def record_batch():
+        """Stand-in task list, records the sources seen by an iteration"""
+        assert(inversion.system.ntask == 2)
+        batches.append(inversion.solver.source_names)
+    monkeypatch.setattr(Inversion, "task_list",
+                        property(lambda self: [record_batch]))
+    inversion.run()
+
+    assert(len(batches) == 3)
+    for batch in batches:
+        assert(len(set(batch)) == 2 and set(batch) <= set(source_names))
+    assert(batches[0] != batches[1] or batches[1] != batches[2])
+    assert(inversion.solver.source_names == source_names)
+    assert(inversion.system.ntask == 5)
+
+    # The same seed and iteration draw the same batch
+    inversion = make_inversion(os.path.join(tmpdir, "rerun"), ntask=5,
+                               batch_size=2, batch_seed=3)
+    for iteration, batch in enumerate(batches, start=1):
+        inversion.iteration = iteration
+        inversion._set_source_batch()  # NOQA
+        assert(inversion.solver.source_names == batch)
+
+    # Resetting the solver batch considers all sources again
+    inversion.solver.set_source_batch(None)
+    assert(inversion.solver.source_names == source_names)
+
+
+def test_mini_batch_scaling(tmpdir, monkeypatch):
+    """
+    Misfit and gradient of a mini-batch are scaled by the same factor
+    ntask / batch_size to estimate those of all sources
+    """
+    inversion = make_inversion(tmpdir, ntask=5, batch_size=2)
+    residuals = np.array([1., 2., 3.])
+    assert(inversion._sum_residuals(residuals) ==  # NOQA
+           pytest.approx(5 / 2 * inversion.preprocess.sum_residuals(residuals)))
+
+    # Kernels are combined into a gradient by the solver, skipped here
+    monkeypatch.setattr(Migration, "evaluate_gradient_from_kernels",
+                        lambda self: None)
+    gradient = Model()
+    gradient.model = Dict(vs=[np.full(10, 2., dtype="float32")])
+    gradient.fmt = ".bin"
+    gradient.write(path=os.path.join(inversion.path.eval_grad, "gradient"))
+    inversion.evaluate_gradient_from_kernels()
+    g_new = inversion.optimize.load_vector("g_new")
+    assert(np.allclose(g_new.vector, 5 / 2 * 2.))
+
+    # Without mini-batches, nothing is scaled
+    inversion.batch_size = None
+    assert(inversion._sum_residuals(residuals) ==  # NOQA
+           pytest.approx(inversion.preprocess.sum_residuals(residuals)))
@@ -4,27 +4,75 @@ Mathematical tools for Seisflows
 """
 import sys
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from scipy.signal import hilbert as analytic
 
 from seisflows import logger
 from seisflows.tools import msg
 
 
-def angle(x, y):
+def angle(x, y, block_size=2 ** 20, max_workers=None):
     """
-    Determine the angle between two vectors using dot products
+    Determine the angle between two vectors using dot products, which are
+    reduced block by block in double precision, see `inner_products`
 
     :type x: np.array
     :param x: vector 1
     :type y: np.array
     :param y: vector 2
+    :type block_size: int
+    :param block_size: number of vector values reduced at once
+    :type max_workers: int
+    :param max_workers: number of threads to reduce blocks with. Values <= 1
+        run serially
     :rtype: float
-    :return: the angle in degrees between `x` and `y`
+    :return: the angle in radians between `x` and `y`
     """
-    xy = dot(x, y)
-    xx = dot(x, x)
-    yy = dot(y, y)
-    return np.arccos(xy / (xx * yy) ** 0.5)
+    xy, xx, yy = inner_products(x, y, block_size=block_size,
+                                max_workers=max_workers)
+    return np.arccos(np.clip(xy / (xx * yy) ** 0.5, -1., 1.))
+
+
+def inner_products(x, y, block_size=2 ** 20, max_workers=None):
+    """
+    Calculate the dot product of two vectors and the squared norms of each
+    in a single pass over blocks of the vectors. Only one block of each
+    vector is held in memory at a time, so large (e.g., memory-mapped)
+    vectors are read once without full-size intermediate copies. Blocks are
+    reduced in double precision and summed in order, so results do not
+    depend on `max_workers`
+
+    :type x: np.array
+    :param x: vector 1
+    :type y: np.array
+    :param y: vector 2, same length as `x`
+    :type block_size: int
+    :param block_size: number of vector values reduced at once
+    :type max_workers: int
+    :param max_workers: number of threads to reduce blocks with. Values <= 1
+        run serially
+    :rtype: tuple of float
+    :return: (x.y, x.x, y.y)
+    """
+    x = np.ravel(x)
+    y = np.ravel(y)
+    assert(len(x) == len(y)), f"vectors must have the same length"
+
+    def reduce_block(start):
+        """Dot products of one block of `x` and `y`, in double precision"""
+        x_ = x[start:start + block_size].astype(np.float64)
+        y_ = y[start:start + block_size].astype(np.float64)
+        return np.array([np.dot(x_, y_), np.dot(x_, x_), np.dot(y_, y_)])
+
+    starts = range(0, len(x), block_size)
+    if max_workers and max_workers > 1 and len(starts) > 1:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            blocks = list(executor.map(reduce_block, starts))
+    else:
+        blocks = [reduce_block(start) for start in starts]
+
+    xy, xx, yy = sum(blocks, np.zeros(3))
+    return float(xy), float(xx), float(yy)
 
 
 def dot(x, y):
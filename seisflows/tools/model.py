@@ -5,16 +5,21 @@ models into memory, manipulate and write to disk. Also contains plotting
 functions for SPECFEM2D models
 """
 import os
+import json
+import hashlib
 import numpy as np
 import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
+from fnmatch import filter as fnfilter
 from glob import glob
 from seisflows import logger
 from seisflows.tools import unix
 from seisflows.tools.config import Dict
 from seisflows.tools.math import poissons_ratio
 from seisflows.tools.graphics import plot_2d_image
-from seisflows.tools.specfem import read_fortran_binary, write_fortran_binary
+from seisflows.tools.specfem import (read_fortran_binary, write_fortran_binary,
+                                     memmap_fortran_binary, read_ascii_model)
 
 
 class Model:
@@ -37,9 +42,13 @@ class Model:
     for parameter in acceptable_parameters[:]:
         for region in ["1", "2", "3"]:
             acceptable_parameters.append(f"reg{region}_{parameter}")
+    # Hidden sidecar file used to cache the contents of model directories
+    index_file = ".model_index.json"
+    # Hidden sidecar file with content hashes of written processor files
+    hash_file = ".model_hashes.json"
 
     def __init__(self, path=None, fmt="", parameters=None, regions="123", 
-                 flavor=None):
+                 flavor=None, lazy=False, max_workers=1):
         """
         Model only needs path to model to determine model parameters. Format
         `fmt` can be provided by the user or guessed based on available file
@@ -51,7 +60,8 @@ class Model:
             you must use the update() function.
 
         :type path: str
-        :param path: path to SPECFEM model/kernel/gradient files
+        :param path: path to SPECFEM model/kernel/gradient files, or to a
+            Model previously saved with save() (.npz) or save_flat() (.npy)
         :type fmt: str
         :param fmt: expected format of the files (e.g., '.bin'), if None, will
             attempt to guess based on the file extensions found in `path`
@@ -68,11 +78,22 @@ class Model:
         :param flavor: optional, tell Model what version of SPECFEM was used
             to generate the model, acceptable values are ['2D', '3D', '3DGLOBE']
             If None, will try to guess based on file matching
+        :type lazy: bool
+        :param lazy: only for Fortran binary (.bin) models and flat (.npy)
+            vectors. Memory-map each processor file (or the flat vector)
+            rather than reading it into memory, so that data are only paged
+            in from disk when accessed. For Fortran binaries, accessing
+            `vector` will read the full model into memory
+        :type max_workers: int
+        :param max_workers: number of threads used to read and write
+            processor files concurrently. Defaults to 1 (serial I/O). Useful
+            on parallel filesystems where many small file operations dominate
         """
         self.path = path
         self.fmt = fmt
         self.flavor = flavor
-        self.model = None
+        self.lazy = lazy
+        self.max_workers = max_workers
         if regions:
             self.regions = sorted([f"reg{i}" for i in regions])
         else:
@@ -81,6 +102,17 @@ class Model:
         self._parameters = parameters
         self._ngll = None
         self._nproc = None
+
+        # Model data is stored in a single contiguous `_buffer`, `_model` holds
+        # per-parameter, per-processor views into that buffer and `_offsets`
+        # is the table of [start, stop) buffer indices for each of the views
+        self._buffer = None
+        self._offsets = None
+        self._model = None
+        # True if `_buffer` is shared with a shallow copy, see copy()
+        self._shared = False
+        # Cached listing of the files in `path`, see _index_directory()
+        self._index = None
     
         # Check that User-provided (optional) flavor matches acceptable values
         if self.flavor is not None:
@@ -96,8 +128,15 @@ class Model:
                     self.load(file=self.path)
                 _first_key = list(self.model.keys())[0]
                 self._nproc = len(self.model[_first_key])
+            # Read a flat vector previously saved with save_flat()
+            elif os.path.splitext(path)[-1] == ".npy":
+                self._load_flat(file=self.path)
             # Read a SPECFEM model from its native output files
             else:
+                # List the directory once (or reuse a cached listing), all
+                # file matching below is done against this listing
+                self._index = self._index_directory()
+
                 # Dynamically guess things about the model based on files given
                 if not self.fmt:
                     self.fmt = self._guess_file_format()
@@ -105,9 +144,21 @@ class Model:
                     self.flavor = self._guess_specfem_flavor()
     
                 # Gather internal representation of the model for manipulation
-                self._nproc, self.available_parameters = \
-                    self._get_nproc_parameters()
-                self.model = self.read(parameters=parameters)
+                if self._index.get("fmt") == self.fmt:
+                    self._nproc = self._index["nproc"]
+                    self.available_parameters = self._index["parameters"]
+                else:
+                    self._nproc, self.available_parameters = \
+                        self._get_nproc_parameters()
+                    self._write_index()
+                if self.lazy and self.fmt != ".bin":
+                    logger.warning(f"lazy loading not available for format "
+                                   f"{self.fmt}, reading model into memory")
+                    self.lazy = False
+                if self.lazy:
+                    self._set_lazy_model(self.read(parameters=parameters))
+                else:
+                    self.model = self.read(parameters=parameters)
 
                 # Coordinates are only useful for SPECFEM2D models
                 if self.flavor == "2D":
@@ -146,6 +197,126 @@ class Model:
 
         return filename_format
 
+    @property
+    def model(self):
+        """
+        Dictionary representation of the model, where keys are parameters and
+        values are lists of arrays, one per processor.
+
+        .. note::
+            Arrays are views into the contiguous buffer that backs `vector`,
+            so in-place changes to one are seen by the other. Assigning a new
+            dictionary copies its contents into a newly allocated buffer.
+
+        :rtype: Dict of list of np.array
+        :return: dictionary representation of the model
+        """
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        """
+        Allocate a single contiguous buffer large enough to hold all
+        parameters and processors in `model` and copy data into it.
+
+        :type model: dict of list of np.array
+        :param model: dictionary with parameters as keys and arrays (one per
+            processor) as values. All parameters must share the same number of
+            processors and GLL points per processor
+        """
+        self._shared = False
+        if model is None:
+            self._buffer = None
+            self._offsets = None
+            self._model = None
+            return
+
+        parameters = sorted(model.keys())
+        ngll = [len(proc) for proc in model[parameters[0]]]
+
+        # Keep single precision SPECFEM data as is, but promote integers
+        dtype = np.result_type(*[np.asarray(proc).dtype for key in parameters
+                                 for proc in model[key]], np.float32)
+
+        self._parameters = parameters
+        self._ngll = ngll
+        self._nproc = len(ngll)
+        self._offsets = self._calculate_offsets(parameters, ngll)
+        self._buffer = np.empty(self._offsets[-1, -1], dtype=dtype)
+        for idim, key in enumerate(parameters):
+            assert (len(model[key]) == self._nproc), (
+                f"parameter {key} does not match expected number of processors"
+            )
+            for iproc, proc in enumerate(model[key]):
+                imin, imax = self._offsets[idim, iproc:iproc + 2]
+                self._buffer[imin:imax] = proc
+
+        self._model = self._views(self._buffer)
+
+    @staticmethod
+    def _calculate_offsets(parameters, ngll):
+        """
+        Build the offset table used to locate each parameter/processor slice
+        in the flattened vector. Row `idim` defines the start index of each
+        processor for parameter `idim`, with a trailing column defining the
+        end index of the parameter, such that slice `iproc` of parameter
+        `idim` is `vector[offsets[idim, iproc]:offsets[idim, iproc + 1]]`
+
+        :type parameters: list of str
+        :param parameters: ordered parameters that make up the vector
+        :type ngll: list of int
+        :param ngll: number of GLL points for each processor
+        :rtype: np.array
+        :return: offset table with shape (len(parameters), len(ngll) + 1)
+        """
+        cumulative = np.concatenate([[0], np.cumsum(ngll, dtype=int)])
+        starts = np.arange(len(parameters), dtype=int) * cumulative[-1]
+
+        return starts[:, None] + cumulative[None, :]
+
+    def _views(self, vector):
+        """
+        Create per-parameter, per-processor views into a flattened `vector`
+        using the precomputed offset table. No data are copied.
+
+        :type vector: np.array
+        :param vector: vector with the same layout as the internal buffer
+        :rtype: Dict of list of np.array
+        :return: dictionary of views into `vector`
+        """
+        model = Dict()
+        for idim, key in enumerate(self.parameters):
+            offsets = self._offsets[idim]
+            model[key] = [vector[offsets[i]:offsets[i + 1]]
+                          for i in range(len(offsets) - 1)]
+        return model
+
+    def _set_lazy_model(self, model):
+        """
+        Store memory-mapped processor slices as the model without allocating
+        the contiguous buffer. Metadata (parameters, GLL points, offsets) are
+        set immediately so that the Model can be used as normal, the buffer
+        is only allocated once the full `vector` is requested.
+
+        :type model: dict of list of np.memmap
+        :param model: dictionary of memory-mapped processor slices
+        """
+        self._parameters = sorted(model.keys())
+        self._ngll = [len(proc) for proc in model[self._parameters[0]]]
+        self._nproc = len(self._ngll)
+        self._offsets = self._calculate_offsets(self._parameters, self._ngll)
+        self._buffer = None
+        self._model = Dict({key: list(model[key]) for key in self._parameters})
+
+    def _materialize(self):
+        """
+        Read a lazily loaded (memory-mapped) model into the contiguous buffer.
+        Does nothing if the model is already in memory.
+        """
+        if self._buffer is None and self._model is not None:
+            logger.debug("reading memory-mapped model into memory")
+            self.model = self._model
+
     @property
     def parameters(self):
         """
@@ -195,6 +366,10 @@ class Model:
         Conveience property to access the merge() function which creates a
         linear vector defining all model parameters
 
+        .. note::
+            The returned vector is the internal buffer itself, not a copy.
+            Changing its values in place changes the model.
+
         :rtype: np.array
         :return: a linear vector of all model parameters
         """
@@ -204,9 +379,79 @@ class Model:
             raise TypeError("Model cannot merge files into continous "
                             "vector") from e
 
-    def copy(self):
-        """Returns a deep copy of self so that models can be transferred"""
-        return deepcopy(self)
+    def copy(self, deep=True):
+        """
+        Returns a copy of self so that models can be transferred.
+
+        A deep copy copies the data buffer once and re-creates views on the
+        copy so that the copy does not share memory with the original.
+
+        A shallow (copy-on-write) copy only copies metadata. The copy gets a
+        read-only view of the data of this Model, which is marked as shared
+        but otherwise left untouched. Whichever Model is first modified in
+        place (axpy, scale_, add_, mul_, apply) copies the data at that
+        point. Replacing data with update() or by setting `model` never
+        copies, so derived Models that are immediately overwritten cost
+        nothing.
+
+        .. note::
+            After a shallow copy, writing directly into the `vector` or
+            `model` arrays of the copy raises a ValueError, while direct
+            writes into those of this Model also change the copy. Use the
+            in-place methods, which copy on write
+
+        :type deep: bool
+        :param deep: copy the data buffer immediately. If False, share data
+            until one of the Models is modified
+        :rtype: Model
+        :return: copy of this Model
+        """
+        buffer, model = self._buffer, self._model
+        model_copy = self._copy_metadata()
+
+        if buffer is not None and deep:
+            model_copy._buffer = buffer.copy()
+            model_copy._model = model_copy._views(model_copy._buffer)
+        elif buffer is not None:
+            model_copy._buffer = buffer.view()
+            model_copy._buffer.flags.writeable = False
+            model_copy._model = model_copy._views(model_copy._buffer)
+            self._shared = True
+        # Memory-mapped slices are read-only and so can be safely shared
+        elif model is not None:
+            model_copy._model = Dict({key: list(val)
+                                      for key, val in model.items()})
+
+        return model_copy
+
+    def _copy_metadata(self):
+        """
+        Returns a deep copy of self without any model data, used to create new
+        Models that share the layout (parameters, offsets, GLL points) of
+        this one
+        """
+        buffer, model, index = self._buffer, self._model, self._index
+        self._buffer, self._model, self._index = None, None, None
+        try:
+            model_copy = deepcopy(self)
+        finally:
+            self._buffer, self._model, self._index = buffer, model, index
+        model_copy._shared = False
+
+        return model_copy
+
+    def _writable(self):
+        """
+        Make sure the data buffer can be modified in place. Lazily loaded
+        models are read into memory, and read-only or shared data (see
+        copy()) are copied first.
+        """
+        self._materialize()
+        if self._shared or not self._buffer.flags.writeable:
+            logger.debug("copying shared model data before write")
+            self._buffer = self._buffer.copy()
+            self._model = self._views(self._buffer)
+            self._shared = False
 
     def read(self, parameters=None):
         """
@@ -234,9 +479,16 @@ class Model:
                 f"{self.available_parameters}"
             )
 
+        # Fortran binaries are read file-by-file so that all (parameter, proc)
+        # pairs can be fanned out to the I/O thread pool at once
+        if self.fmt == ".bin" and not self.lazy:
+            return self._read_model_fortran_binaries(parameters)
+        # ASCII files contain all parameters so each file is only read once
+        elif self.fmt == ".dat":
+            return self._read_model_ascii(parameters)
+
         # Pick the correct read function based on the file format
         load_fx = {".bin": self._read_model_fortran_binary,
-                   ".dat": self._read_model_ascii,
                    ".adios": self._read_model_adios  # TODO Check if this okay
                    }[self.fmt]
 
@@ -247,6 +499,27 @@ class Model:
 
         return parameter_dict
 
+    def _map(self, func, *iterables, max_workers=None):
+        """
+        Apply `func` to each item of `iterables`, optionally distributed over
+        a pool of threads. Results are returned in input order regardless of
+        the order in which they complete, so outputs are deterministic.
+
+        :type func: function
+        :param func: function to apply to each item
+        :type max_workers: int
+        :param max_workers: number of threads to use, defaults to
+            `self.max_workers`. Values <= 1 run serially
+        :rtype: list
+        :return: list of outputs of `func`, ordered as the inputs
+        """
+        max_workers = max_workers or self.max_workers
+        if max_workers and max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                return list(executor.map(func, *iterables))
+        else:
+            return list(map(func, *iterables))
+
     def read_coordinates_specfem2d(self):
         """
         Attempt to read coordinate files from the given model definition.
@@ -267,11 +540,10 @@ class Model:
             coordinates["x"] = self._read_model_fortran_binary(parameter="x")
             coordinates["z"] = self._read_model_fortran_binary(parameter="z")
         elif self.fmt == ".dat":
-            fids = glob(os.path.join(self.path,
-                                     self.fnfmt(val="*", ext=".dat")))
-            for fid in sorted(fids):
-                coordinates["x"].append(np.loadtxt(fid).T[:, 0])
-                coordinates["z"].append(np.loadtxt(fid).T[:, 0])
+            for fid in self._glob(self.fnfmt(val="*", ext=".dat")):
+                data = read_ascii_model(fid)
+                coordinates["x"].append(data[0])
+                coordinates["z"].append(data[1])
 
         # If nothing is found even though we expected files to be there
         if not list(coordinates["x"]) or not list(coordinates["z"]):
@@ -298,29 +570,60 @@ class Model:
         This vector representation is used by the optimization library during
         model perturbation.
 
+        .. note::
+            Model data are already stored contiguously, so this returns a view
+            of the internal buffer (or a section of it) rather than a copy
+
         :type parameter: str
         :param parameter: single parameter to retrieve model vector from,
             otherwise returns all parameters merged into single vector
         :rtype: np.array
         :return: vector representation of the model
         """
-        m = np.array([])
-        if parameter is None:
-            parameters = self.parameters
-        else:
-            parameters = [parameter]
+        # Lazily loaded models only read the requested parameter from disk
+        if parameter is not None and self._buffer is None and \
+                self._model is not None:
+            return np.concatenate(self._model[parameter])
 
-        for parameter in parameters:
-            for iproc in range(self.nproc):
-                m = np.append(m, self.model[parameter][iproc])
+        self._materialize()
+        if self._buffer is None:
+            raise TypeError("Model has no data to merge")
+
+        if parameter is None:
+            return self._buffer
 
-        return m
+        idim = self.parameters.index(parameter)
+        return self._buffer[self._offsets[idim, 0]:self._offsets[idim, -1]]
 
-    def write(self, path, fmt=None):
+    def write(self, path, fmt=None, max_workers=None, incremental=False):
         """
         Save a SPECFEM model/gradient/kernel vector loaded into memory back to
         disk in the appropriate format expected by SPECFEM
+
+        .. note::
+            With `incremental`, a content hash of each processor file is
+            kept in a hidden sidecar file (`hash_file`) in `path`. Files whose
+            contents would be identical to what is already on disk are not
+            rewritten, e.g., slices left unchanged by a mask or a regional
+            parameterization
+
+        :type path: str
+        :param path: directory to write model files to
+        :type fmt: str
+        :param fmt: file format to write, defaults to the format of the Model
+        :type max_workers: int
+        :param max_workers: number of threads used to write processor files,
+            defaults to `self.max_workers`
+        :type incremental: bool
+        :param incremental: only rewrite processor files whose contents have
+            changed since the last incremental write to `path`
+        :rtype: int
+        :return: number of bytes that did not need to be written
         """
+        # Memory-mapped files cannot be overwritten while they are being read
+        if self.path and os.path.abspath(path) == os.path.abspath(self.path):
+            self._materialize()
+
         unix.mkdir(path)
         if fmt is None:
             assert (self.fmt is not None), f"must specifiy model format: `fmt`"
@@ -332,7 +635,8 @@ class Model:
                    # ".adios": _write_model_adios   # TODO Check if  right
                    }[fmt]
 
-        save_fx(path=path)
+        return save_fx(path=path, max_workers=max_workers,
+                       incremental=incremental)
 
     def split(self, vector=None):
         """
@@ -343,104 +647,187 @@ class Model:
         :type vector: np.array
         :param vector: allow Model to split an input vector. If none given,
             will split the internal vector representation
-        :rtype: Dict of np.array
-        :return: dictionary of model parameters split up by number of processors
+        :rtype: Dict of list of np.array
+        :return: dictionary of model parameters split up by number of
+            processors. Values are views into `vector`, no data are copied
         """
         if vector is None:
             vector = self.vector
+        else:
+            self._check_vector_size(vector)
 
-        model = Dict({key: [] for key in self.parameters})
-        for idim, key in enumerate(self.parameters):
-            for iproc in range(self.nproc):
-                imin = sum(self.ngll) * idim + sum(self.ngll[:iproc])
-                imax = sum(self.ngll) * idim + sum(self.ngll[:iproc + 1])
-                model[key].extend([vector[imin:imax]])
+        return self._views(vector)
 
-            model[key] = np.array(model[key])
-        return model
+    def _check_vector_size(self, vector):
+        """
+        Ensure that an external vector matches the layout of this Model
+
+        :type vector: np.array
+        :param vector: vector to check against the offset table
+        """
+        if len(vector) != self._offsets[-1, -1]:
+            raise ValueError(f"vector of length {len(vector)} does not match "
+                             f"Model length {self._offsets[-1, -1]}")
 
-    def check(self, min_pr=-1., max_pr=0.5):
+    def check(self, min_pr=-1., max_pr=0.5, max_workers=None):
         """
         Checks parameters in the model. If Vs and Vp present, checks poissons
         ratio. Checks for negative velocity values. And prints out model
         min/max values
+
+        .. note::
+            All values are gathered in a single sweep over the processor
+            slices (see `statistics`), so lazily loaded models are checked
+            without being read fully into memory
+
+        :type min_pr: float
+        :param min_pr: minimum allowable Poisson's ratio
+        :type max_pr: float
+        :param max_pr: maximum allowable Poisson's ratio
+        :type max_workers: int
+        :param max_workers: number of threads used to check processor slices
+            concurrently, defaults to `self.max_workers`
         """
         if self.flavor in ["2D", "3D"]:
-            self._check_2d3d_parameters(min_pr, max_pr)
+            self._check_2d3d_parameters(min_pr, max_pr, max_workers)
         elif self.flavor == "3DGLOBE":
-            self._check_3dglobe_parameters(min_pr, max_pr)
+            self._check_3dglobe_parameters(min_pr, max_pr, max_workers)
 
-    def _check_2d3d_parameters(self, min_pr=-1., max_pr=0.5):
+    def minmax(self, parameter):
+        """
+        Minimum and maximum value of a single model parameter, reduced one
+        processor slice at a time
+
+        :type parameter: str
+        :param parameter: model parameter to get the range of
+        :rtype: tuple of float
+        :return: (minimum value, maximum value)
+        """
+        min_val, max_val = np.inf, -np.inf
+        for proc in self.model[parameter]:
+            min_val = min(min_val, proc.min())
+            max_val = max(max_val, proc.max())
+
+        return float(min_val), float(max_val)
+
+    def statistics(self, pairs=None, max_workers=None):
+        """
+        Minimum and maximum values of every model parameter, and of the
+        Poisson's ratio of each (vp, vs) pair in `pairs`, gathered in a single
+        sweep over the processor slices. Each slice is read once and reduced
+        in place, no parameters are concatenated. Slices may be reduced
+        concurrently on a thread pool.
+
+        :type pairs: list of tuple of str
+        :param pairs: (vp parameter, vs parameter) pairs to compute Poisson's
+            ratio bounds for, e.g., [('vp', 'vs')]
+        :type max_workers: int
+        :param max_workers: number of threads used to reduce processor slices,
+            defaults to `self.max_workers`
+        :rtype: Dict
+        :return: (minimum, maximum) for each parameter, keyed by parameter
+            name, and for each Poisson's ratio pair, keyed by the pair
+        """
+        pairs = pairs or []
+
+        def _reduce_slice(iproc):
+            """Min and max of all parameters and pairs for a single slice"""
+            stats = {}
+            for key in self.parameters:
+                proc = self.model[key][iproc]
+                stats[key] = (proc.min(), proc.max())
+            for vp_par, vs_par in pairs:
+                pr = poissons_ratio(vp=self.model[vp_par][iproc],
+                                    vs=self.model[vs_par][iproc])
+                stats[(vp_par, vs_par)] = (pr.min(), pr.max())
+            return stats
+
+        slice_stats = self._map(_reduce_slice, range(self.nproc),
+                                max_workers=max_workers)
+
+        stats = Dict()
+        for key in slice_stats[0]:
+            stats[key] = (float(min(_[key][0] for _ in slice_stats)),
+                          float(max(_[key][1] for _ in slice_stats)))
+
+        return stats
+
+    def _check_2d3d_parameters(self, min_pr=-1., max_pr=0.5, max_workers=None):
         """
         Checks parameters for SPECFEM2D and SPECFEM3D derived models
         """
+        pairs = []
         if "vs" in self.parameters and "vp" in self.parameters:
-            pr = poissons_ratio(vp=self.merge(parameter="vp"),
-                                vs=self.merge(parameter="vs"))
-            if pr.min() < 0:
-                logger.warning("minimum poisson's ratio is negative")
-            if pr.max() < min_pr:
-                logger.warning(f"maximum poisson's ratio out of bounds: "
-                               f"{pr.max():.2f} > {max_pr}")
-            if pr.min() > max_pr:
-                logger.warning(f"minimum poisson's ratio out of bounds: "
-                               f"{pr.min():.2f} < {min_pr}")
-
-        if "vs" in self.model and np.hstack(self.model.vs).min() < 0:
-            logger.warning(f"Vs minimum is negative {self.model.vs.min()}")
-
-        if "vp" in self.model and np.hstack(self.model.vp).min() < 0:
-            logger.warning(f"Vp minimum is negative {self.model.vp.min()}")
+            pairs.append(("vp", "vs"))
 
-        # Tell the User min and max values of the updated model
-        for key, vals in self.model.items():
-            min_val = np.hstack(vals).min()
-            max_val = np.hstack(vals).max()
-            # Choose formatter based on the magnitude of the value
-            if min_val < 1 or max_val > 1E4:
-                parts = f"{min_val:.2E} <= {key} <= {max_val:.2E}"
-            else:
-                parts = f"{min_val:.2f} <= {key} <= {max_val:.2f}"
-            logger.info(parts)
+        self._check_parameters(velocities=["vs", "vp"], pairs=pairs,
+                               min_pr=min_pr, max_pr=max_pr,
+                               max_workers=max_workers)
 
-    def _check_3dglobe_parameters(self, min_pr=-1., max_pr=0.5):
+    def _check_3dglobe_parameters(self, min_pr=-1., max_pr=0.5,
+                                  max_workers=None):
         """
-        Checks parameters for SPECFEM3D_GLOBE derived models
+        Checks parameters for SPECFEM3D_GLOBE derived models, for which all
+        parameters are separated by region
         """
-        # Check for negative velocities
-        for tag in ["vsv", "vsh", "vph", "vpv", "vp", "vs"]:
-            for reg in self.regions:
-                par = f"{reg}_{tag}"
-                if par in self.model and \
-                        np.hstack(self.model[par]).min() < 0:
-                    logger.warning(f"{par} minimum for is negative "
-                                   f"{self.model['par'].min()}")
+        velocities = [f"{reg}_{tag}" for tag in
+                      ["vsv", "vsh", "vph", "vpv", "vp", "vs"]
+                      for reg in self.regions]
 
         # Check Poisson's ratio for all (an)isotropic velocity combinations
-        for vs_par in ["vs", "vsv", "vsh"]:
-            for vp_par in ["vp", "vpv", "vph"]:
+        pairs = []
+        for vs_tag in ["vs", "vsv", "vsh"]:
+            for vp_tag in ["vp", "vpv", "vph"]:
                 for reg in self.regions:
-                    vs_par = f"{reg}_{vs_par}"  # e.g., 'reg1_vsv'
-                    vp_par = f"{reg}_{vp_par}"
+                    vs_par = f"{reg}_{vs_tag}"  # e.g., 'reg1_vsv'
+                    vp_par = f"{reg}_{vp_tag}"
                     if vs_par in self.parameters and vp_par in self.parameters:
-                        pr = poissons_ratio(vp=self.merge(parameter=vp_par),
-                                            vs=self.merge(parameter=vs_par))
-                        if pr.min() < 0:
-                            logger.warning(f"minimum {vp_par}, {vs_par} "
-                                           f"poisson's ratio is negative")
-                        if pr.max() < min_pr:
-                            logger.warning(f"maximum {vp_par}, {vs_par} "
-                                           f"poisson's ratio out of bounds: "
-                                           f"{pr.max():.2f} > {max_pr}")
-                        if pr.min() > max_pr:
-                            logger.warning(f"minimum {vp_par}, {vs_par} "
-                                           f"poisson's ratio out of bounds: "
-                                           f"{pr.min():.2f} < {min_pr}")
-
-        # SPECFEM3D_GLOBE requires an additional separation by region
-        for key, vals in self.model.items():
-            min_val = np.hstack(vals).min()
-            max_val = np.hstack(vals).max()
+                        pairs.append((vp_par, vs_par))
+
+        self._check_parameters(velocities=velocities, pairs=pairs,
+                               min_pr=min_pr, max_pr=max_pr,
+                               max_workers=max_workers)
+
+    def _check_parameters(self, velocities, pairs, min_pr=-1., max_pr=0.5,
+                          max_workers=None):
+        """
+        Log warnings for out of bounds Poisson's ratios and negative
+        velocities, and tell the User min and max values of each parameter
+
+        :type velocities: list of str
+        :param velocities: velocity parameters which must not be negative.
+            Parameters not in the model are ignored
+        :type pairs: list of tuple of str
+        :param pairs: (vp parameter, vs parameter) pairs to check Poisson's
+            ratio for
+        :type min_pr: float
+        :param min_pr: minimum allowable Poisson's ratio
+        :type max_pr: float
+        :param max_pr: maximum allowable Poisson's ratio
+        :type max_workers: int
+        :param max_workers: number of threads used to reduce processor slices
+        """
+        stats = self.statistics(pairs=pairs, max_workers=max_workers)
+
+        for vp_par, vs_par in pairs:
+            pr_min, pr_max = stats[(vp_par, vs_par)]
+            if pr_min < 0:
+                logger.warning(f"minimum {vp_par}, {vs_par} poisson's ratio "
+                               f"is negative")
+            if pr_max > max_pr:
+                logger.warning(f"maximum {vp_par}, {vs_par} poisson's ratio "
+                               f"out of bounds: {pr_max:.2f} > {max_pr}")
+            if pr_min < min_pr:
+                logger.warning(f"minimum {vp_par}, {vs_par} poisson's ratio "
+                               f"out of bounds: {pr_min:.2f} < {min_pr}")
+
+        for par in velocities:
+            if par in self.parameters and stats[par][0] < 0:
+                logger.warning(f"{par} minimum is negative {stats[par][0]}")
+
+        # Tell the User min and max values of the updated model
+        for key in self.parameters:
+            min_val, max_val = stats[key]
             # Choose formatter based on the magnitude of the value
             if min_val < 1 or max_val > 1E4:
                 parts = f"{min_val:.2E} <= {key} <= {max_val:.2E}"
@@ -453,7 +840,11 @@ class Model:
         Save instance attributes (model, vector, metadata) to disk as an
         .npz array so that it can be loaded in at a later time for future use
         """
-        model = self.split()
+        # Lazily loaded models are written one parameter at a time from disk
+        if self._buffer is None:
+            model = Dict({key: self.model[key] for key in self.parameters})
+        else:
+            model = self.split()
         if self.coordinates:
             # Incase we have model parameters called 'x' or 'z', rename for save
             model["x_coord"] = self.coordinates["x"]
@@ -461,6 +852,104 @@ class Model:
 
         np.savez(file=path, fmt=self.fmt, **model)
 
+    def save_flat(self, path):
+        """
+        Save the model as a single flat vector (.npy) which can be memory-
+        mapped when loaded, plus a small metadata file (see `flat_metadata`)
+        defining parameters, GLL points per slice, format, flavor and
+        coordinates. Lazily loaded models are written one slice at a time.
+
+        .. note::
+            Files are written to a temporary file and then moved into place,
+            so that Models memory-mapping a previous version of `path` remain
+            valid
+
+        :type path: str
+        :param path: .npy file to save the vector to
+        """
+        assert (path.endswith(".npy")), f"flat vector must be saved as .npy"
+        tmp = f"{path}.tmp"
+        if self._buffer is not None:
+            with open(tmp, "wb") as f:
+                np.save(f, self._buffer)
+        else:
+            self._write_flat_slices(tmp, self._slices())
+        os.replace(tmp, path)
+
+        self._save_flat_metadata(path)
+
+    @staticmethod
+    def flat_metadata(path):
+        """
+        Name of the metadata file that accompanies a flat vector
+
+        :type path: str
+        :param path: .npy file of the flat vector, e.g., 'm_new.npy'
+        :rtype: str
+        :return: path to the metadata file, e.g., 'm_new.meta.npz'
+        """
+        return f"{os.path.splitext(path)[0]}.meta.npz"
+
+    def _write_flat_slices(self, path, slices):
+        """
+        Write processor slices one at a time into a flat .npy vector on disk,
+        so that the full vector never needs to be held in memory
+
+        :type path: str
+        :param path: file to write the .npy vector to
+        :type slices: iterable of np.array
+        :param slices: processor slices in vector order, see _slices()
+        """
+        dtype = self.model[self.parameters[0]][0].dtype
+        out = np.lib.format.open_memmap(path, mode="w+", dtype=dtype,
+                                        shape=(int(self._offsets[-1, -1]),))
+        imin = 0
+        for proc in slices:
+            out[imin:imin + len(proc)] = proc
+            imin += len(proc)
+        out.flush()
+        del out
+
+    def _save_flat_metadata(self, path):
+        """
+        Write the metadata file of a flat vector saved by save_flat()
+
+        :type path: str
+        :param path: .npy file of the flat vector
+        """
+        metadata = dict(fmt=self.fmt, flavor=str(self.flavor or ""),
+                        parameters=np.array(self.parameters),
+                        ngll=np.array(self.ngll))
+        if self.coordinates:
+            metadata["x_coord"] = self.coordinates["x"]
+            metadata["z_coord"] = self.coordinates["z"]
+        np.savez(file=self.flat_metadata(path), **metadata)
+
+    def _load_flat(self, file):
+        """
+        Load a flat vector previously saved by save_flat(). If `lazy`, the
+        vector is memory-mapped read-only and becomes the internal buffer
+        without being read, otherwise it is read into memory
+
+        :type file: str
+        :param file: .npy file to load data from
+        """
+        metadata = np.load(self.flat_metadata(file))
+        self.fmt = str(metadata["fmt"])
+        self.flavor = self.flavor or str(metadata["flavor"]) or None
+        if "x_coord" in metadata.files:
+            self.coordinates = Dict(x=metadata["x_coord"],
+                                    z=metadata["z_coord"])
+
+        self._parameters = [str(_) for _ in metadata["parameters"]]
+        self._ngll = [int(_) for _ in metadata["ngll"]]
+        self._nproc = len(self._ngll)
+        self._offsets = self._calculate_offsets(self._parameters, self._ngll)
+
+        self._buffer = np.load(file, mmap_mode="r" if self.lazy else None)
+        self._check_vector_size(self._buffer)
+        self._model = self._views(self._buffer)
+
     def _load2d3d(self, file):
         """
         Load in a previously saved .npz file containing model information
@@ -528,11 +1017,220 @@ class Model:
         Update internal model/vector defitions. Because these two quantities
         are tied to one another, updating one will update the other. This
         function simply makes that easier.
+
+        .. note::
+            A given `vector` is adopted as the internal buffer without being
+            copied (unless it is not contiguous), so the caller should not
+            modify it afterwards unless it intends to modify the Model
+
+        :type model: dict of list of np.array
+        :param model: dictionary representation to copy into the Model
+        :type vector: np.array
+        :param vector: vector representation to use as the Model data
         """
         if model is not None:
             self.model = model
         elif vector is not None:
-            self.model = self.split(vector=vector)
+            self._check_vector_size(vector)
+            self._buffer = np.ascontiguousarray(vector).reshape(-1)
+            self._model = self._views(self._buffer)
+            self._shared = False
+
+    def _slices(self, x=None):
+        """
+        List the processor slices of this Model, or of `x` laid out like this
+        Model, in vector order (parameter by parameter, processor by
+        processor). Used to apply operations one slice at a time.
+
+        :type x: Model or np.array
+        :param x: optional other Model or vector to list slices for. Must match
+            the parameters and GLL points of this Model
+        :rtype: list of np.array
+        :return: list of views into the model data
+        """
+        if x is None:
+            model = self.model
+        elif isinstance(x, Model):
+            assert (x.parameters == self.parameters and x.ngll == self.ngll), \
+                f"Model parameters and GLL points must match to operate on both"
+            model = x.model
+        else:
+            model = self.split(vector=np.asarray(x))
+
+        return [proc for key in self.parameters for proc in model[key]]
+
+    def axpy(self, alpha, x):
+        """
+        In-place update `self = self + alpha * x`, computed one processor
+        slice at a time with a reusable scratch array so that no model-sized
+        temporary arrays are created
+
+        :type alpha: float
+        :param alpha: scalar to multiply `x` by
+        :type x: Model or np.array
+        :param x: Model or vector with the same layout as this Model
+        :rtype: Model
+        :return: this Model, updated in place
+        """
+        self._writable()
+        scratch = np.empty(max(self.ngll), dtype=self._buffer.dtype)
+        for y_, x_ in zip(self._slices(), self._slices(x)):
+            tmp = scratch[:len(y_)]
+            np.multiply(x_, alpha, out=tmp)
+            np.add(y_, tmp, out=y_)
+
+        return self
+
+    def scale_(self, alpha):
+        """
+        In-place update `self = alpha * self`
+
+        :type alpha: float
+        :param alpha: scalar to multiply the Model by
+        :rtype: Model
+        :return: this Model, updated in place
+        """
+        self._writable()
+        np.multiply(self._buffer, alpha, out=self._buffer)
+
+        return self
+
+    def add_(self, x):
+        """
+        In-place update `self = self + x`, one processor slice at a time
+
+        :type x: Model or np.array
+        :param x: Model or vector with the same layout as this Model
+        :rtype: Model
+        :return: this Model, updated in place
+        """
+        self._writable()
+        for y_, x_ in zip(self._slices(), self._slices(x)):
+            np.add(y_, x_, out=y_)
+
+        return self
+
+    def mul_(self, x):
+        """
+        In-place element-wise update `self = self * x`, one processor slice at
+        a time. `x` may be lazily loaded, in which case it is read from disk
+        one slice at a time.
+
+        :type x: Model or np.array
+        :param x: Model or vector with the same layout as this Model
+        :rtype: Model
+        :return: this Model, updated in place
+        """
+        self._writable()
+        for y_, x_ in zip(self._slices(), self._slices(x)):
+            np.multiply(y_, x_, out=y_)
+
+        return self
+
+    def dot(self, x):
+        """
+        Dot product of this Model with `x`, reduced one processor slice at a
+        time and accumulated in double precision
+
+        :type x: Model or np.array
+        :param x: Model or vector with the same layout as this Model
+        :rtype: float
+        :return: dot product of `self` and `x`
+        """
+        total = 0.
+        for y_, x_ in zip(self._slices(), self._slices(x)):
+            total += np.dot(y_.astype(np.float64, copy=False),
+                            x_.astype(np.float64, copy=False))
+
+        return float(total)
+
+    def norm(self, ord=2):
+        """
+        Vector norm of this Model, reduced one processor slice at a time
+
+        :type ord: int or float
+        :param ord: order of the norm, available are 1, 2 and np.inf
+        :rtype: float
+        :return: norm of the Model vector
+        """
+        if ord == 2:
+            return self.dot(self) ** 0.5
+        elif ord == 1:
+            return float(sum(np.abs(y_).sum(dtype=np.float64)
+                             for y_ in self._slices()))
+        elif ord == np.inf:
+            return float(max(np.abs(y_).max() for y_ in self._slices()))
+        else:
+            raise NotImplementedError(f"norm order {ord} not supported, "
+                                      f"must be 1, 2 or np.inf")
+
+    def apply(self, func, *args, path=None):
+        """
+        Element-wise operation `func(self, *args)` evaluated one processor
+        slice at a time. Inputs may be lazily loaded, in which case only one
+        slice of each input is read from disk at any one time.
+
+        If `path` is given, each output slice is written straight to a Fortran
+        binary file in `path` (or into a flat vector if `path` is an .npy
+        file, see save_flat()) and a lazily loaded Model of the result is
+        returned, so that neither inputs nor output need to fit in memory.
+        Otherwise the result is written into this Model in place.
+
+        .. rubric::
+            >>> m_try = m.apply(lambda m_, p_: m_ + alpha * p_, p, path=path)
+
+        :type func: function
+        :param func: element-wise function which takes a slice of this Model
+            followed by the corresponding slice of each of `args` and returns
+            an array of the same length
+        :type args: Model or np.array
+        :param args: Models or vectors with the same layout as this Model
+        :type path: str
+        :param path: optional directory, or .npy file, to write the output
+            model to. If not given, this Model is updated in place
+        :rtype: Model
+        :return: the output Model
+        """
+        if path is None:
+            self._writable()
+            inputs = [self._slices(x) for x in args]
+            for y_, *x_ in zip(self._slices(), *inputs):
+                y_[:] = func(y_, *x_)
+            return self
+
+        if path.endswith(".npy"):
+            slices = zip(self._slices(), *[self._slices(x) for x in args])
+            self._write_flat_slices(f"{path}.tmp",
+                                    (func(*_) for _ in slices))
+            os.replace(f"{path}.tmp", path)
+            self._save_flat_metadata(path)
+            return Model(path=path, flavor=self.flavor, lazy=True)
+
+        # Memory-mapped inputs cannot be overwritten while they are being read
+        for m_ in [self, *args]:
+            if isinstance(m_, Model) and m_.path and m_._buffer is None:
+                assert (os.path.abspath(m_.path) != os.path.abspath(path)), \
+                    f"cannot stream output to lazily loaded input {path}"
+
+        unix.mkdir(path)
+        model = Dict()
+        slices = zip(self._slices(), *[self._slices(x) for x in args])
+        for key in self.parameters:
+            model[key] = []
+            for iproc in range(self.nproc):
+                filename = os.path.join(path, self.fnfmt(i=iproc, val=key,
+                                                         ext=".bin"))
+                write_fortran_binary(arr=func(*next(slices)),
+                                     filename=filename)
+                model[key].append(memmap_fortran_binary(filename))
+
+        model_out = self._copy_metadata()
+        model_out.path = path
+        model_out.fmt = ".bin"
+        model_out.lazy = True
+        model_out._set_lazy_model(model)
+
+        return model_out
 
     def plot2d(self, parameter, cmap=None, show=True, title="", save=None):
         """
@@ -602,6 +1300,105 @@ class Model:
         if show:
             plt.show()
 
+    def _glob(self, pattern):
+        """
+        Match files in `path` against a wildcard pattern. Uses the cached
+        directory listing if available, so that repeated matching does not
+        touch the filesystem
+
+        :type pattern: str
+        :param pattern: wildcard pattern to match file names against, e.g.,
+            'proc*_vp.bin'
+        :rtype: list of str
+        :return: sorted full paths of the matching files
+        """
+        if self._index is None:
+            return sorted(glob(os.path.join(self.path, pattern)))
+
+        return [os.path.join(self.path, fid)
+                for fid in sorted(fnfilter(self._index["files"], pattern))]
+
+    def _index_directory(self):
+        """
+        List the files in `path` along with their sizes and modification
+        times. The listing is cached in a hidden sidecar file (`index_file`)
+        which is reused by later Models reading the same directory as long as
+        it is still valid (see _read_index())
+
+        :rtype: Dict
+        :return: index with the key 'files' mapping file names to
+            [size in bytes, modification time in ns]
+        """
+        index = self._read_index()
+        if index is not None:
+            logger.debug(f"using cached model index for {self.path}")
+            return index
+
+        files = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+
+        return Dict(files=files)
+
+    def _read_index(self):
+        """
+        Read the cached index of `path`. The index is only valid if the same
+        files are in the directory (i.e., no files were added, removed or
+        renamed), and the first and last indexed files are unchanged, which
+        catches a model being overwritten in place.
+
+        .. note::
+            If the directory modification time is unchanged, the directory
+            is not listed. Otherwise only the names of files are compared, so
+            that hidden files (e.g., this index or the binary sidecars of
+            ASCII models) written after the index do not invalidate it
+
+        :rtype: Dict or None
+        :return: cached index, or None if it does not exist or is out of date
+        """
+        try:
+            with open(os.path.join(self.path, self.index_file), "r") as f:
+                index = Dict(json.load(f))
+            if os.stat(self.path).st_mtime_ns != index["dir_mtime"]:
+                with os.scandir(self.path) as entries:
+                    names = {entry.name for entry in entries
+                             if not entry.name.startswith(".") and
+                             entry.is_file()}
+                if names != set(index["files"]):
+                    return None
+            fids = sorted(index["files"])
+            for fid in fids[:1] + fids[-1:]:
+                stat = os.stat(os.path.join(self.path, fid))
+                if [stat.st_size, stat.st_mtime_ns] != index["files"][fid]:
+                    return None
+        except (OSError, ValueError, KeyError):
+            return None
+
+        return index
+
+    def _write_index(self):
+        """
+        Add model metadata (format, number of processors and parameters) to
+        the directory index and write it to `path`. Failing to write the index
+        (e.g., read-only directory) is not an error
+        """
+        self._index["fmt"] = self.fmt
+        self._index["nproc"] = self._nproc
+        self._index["parameters"] = sorted(self.available_parameters)
+
+        try:
+            # Creating the index changes the directory modification time,
+            # so the time is only recorded once the file exists
+            with open(os.path.join(self.path, self.index_file), "w") as f:
+                self._index["dir_mtime"] = os.stat(self.path).st_mtime_ns
+                json.dump(self._index, f)
+        except OSError as e:
+            logger.debug(f"could not write model index to {self.path}: {e}")
+
     def _get_nproc_parameters(self):
         """
         Get the number of processors and the available parameters from a list of
@@ -610,7 +1407,7 @@ class Model:
         :rtype: tuple (int, list)
         :return: (number of processors, list of available parameters in dir)
         """
-        fids = glob(os.path.join(self.path, self.fnfmt(val="*", ext=self.fmt)))
+        fids = self._glob(self.fnfmt(val="*", ext=self.fmt))
         fids = [os.path.basename(_) for _ in fids]  # drop full path
         fids = [os.path.splitext(_)[0] for _ in fids]  # drop extension
 
@@ -623,9 +1420,7 @@ class Model:
 
             # Count the number of files for matching parameters only (do once)
             # Globe version requires the region number in the wild card
-            nproc = len(glob(os.path.join(
-                self.path, self.fnfmt(val=avail_par[0], ext=self.fmt)))
-            )
+            nproc = len(self._glob(self.fnfmt(val=avail_par[0], ext=self.fmt)))
         elif self.fmt == ".dat":
             # e.g., 'proc000000_rho_vp_vs'
             _, *avail_par = fids[0].split("_")
@@ -633,7 +1428,7 @@ class Model:
             avail_par = list(set(avail_par).intersection(
                                         set(self.acceptable_parameters)
                                         ))
-            nproc = len(fids) + 1
+            nproc = len(fids)
         else:
             raise NotImplementedError(f"{self.fmt} is not yet supported by "
                                       f"SeisFlows")
@@ -652,7 +1447,7 @@ class Model:
         """
         acceptable_formats = {".bin", ".dat"}
 
-        files = glob(os.path.join(self.path, "*"))
+        files = self._glob("*")
         suffixes = set([os.path.splitext(_)[1] for _ in files])
         fmt = acceptable_formats.intersection(suffixes)
         assert (len(fmt) == 1), (
@@ -670,7 +1465,7 @@ class Model:
         :rtype: str
         :return: SPECFEM flavor, one of ['2D', '3D', '3DGLOBE']
         """
-        fullpaths = glob(os.path.join(self.path, f"*{self.fmt}"))
+        fullpaths = self._glob(f"*{self.fmt}")
         assert fullpaths, f"cannot find files for flavor guessing"
 
         # Not the most accurate way of doing this, but serves a purpose
@@ -695,13 +1490,15 @@ class Model:
 
         :type parameter: str
         :param parameter: chosen parameter to load model for
-        :rtype: np.array
-        :return: vector of model values for given `parameter`
+        :rtype: np.array or list of np.memmap
+        :return: vector of model values for given `parameter`, or list of
+            read-only memory maps (one per processor) if `lazy`
         """
         array = []
-        fids = glob(os.path.join(
-            self.path, self.fnfmt(val=parameter, ext=".bin"))
-        )
+        fids = self._glob(self.fnfmt(val=parameter, ext=".bin"))
+        if self.lazy:
+            return [memmap_fortran_binary(fid) for fid in sorted(fids)]
+
         for fid in sorted(fids):  # make sure were going in numerical order
             array.append(read_fortran_binary(fid))
 
@@ -712,6 +1509,32 @@ class Model:
 
         return array
 
+    def _read_model_fortran_binaries(self, parameters):
+        """
+        Load Fortran binary models for multiple parameters. Each processor
+        file is read independently so that reads can be distributed across
+        threads (see `max_workers`)
+
+        :type parameters: list of str
+        :param parameters: chosen parameters to load model for
+        :rtype: Dict of list of np.array
+        :return: dictionary of model values for each of the `parameters`
+        """
+        fids = []
+        for parameter in parameters:
+            fids.append(self._glob(self.fnfmt(val=parameter, ext=".bin")))
+        arrays = self._map(read_fortran_binary,
+                           [fid for fids_ in fids for fid in fids_])
+
+        # Re-assemble the flattened list of arrays by parameter
+        parameter_dict = Dict()
+        i = 0
+        for parameter, fids_ in zip(parameters, fids):
+            parameter_dict[parameter] = arrays[i:i + len(fids_)]
+            i += len(fids_)
+
+        return parameter_dict
+
     def _read_model_adios(self, parameter):
         """
         Load ADIOS models into disk
@@ -724,33 +1547,40 @@ class Model:
         raise NotImplementedError("ADIOS file formats are not currently "
                                   "implemented into SeisFlows")
 
-    def _read_model_ascii(self, parameter):
+    def _read_model_ascii(self, parameters):
         """
-        Load ASCII SPECFEM2D models into disk. ASCII models are generally saved
-        all in a single file with all parameters together as a N column ASCII 
-        file where columns 1 and 2 are the coordinates of the mesh, and the 
+        Load ASCII SPECFEM2D models into memory. ASCII models are generally saved
+        all in a single file with all parameters together as a N column ASCII
+        file where columns 1 and 2 are the coordinates of the mesh, and the
         remainder columns are data corresponding to the filenames
         e.g., proc000000_rho_vp_vs.dat, rho is column 3, vp is 4 etc.
+        Each file is read once for all `parameters`
 
-        :type parameter: str
-        :param parameter: chosen parameter to load model for
-        :rtype: np.array
-        :return: vector of model values for given `parameter`
+        :type parameters: list of str
+        :param parameters: chosen parameters to load model for
+        :rtype: Dict of list of np.array
+        :return: dictionary of model values for each of the `parameters`
         """
-        fids = glob(os.path.join(self.path, self.fnfmt(val="*", ext=".dat")))
-        _, *available_parameters = fids[0].split("_")
-        assert (parameter in available_parameters), (
-            f"{parameter} not available for ASCII model"
-        )
-        # +2 because first 2 columns are the X and Z coordinates in the mesh
-        array = []
-        column_idx = available_parameters.index(parameter) + 2
-        for fid in sorted(fids):
-            array.append(np.loadtxt(fid).T[:, column_idx])
+        fids = self._glob(self.fnfmt(val="*", ext=".dat"))
+        # e.g., 'proc000000_rho_vp_vs.dat' -> ['rho', 'vp', 'vs']
+        _, *available_parameters = \
+            os.path.splitext(os.path.basename(fids[0]))[0].split("_")
+        for parameter in parameters:
+            assert (parameter in available_parameters), (
+                f"{parameter} not available for ASCII model"
+            )
 
-        return np.array(array)
+        parameter_dict = Dict({key: [] for key in parameters})
+        for data in self._map(read_ascii_model, fids):
+            for parameter in parameters:
+                # +2 because first 2 columns are the X and Z coordinates
+                column_idx = available_parameters.index(parameter) + 2
+                parameter_dict[parameter].append(data[column_idx])
 
-    def _write_model_fortran_binary(self, path):
+        return parameter_dict
+
+    def _write_model_fortran_binary(self, path, max_workers=None,
+                                    incremental=False):
         """
         Save a SPECFEM model back to Fortran binary format.
         Data are written as single precision floating point numbers
@@ -760,10 +1590,97 @@ class Model:
             This function mimics that behavior by tacking on the boundary data
             as 'int32' at the top and bottom of the data array.
             https://docs.oracle.com/cd/E19957-01/805-4939/6j4m0vnc4/index.html
+
+        :type path: str
+        :param path: directory to write model files to
+        :type max_workers: int
+        :param max_workers: number of threads used to write processor files,
+            defaults to `self.max_workers`
+        :type incremental: bool
+        :param incremental: skip files whose contents are unchanged, see
+            write()
+        :rtype: int
+        :return: number of bytes that did not need to be written
         """
+        arrays, filepaths = [], []
         for parameter in self.parameters:
             for i, data in enumerate(self.model[parameter]):
                 filename = self.fnfmt(i=i, val=parameter, ext=".bin")
-                filepath = os.path.join(path, filename)
-                write_fortran_binary(arr=data, filename=filepath)
+                arrays.append(data)
+                filepaths.append(os.path.join(path, filename))
+
+        if not incremental:
+            self._map(write_fortran_binary, arrays, filepaths,
+                      max_workers=max_workers)
+            # Hashes of an earlier incremental write no longer describe the
+            # files on disk
+            if os.path.exists(os.path.join(path, self.hash_file)):
+                os.remove(os.path.join(path, self.hash_file))
+            return 0
+
+        hashes = self._read_hashes(path)
+
+        def write_changed(arr, filepath):
+            """Write a file only if its contents differ from the hashed file"""
+            fid = os.path.basename(filepath)
+            arr = np.ascontiguousarray(arr, dtype="float32")
+            digest = hashlib.blake2b(arr.data, digest_size=16).hexdigest()
+            try:
+                stat = os.stat(filepath)
+                if hashes.get(fid) == [digest, stat.st_size,
+                                       stat.st_mtime_ns]:
+                    return hashes[fid], stat.st_size
+            except OSError:
+                pass
+            write_fortran_binary(arr, filepath)
+            stat = os.stat(filepath)
+            return [digest, stat.st_size, stat.st_mtime_ns], 0
+
+        results = self._map(write_changed, arrays, filepaths,
+                            max_workers=max_workers)
+        for filepath, (entry, _) in zip(filepaths, results):
+            hashes[os.path.basename(filepath)] = entry
+        self._write_hashes(path, hashes)
+
+        nskip = sum(1 for _, skipped in results if skipped)
+        nbytes = sum(skipped for _, skipped in results)
+        logger.debug(f"incremental write to {path} skipped {nskip}/"
+                     f"{len(results)} unchanged files ({nbytes} bytes)")
+
+        return nbytes
+
+    def _read_hashes(self, path):
+        """
+        Read the content hashes of processor files previously written to
+        `path` with an incremental write()
+
+        :type path: str
+        :param path: directory containing the hash file
+        :rtype: dict
+        :return: file names mapped to [hash, size in bytes,
+            modification time in ns], empty if no valid hash file exists
+        """
+        try:
+            with open(os.path.join(path, self.hash_file), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_hashes(self, path, hashes):
+        """
+        Write the content hashes of processor files to `path`. Failing to
+        write the hash file only means that the next incremental write
+        rewrites every file
+
+        :type path: str
+        :param path: directory to write the hash file to
+        :type hashes: dict
+        :param hashes: file names mapped to [hash, size in bytes,
+            modification time in ns]
+        """
+        try:
+            with open(os.path.join(path, self.hash_file), "w") as f:
+                json.dump(hashes, f)
+        except OSError as e:
+            logger.debug(f"could not write model hashes to {path}: {e}")
 
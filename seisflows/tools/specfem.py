@@ -116,6 +116,19 @@ def getpar(key, file, delim="=", match_partial=False):
     return key_out, val, i
 
 
+def fortran_float(val):
+    """
+    Convert a Fortran-formatted real number, which may use a 'd' or 'D'
+    exponent, e.g., 1.d10 or 38.0D-2, into a Python float
+
+    :type val: str
+    :param val: Fortran-formatted number, e.g., as returned by `getpar`
+    :rtype: float
+    :return: value of the number
+    """
+    return float(str(val).strip().lower().replace("d", "e"))
+
+
 def setpar(key, val, file, delim="=", match_partial=False):
     """
     Overwrites parameter value to a SPECFEM Par_file.
@@ -145,7 +158,10 @@ def setpar(key, val, file, delim="=", match_partial=False):
     # matching values inside the key)
     if val_out != "":
         key, val_and_comment = lines[i].split(delim)
-        val_and_comment = val_and_comment.replace(val_out, str(val), 1)
+        # Replace the value as written in the file, which may differ from the
+        # value returned by getpar, e.g., for Fortran exponents 1.d10
+        val_raw = val_and_comment.split("#")[0].strip()
+        val_and_comment = val_and_comment.replace(val_raw, str(val), 1)
         lines[i] = delim.join([key, val_and_comment])
     else:
         # Special case where the initial parameter is empty so we just replace
@@ -291,6 +307,76 @@ def read_fortran_binary(filename):
             return data
 
 
+def read_ascii_model(filename, cache=True):
+    """
+    Reads a SPECFEM2D ASCII model file, in which columns 1 and 2 are the X and
+    Z coordinates of the mesh and the remaining columns are model parameters,
+    e.g., proc000000_rho_vp_vs.dat. The file is parsed once and split into
+    all of its columns.
+
+    .. note::
+        Parsing text is slow, so parsed data are cached as a hidden binary
+        sidecar file (e.g., .proc000000_rho_vp_vs.dat.npy) which is read
+        instead for as long as it is newer than the ASCII file
+
+    :type filename: str
+    :param filename: full path to the ASCII model file to read
+    :type cache: bool
+    :param cache: read from and write to the binary sidecar file
+    :rtype: np.array
+    :return: array of shape (number of columns, number of GLL points), so
+        that each column is contiguous in memory
+    """
+    path, fid = os.path.split(filename)
+    cache_file = os.path.join(path, f".{fid}.npy")
+    if cache:
+        try:
+            if os.stat(cache_file).st_mtime_ns >= \
+                    os.stat(filename).st_mtime_ns:
+                return np.load(cache_file)
+        except (OSError, ValueError):
+            pass
+
+    with open(filename, "r") as f:
+        ncol = len(f.readline().split())
+    data = np.fromfile(filename, sep=" ")
+    data = np.ascontiguousarray(data.reshape(-1, ncol).T)
+
+    if cache:
+        try:
+            np.save(cache_file, data)
+        except OSError as e:
+            logger.debug(f"could not cache ASCII model {filename}: {e}")
+
+    return data
+
+
+def memmap_fortran_binary(filename):
+    """
+    Memory-maps Fortran-style unformatted binary data as a read-only numpy
+    array. Counterpart to `read_fortran_binary` which does not read data into
+    memory; the INTEGER*4 record header and footer are skipped so that the
+    returned array only covers the data payload, which is paged in from disk
+    when it is accessed.
+
+    :type filename: str
+    :param filename: full path to the Fortran unformatted binary file to map
+    :rtype: np.memmap
+    :return: read-only memory map of the data, interpreted as type Float32
+    """
+    nbytes = os.path.getsize(filename)
+    with open(filename, "rb") as file:
+        n = np.fromfile(file, dtype="int32", count=1)[0]
+
+    if n == nbytes - 8:
+        offset, count = 4, n // 4
+    else:
+        offset, count = 0, nbytes // 4
+
+    return np.memmap(filename, dtype="float32", mode="r", offset=offset,
+                     shape=(count,))
+
+
 def write_fortran_binary(arr, filename):
     """
     Writes Fortran style binary files. Data are written as single precision
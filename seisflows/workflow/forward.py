@@ -317,14 +317,18 @@ class Forward:
             logger.info("checking initial model parameters")
             _model = Model(os.path.join(self.path.model_init),
                            parameters=self.solver._parameters, 
-                           regions=self.solver._regions  # 3DGLOBE only
+                           regions=self.solver._regions,  # 3DGLOBE only
+                           lazy=True,
+                           max_workers=self.solver.model_io_workers
                            )
             _model.check()
         if self.path.model_true:
             logger.info("checking true/target model parameters")
             _model = Model(os.path.join(self.path.model_true),
                            parameters=self.solver._parameters, 
-                           regions=self.solver._regions  # 3DGLOBE only
+                           regions=self.solver._regions,  # 3DGLOBE only
+                           lazy=True,
+                           max_workers=self.solver.model_io_workers
                            )
             _model.check()
 
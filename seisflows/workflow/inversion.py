@@ -26,6 +26,7 @@ from glob import glob
 from seisflows import logger
 from seisflows.workflow.migration import Migration
 from seisflows.tools import msg, unix
+from seisflows.tools.config import get_task_id, set_task_id
 from seisflows.tools.model import Model
 
 
@@ -54,6 +55,29 @@ class Inversion(Migration):
     :type export_model: bool
     :param export_model: export best-fitting model from the line search to disk.
         If False, new models can be discarded from scratch at any time.
+    :type batch_size: int
+    :param batch_size: run a mini-batch (stochastic) inversion, where each
+        iteration, including its line search, only simulates a random subset
+        of `batch_size` sources. Misfits and gradients are scaled by
+        ntask / batch_size to estimate those of all sources. If None, all
+        sources are used every iteration
+    :type batch_seed: int
+    :param batch_seed: seed for drawing mini-batches of sources. Together
+        with the iteration number this defines each batch, so that batches
+        are reproducible, e.g., when resuming a workflow
+    :type nsupershot: int
+    :param nsupershot: run a source-encoded inversion, where each iteration
+        randomly encodes all sources into `nsupershot` supershots that each
+        simulate a group of sources at once, and compares them to encoded
+        observed data. Requires solver 'specfem2d'. If None, each source is
+        simulated separately
+    :type encoding_max_shift: float
+    :param encoding_max_shift: maximum random time shift, in seconds, applied
+        to each source when encoding supershots. If 0, sources are only
+        encoded by random polarity
+    :type encoding_seed: int
+    :param encoding_seed: seed for the random source encoding. Together with
+        the iteration number this defines each encoding
 
     Paths
     -----
@@ -66,7 +90,8 @@ class Inversion(Migration):
 
     def __init__(self, modules=None, start=1, end=1,
                  thrifty=False, optimize="LBFGS", export_model=True,
-                 path_eval_func=None,
+                 batch_size=None, batch_seed=0, nsupershot=None,
+                 encoding_max_shift=0., encoding_seed=0, path_eval_func=None,
                  **kwargs):
         """
         Instantiate Inversion-specific parameters. Non-essential parameters are
@@ -85,6 +110,11 @@ class Inversion(Migration):
         self.end = end
         self.export_model = export_model
         self.thrifty = thrifty
+        self.batch_size = batch_size
+        self.batch_seed = batch_seed
+        self.nsupershot = nsupershot
+        self.encoding_max_shift = encoding_max_shift
+        self.encoding_seed = encoding_seed
 
         # Append an additional path for line search function evaluations
         self.path["eval_func"] = path_eval_func or \
@@ -159,6 +189,52 @@ class Inversion(Migration):
                 f"a `thrifty` inversion requires the optimization module to be "
                 f"set as 'LBFGS'"
             )
+            # Speculative forward simulations are spread over multiple solver
+            # directories, so the accepted model's wavefield is not re-usable
+            assert(self._modules.optimize.speculative_steps == 1), (
+                f"a `thrifty` inversion cannot be run with a speculative line "
+                f"search (optimize.speculative_steps > 1)"
+            )
+            # Each iteration of a mini-batch inversion uses different sources
+            assert(not self.batch_size), (
+                f"a `thrifty` inversion cannot be run as a mini-batch "
+                f"inversion (`batch_size`)"
+            )
+            assert(not self.nsupershot), (
+                f"a `thrifty` inversion cannot be run as a source-encoded "
+                f"inversion (`nsupershot`)"
+            )
+
+        # Copies of the solver directories used by speculative candidates are
+        # not updated with the per-iteration encoded sources of supershots
+        if self._modules.optimize.speculative_steps > 1:
+            assert(not self.nsupershot), (
+                f"a speculative line search (optimize.speculative_steps > 1) "
+                f"cannot be run as a source-encoded inversion (`nsupershot`)"
+            )
+
+        if self.batch_size:
+            assert(1 <= self.batch_size <= self._modules.solver.ntask), (
+                f"`batch_size` must be between 1 and the number of sources "
+                f"`ntask`={self._modules.solver.ntask}"
+            )
+
+        if self.nsupershot:
+            assert(not self.batch_size), (
+                f"source encoding (`nsupershot`) and mini-batches "
+                f"(`batch_size`) cannot be used together"
+            )
+            assert(1 <= self.nsupershot <= self._modules.solver.ntask), (
+                f"`nsupershot` must be between 1 and the number of sources "
+                f"`ntask`={self._modules.solver.ntask}"
+            )
+            assert(hasattr(self._modules.solver, "set_source_encoding")), (
+                f"source encoding (`nsupershot`) requires solver 'specfem2d'"
+            )
+            assert(hasattr(self._modules.preprocess,
+                           "encode_observed_data")), (
+                f"source encoding (`nsupershot`) requires preprocess 'default'"
+            )
 
     def setup(self):
         """
@@ -177,10 +253,22 @@ class Inversion(Migration):
         # If optimization has been run before, re-load from checkpoint
         self.optimize.load_checkpoint()
 
+        # Gradients of consecutive mini-batches (or encodings) are computed
+        # from different data, so L-BFGS history pairs may lack curvature
+        if (self.batch_size or self.nsupershot) and \
+                hasattr(self.optimize, "LBFGS_curvature_check"):
+            logger.info("stochastic inversion, enabling L-BFGS curvature "
+                        "check")
+            self.optimize.LBFGS_curvature_check = True
+
     def run(self):
         """Call the forward.run() function iteratively, from `start` to `end`"""
         while self.iteration < self.end + 1:
             logger.info(msg.mnr(f"RUNNING ITERATION {self.iteration:0>2}"))
+            if self.batch_size:
+                self._set_source_batch()
+            elif self.nsupershot:
+                self._set_source_encoding()
             super().run()  # Runs task list
             # Assuming that if `stop_after` is used, that we are NOT iterating
             if self.stop_after is None:
@@ -193,6 +281,11 @@ class Inversion(Migration):
             else:
                 break
 
+        # Tasks run after the inversion consider all sources again
+        if self.batch_size:
+            self.solver.set_source_batch(None)
+            self.system.ntask = len(self.solver.source_names)
+
     def checkpoint(self):
         """
         Add an additional line in the state file to keep track of iteration,
@@ -234,8 +327,11 @@ class Inversion(Migration):
         else:
             export_residuals = False
 
+        # Synthetics are read from the current working directory, which for
+        # speculative line search candidates is not that of the source
         self.preprocess.quantify_misfit(
             source_name=self.solver.source_name,
+            syn_path=os.path.join(self.solver.cwd, "traces", "syn"),
             save_adjsrcs=os.path.join(self.solver.cwd, "traces", "adj"),
             save_residuals=save_residuals,
             export_residuals=export_residuals,
@@ -243,6 +339,71 @@ class Inversion(Migration):
             step_count=self.optimize.step_count,
         )
 
+    def _set_source_batch(self):
+        """
+        Draw the mini-batch of sources for the current iteration and restrict
+        the solver and system to it. Batches are drawn without replacement
+        from all sources, by a random number generator seeded with
+        `batch_seed` and the iteration number.
+        """
+        self.solver.set_source_batch(None)
+        source_names = self.solver.source_names
+
+        rng = np.random.default_rng([self.batch_seed, self.iteration])
+        idx = np.sort(rng.choice(len(source_names), size=self.batch_size,
+                                 replace=False))
+        batch = [source_names[i] for i in idx]
+
+        logger.info(f"mini-batch of {len(batch)}/{len(source_names)} sources "
+                    f"for iteration {self.iteration}: {', '.join(batch)}")
+        self.solver.set_source_batch(batch)
+        self.system.ntask = len(batch)
+
+    def _set_source_encoding(self):
+        """
+        Encode all sources into supershots for the current iteration and
+        build the corresponding encoded observed data. Observed data of each
+        individual source are prepared first if they do not exist yet, which
+        for synthetic data requires one forward simulation per source, once.
+        """
+        self.solver.set_source_encoding(None)
+        self.system.ntask = len(self.solver.source_names)
+
+        missing = [
+            name for name in self.solver.source_names if not glob(
+                os.path.join(self.solver.path.scratch, name, "traces", "obs",
+                             "*"))
+        ]
+        if missing:
+            logger.info(f"preparing data for {len(missing)} sources to be "
+                        f"encoded")
+            self.system.run([self.prepare_missing_data_for_solver])
+
+        self.solver.set_source_encoding(
+            nsupershot=self.nsupershot, max_shift=self.encoding_max_shift,
+            seed=[self.encoding_seed, self.iteration]
+        )
+        self.system.ntask = len(self.solver.source_names)
+        self.system.run([self.encode_data_for_solver])
+
+    def _sum_residuals(self, residuals):
+        """
+        Sum residuals into a total misfit with the preprocessing module. For
+        mini-batch inversions the misfit is scaled by ntask / batch_size, an
+        estimate of the misfit of all sources that is comparable between
+        batches of different sizes
+
+        :type residuals: np.array
+        :param residuals: residuals read by `_read_residuals`
+        :rtype: float
+        :return: total misfit
+        """
+        total_misfit = self.preprocess.sum_residuals(residuals)
+        if self.batch_size:
+            total_misfit *= self.solver.ntask / self.batch_size
+
+        return total_misfit
+
     def _read_residuals(self, residuals_files):
         """
         Convenience function to read in text files containing misfit information
@@ -274,7 +435,8 @@ class Inversion(Migration):
             # Expose the initial model to the optimization library
             model = Model(self.path.model_init,
                           parameters=self.solver._parameters,
-                          regions=self.solver._regions  # 3DGLOBE only
+                          regions=self.solver._regions,  # 3DGLOBE only
+                          max_workers=self.solver.model_io_workers
                           )
             self.optimize.save_vector(name="m_new", m=model)
         else:
@@ -290,14 +452,21 @@ class Inversion(Migration):
                 # solvers
                 path_model = os.path.join(self.path.eval_grad, "model")
                 m_new = self.optimize.load_vector("m_new")
-                m_new.write(path=path_model)
+                m_new.write(path=path_model,
+                            max_workers=self.solver.model_io_workers)
+
+                # Sources in a new mini-batch may not have data prepared yet
+                if self.batch_size:
+                    run_list = [self.prepare_missing_data_for_solver]
+                else:
+                    run_list = []
 
                 # Run forward simulation with previous model. Hard set line search
                 # step count in residual file names to 0 since it is assumed we are 
                 # running the initial misfit evaluation (i??s00)
                 self.system.run(
-                    [self.run_forward_simulations,
-                     self.evaluate_objective_function],
+                    run_list + [self.run_forward_simulations,
+                                self.evaluate_objective_function],
                     path_model=path_model,
                     save_residuals=os.path.join(
                         self.path.eval_grad,
@@ -316,9 +485,52 @@ class Inversion(Migration):
                                f"residuals_*_{self.iteration}_0.txt"))
         residuals = self._read_residuals(residuals_files)
 
-        total_misfit = self.preprocess.sum_residuals(residuals)
+        total_misfit = self._sum_residuals(residuals)
         self.optimize.save_vector(name="f_new", m=total_misfit)
 
+    def prepare_data_for_solver(self, **kwargs):
+        """
+        Overwrite `workflow.forward` to skip data preparation for supershots
+        of a source-encoded inversion, whose observed data are instead
+        encoded by `encode_data_for_solver`
+        """
+        if self.nsupershot and self.solver.source_encoding:
+            logger.info(f"observed data of {self.solver.source_name} are "
+                        f"encoded, skipping data preparation")
+            return
+        super().prepare_data_for_solver(**kwargs)
+
+    def prepare_missing_data_for_solver(self, **kwargs):
+        """
+        Prepares data only for sources whose solver directory contains no
+        observed data yet, e.g., sources of a mini-batch that have not been
+        part of a previous batch. See `prepare_data_for_solver`
+
+        .. note ::
+            Must be run by system.run() so that solvers are assigned individual
+            task ids and working directories
+        """
+        if glob(os.path.join(self.solver.cwd, "traces", "obs", "*")):
+            logger.debug(f"data already prepared for source "
+                         f"{self.solver.source_name}")
+            return
+        self.prepare_data_for_solver(**kwargs)
+
+    def encode_data_for_solver(self, **kwargs):
+        """
+        Builds encoded observed data for the supershot of the current task
+        with the preprocessing module
+
+        .. note ::
+            Must be run by system.run() so that solvers are assigned individual
+            task ids and working directories
+        """
+        source_name = self.solver.source_name
+        self.preprocess.encode_observed_data(
+            source_name=source_name,
+            encoding=self.solver.source_encoding[source_name]
+        )
+
     def evaluate_gradient_from_kernels(self):
         """
         Overwrite `workflow.migration` to convert the current model and the
@@ -345,8 +557,12 @@ class Inversion(Migration):
 
         # Expose the gradient to the optimization library
         gradient = Model(path=os.path.join(self.path.eval_grad, "gradient"),
-                         regions=self.solver._regions
+                         regions=self.solver._regions,
+                         max_workers=self.solver.model_io_workers
                          )
+        # Mini-batch gradients are scaled the same as their misfit
+        if self.batch_size:
+            gradient.scale_(self.solver.ntask / self.batch_size)
         self.optimize.save_vector(name="g_new", m=gradient)
 
     def initialize_line_search(self):
@@ -378,12 +594,10 @@ class Inversion(Migration):
 
         # Scale search direction with step length alpha generate a model update
         m_try, alpha = self.optimize.initialize_search()
-        self.optimize.save_vector(name="m_try", m=m_try)
-        self.optimize.save_vector(name="alpha", m=alpha)
-        self.optimize.checkpoint()
 
         # Expose model `m_try` to the solver by placing it in eval_func dir.
-        m_try.write(path=os.path.join(self.path.eval_func, "model"))
+        self._expose_trial_models(m_try, alpha)
+        self.optimize.checkpoint()
 
     def perform_line_search(self):
         """
@@ -421,7 +635,9 @@ class Inversion(Migration):
             # Save new model (m_try) and step length (alpha) for records
             self.optimize.save_vector("alpha", alpha)
             self.optimize.save_vector("m_try", m_try)
-            m_try.write(path=os.path.join(self.path.eval_func, "model"))
+            m_try.write(path=os.path.join(self.path.eval_func, "model"),
+                        max_workers=self.solver.model_io_workers,
+                        incremental=True)
             del m_try  # clear potentially large model vector from memory
 
             self.optimize.finalize_search()
@@ -430,10 +646,10 @@ class Inversion(Migration):
         elif status.upper() == "TRY":
             logger.info("trial step unsuccessful. re-attempting line search")
 
-            # Save new model (m_try) and step length (alpha) for new trial step
-            self.optimize.save_vector("alpha", alpha)
-            self.optimize.save_vector("m_try", m_try)
-            m_try.write(path=os.path.join(self.path.eval_func, "model"))
+            # Save new model (m_try) and step length (alpha) for new trial
+            # step. Previous trial models of this line search are still on
+            # disk, so only files that changed are rewritten
+            self._expose_trial_models(m_try, alpha, incremental=True)
             del m_try  # clear potentially large model vector from memory
 
             # Checkpoint and re-run line search evaluation
@@ -458,8 +674,50 @@ class Inversion(Migration):
                 )
                 sys.exit(-1)
 
+    def _expose_trial_models(self, m_try, alpha, incremental=False):
+        """
+        Save the trial model and step length to the optimization library and
+        write the trial model(s) to disk for the solver.
+
+        For a speculative line search, `alpha` is expanded into a set of
+        trial step lengths and one model per step length is written to
+        'model_{candidate:0>2}', to be evaluated by
+        `evaluate_line_search_candidate`.
+
+        :type m_try: seisflows.tools.model.Model
+        :param m_try: trial model for step length `alpha`
+        :type alpha: float
+        :param alpha: trial step length calculated by the line search
+        :type incremental: bool
+        :param incremental: only rewrite model files that changed since the
+            previous trial models were written, see `Model.write`. Only valid
+            within a single line search, whose trial models stay on disk
+        """
+        self.optimize.save_vector("m_try", m_try)
+        max_workers = self.solver.model_io_workers
+
+        if self.optimize.speculative_steps == 1:
+            self.optimize.save_vector("alpha", alpha)
+            m_try.write(path=os.path.join(self.path.eval_func, "model"),
+                        max_workers=max_workers, incremental=incremental)
+            return
+
+        alphas = self.optimize.propose_step_lengths(alpha)
+        self.optimize.save_vector("alpha", alphas)
+        m_try.write(path=os.path.join(self.path.eval_func, "model_00"),
+                    max_workers=max_workers, incremental=incremental)
+        for candidate, alpha_ in enumerate(alphas[1:], start=1):
+            m_try = self.optimize.compute_trial_model(alpha_)
+            m_try.write(path=os.path.join(self.path.eval_func,
+                                          f"model_{candidate:0>2}"),
+                        max_workers=max_workers, incremental=incremental)
+
     def _evaluate_line_search_misfit(self):
         """Convenience fuinction to wrap forward solver and misfit calc"""
+        if self.optimize.speculative_steps > 1:
+            self._evaluate_speculative_line_search_misfit()
+            return
+
         # Define where we are in the inversion for file passing between
         # preprocess and workflow modules
         iteration = self.iteration
@@ -483,12 +741,111 @@ class Inversion(Migration):
                 )
         residuals = self._read_residuals(residuals_files)
 
-        total_misfit = self.preprocess.sum_residuals(residuals)
+        total_misfit = self._sum_residuals(residuals)
         logger.debug(f"misfit for trial model "
                      f"(f_try; i{iteration:0>2}s{step_count:0>2}) == "
                      f"{total_misfit:.2E}")
         self.optimize.save_vector(name="f_try", m=total_misfit)
 
+    def _evaluate_speculative_line_search_misfit(self):
+        """
+        Speculative counterpart to `_evaluate_line_search_misfit`. Runs the
+        forward simulations and misfit quantification for all trial step
+        lengths (candidates) in a single call to `system.run`, i.e., with
+        ntask * ncandidates tasks, and saves one misfit per candidate.
+
+        Candidate `k` takes line search step count `step_count + k` in the
+        names of its residuals files.
+        """
+        iteration = self.iteration
+        step_count = self.optimize.step_count
+        ncandidates = len(np.atleast_1d(self.optimize.load_vector("alpha")))
+
+        logger.info(f"evaluating {ncandidates} speculative trial models "
+                    f"with {ncandidates * self.system.ntask} tasks")
+
+        ntask = self.system.ntask
+        self.system.ntask = ntask * ncandidates
+        try:
+            self.system.run([self.evaluate_line_search_candidate])
+        finally:
+            self.system.ntask = ntask
+
+        f_try = []
+        for candidate in range(ncandidates):
+            step = step_count + candidate
+            residuals_files = glob(os.path.join(
+                self.path.eval_func, f"residuals_*_{iteration}_{step}.txt")
+            )
+            assert(residuals_files), (
+                f"No residuals files found for Iteration {iteration} and "
+                f"step count {step}. Please check preprocessing"
+            )
+            residuals = self._read_residuals(residuals_files)
+
+            total_misfit = self._sum_residuals(residuals)
+            logger.debug(f"misfit for trial model "
+                         f"(f_try; i{iteration:0>2}s{step:0>2}) == "
+                         f"{total_misfit:.2E}")
+            f_try.append(total_misfit)
+
+        self.optimize.save_vector(name="f_try", m=np.array(f_try))
+
+    def evaluate_line_search_candidate(self, **kwargs):
+        """
+        Runs the forward simulation and misfit quantification for one source
+        and one trial step length (candidate) of a speculative line search.
+        Task `i` evaluates candidate `i // ntask` for source `i % ntask`.
+
+        Candidates other than the first are run in their own copy of the
+        source's solver working directory, created on first use and re-used
+        for subsequent line searches, so that simultaneous simulations of the
+        same source do not overwrite one another. Misfit is quantified with
+        the synthetics of the candidate's working directory and the observed
+        data of the source's own working directory, which are kept up to
+        date by the workflow.
+
+        .. note::
+            Must be run by system.run() with `ntask` scaled by the number of
+            candidates, see `_evaluate_speculative_line_search_misfit`
+        """
+        task_id = get_task_id()
+        candidate, source_id = divmod(task_id,
+                                      len(self.solver.source_names))
+        step_count = self.optimize.step_count
+        path_scratch = self.solver.path.scratch
+
+        # Solver determines source (and working directory) from the task id
+        set_task_id(source_id)
+        try:
+            if candidate:
+                src = self.solver.cwd
+                self.solver.path.scratch = os.path.join(
+                    path_scratch, "speculative", f"{candidate:0>2}")
+                if not os.path.exists(self.solver.cwd):
+                    logger.debug(f"copying solver directory for speculative "
+                                 f"candidate {candidate:0>2}")
+                    unix.mkdir(self.solver.path.scratch)
+                    unix.cp(src=src, dst=self.solver.cwd)
+
+            # Residuals and exported files are labelled by candidate step count
+            self.optimize._line_search.step_count = step_count + candidate  # NOQA
+            self.run_forward_simulations(
+                path_model=os.path.join(self.path.eval_func,
+                                        f"model_{candidate:0>2}")
+            )
+            self.evaluate_objective_function(
+                save_residuals=os.path.join(
+                    self.path.eval_func,
+                    f"residuals_{{src}}_{self.iteration}_"
+                    f"{step_count + candidate}.txt")
+            )
+        finally:
+            # Restore state for workflows that run tasks in the main process
+            self.solver.path.scratch = path_scratch
+            self.optimize._line_search.step_count = step_count  # NOQA
+            set_task_id(task_id)
+
     def finalize_iteration(self):
         """
         Cleans directories in which function and gradient evaluations were
@@ -502,6 +859,7 @@ class Inversion(Migration):
             model = self.optimize.load_vector("m_new")
             model.write(path=os.path.join(self.path.output,
                                           f"MODEL_{self.iteration:0>2}"),
+                        max_workers=self.solver.model_io_workers
                         )
 
         # Update optimization
@@ -193,7 +193,8 @@ class Migration(Forward):
                 )
             sys.exit(-1)
         # Read from files, only pick up regions defined by solver
-        gradient = Model(path=misfit_kernel_path, regions=self.solver._regions)
+        gradient = Model(path=misfit_kernel_path, regions=self.solver._regions,
+                         max_workers=self.solver.model_io_workers)
 
         # Set model: we only need to access parameters which will be updated
         # Assuming that the model in the solver also generated the kernels
@@ -205,22 +206,26 @@ class Migration(Forward):
 
         # Read in new model files that will have been generated by `setup` 
         # or by optimization library
+        # Model and mask are only multiplied slice-by-slice into the gradient
+        # so they are memory-mapped rather than read into memory
         model = Model(path=dst, parameters=self.solver._parameters,
-                      regions=self.solver._regions)
+                      regions=self.solver._regions, lazy=True,
+                      max_workers=self.solver.model_io_workers)
 
-        # Merge to vector and convert to absolute perturbations:
+        # Convert to absolute perturbations, in place:
         # log dm --> dm (see Eq.13 Tromp et al 2005)
-        gradient.update(vector=gradient.vector * model.vector)
+        gradient.mul_(model)
         gradient.write(path=os.path.join(self.path.eval_grad, "gradient"))
 
         # Apply an optional mask to the gradient
         if self.path.mask:
             logger.info("applying mask function to gradient")
-            mask = Model(path=self.path.mask)
+            mask = Model(path=self.path.mask, lazy=True,
+                         max_workers=self.solver.model_io_workers)
             unix.mv(src=os.path.join(self.path.eval_grad, "gradient"),
                     dst=os.path.join(self.path.eval_grad, "gradient_nomask"))
 
-            gradient.update(vector=gradient.vector * mask.vector)
+            gradient.mul_(mask)
             gradient.write(path=os.path.join(self.path.eval_grad, "gradient"))
 
         # Export gradient to disk